@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import time
+
+import polars as pl
+from dotenv import load_dotenv
+from llama_index.core.agent import ReActAgent
+
+import tools
+from agent import TeamManager
+from helpers.stub_llm import ScriptedLLM, make_per_league_script, make_team_script
+from tools import LEAGUES, tool_cache
+
+PROMPT = "Build a team using players from all leagues."
+
+
+def slow_collect(collect, latency: float):
+    """Wraps `tools._collect` to wait before each query, like the round trips of reading remote tables."""
+
+    def wrapper(query_name: str, query: pl.LazyFrame) -> pl.DataFrame:
+        time.sleep(latency)
+        return collect(query_name, query)
+
+    return wrapper
+
+
+def time_runs(run, runs: int) -> tuple[float, str]:
+    latencies = []
+    for _ in range(runs):
+        # every run queries the tables, instead of reading the results of the previous run from the cache
+        tool_cache.clear("get_player_stats")
+        start = time.perf_counter()
+        answer = str(run())
+        latencies.append(time.perf_counter() - start)
+    return sum(latencies) / runs, answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare make_team and amake_team on a multi-league prompt.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stub LLM call")
+    parser.add_argument("--collect-latency", type=float, default=0.2, help="seconds added to each tool query")
+    parser.add_argument("--num-players", type=int, default=5, help="players shortlisted")
+    parser.add_argument("--concurrency", type=int, default=4, help="amake_team runs sharing one event loop")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    per_league = ScriptedLLM(script=make_per_league_script(LEAGUES, args.num_players), latency=args.latency)
+    all_leagues = ScriptedLLM(script=make_team_script(None, args.num_players, args.seed), latency=args.latency)
+    baseline = TeamManager(llm=per_league, verbose=False)
+    # two tool calls per league exceed the default limit of reasoning steps
+    baseline.agent = ReActAgent.from_tools(baseline.tools, llm=per_league, verbose=False, max_iterations=20)
+    manager = TeamManager(llm=all_leagues, tools=baseline.tools, verbose=False)
+    managers = [TeamManager(llm=all_leagues, tools=baseline.tools, verbose=False) for _ in range(args.concurrency)]
+
+    # the player directory is built once, the queries of the stats tools then pay the collect latency
+    manager.make_team(PROMPT)
+    tools._collect = slow_collect(tools._collect, args.collect_latency)
+
+    async def run_concurrently():
+        return (await asyncio.gather(*(m.amake_team(PROMPT) for m in managers)))[0]
+
+    results = {
+        "make_team per league": time_runs(lambda: baseline.make_team(PROMPT), args.runs),
+        "make_team": time_runs(lambda: manager.make_team(PROMPT), args.runs),
+        "amake_team": time_runs(lambda: asyncio.run(manager.amake_team(PROMPT)), args.runs),
+        f"{args.concurrency} x amake_team": time_runs(lambda: asyncio.run(run_concurrently()), args.runs),
+    }
+    print(pl.DataFrame({"run": list(results), "latency_s": [latency for latency, _ in results.values()]}))
+    # both runs make the same LLM calls and tool calls, only the per-league queries of amake_team overlap
+    print(f"amake_team saves {results['make_team'][0] - results['amake_team'][0]:.2f}s per run over make_team")
+    answers = [answer for _, answer in list(results.values())[1:]]
+    print("same final answer:", all(answer == answers[0] for answer in answers))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
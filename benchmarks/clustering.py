@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import polars as pl
+from deltalake import DeltaTable
+from dotenv import load_dotenv
+from process import CLUSTER_BY, PARTITION_BY, STATS_DIR
+
+from helpers.storage import get_table_location
+from helpers.tables import BufferedTableWriter, get_writer_properties
+
+NUM_PLAYERS = 10
+
+
+def get_files(table_path: str) -> pl.DataFrame:
+    """Lists the data files of the table with their partition, size and player id range from the Delta log."""
+    return pl.DataFrame(DeltaTable(table_path).get_add_actions(flatten=True)).select(
+        pl.col("partition.league_alias").alias("league_alias"),
+        "size_bytes",
+        pl.col("min.player_id").alias("min_player_id"),
+        pl.col("max.player_id").alias("max_player_id"),
+    )
+
+
+def get_files_read(files: pl.DataFrame, league: str, player_ids: List[int]) -> pl.DataFrame:
+    """Returns the files a scan of the players in the league reads, after skipping files by partition and min/max."""
+    holds_player = pl.any_horizontal(
+        (pl.col("min_player_id") <= player_id) & (pl.col("max_player_id") >= player_id) for player_id in player_ids
+    )
+    return files.filter((pl.col("league_alias") == league) & holds_player)
+
+
+def write_layouts(game_stats: pl.DataFrame, work_dir: str, batch_rows: int, target_size: int) -> Dict[str, str]:
+    """Writes the rows in ingestion order, in batches of `batch_rows`, to a table per layout.
+
+    - appended: each batch is appended as is, so every file holds players from the whole id range;
+    - sorted batches: each batch is sorted by player id, so its row groups hold narrower ranges;
+    - z-ordered: the appended table is Z-ordered by player id into files of `target_size` bytes.
+    """
+    layouts = {}
+    for name, cluster_by in [("appended", None), ("sorted batches", CLUSTER_BY)]:
+        layouts[name] = f"{work_dir}/{name.replace(' ', '_')}"
+        with BufferedTableWriter(layouts[name], PARTITION_BY, max_rows=batch_rows, cluster_by=cluster_by) as writer:
+            for batch in game_stats.iter_slices(batch_rows):
+                writer.write(batch)
+
+    layouts["z-ordered"] = f"{work_dir}/z_ordered"
+    for batch in game_stats.iter_slices(batch_rows):
+        batch.write_delta(layouts["z-ordered"], mode="append", delta_write_options={"partition_by": PARTITION_BY})
+    DeltaTable(layouts["z-ordered"]).optimize.z_order(
+        CLUSTER_BY, target_size=target_size, writer_properties=get_writer_properties(CLUSTER_BY)
+    )
+    return layouts
+
+
+def measure(table_path: str, lookups, repeat: int) -> Dict[str, float]:
+    files = get_files(table_path)
+    files_read = [get_files_read(files, league, player_ids) for league, player_ids in lookups]
+    timings = []
+    for _ in range(repeat):
+        for league, player_ids in lookups:
+            start = time.perf_counter()
+            pl.scan_delta(table_path).filter(
+                (pl.col("league_alias") == league) & pl.col("player_id").is_in(player_ids)
+            ).collect()
+            timings.append(time.perf_counter() - start)
+    return {
+        "files": len(files),
+        "files_read": statistics.mean(len(read) for read in files_read),
+        "kb_scanned": statistics.mean(read["size_bytes"].sum() for read in files_read) / 1024,
+        "median_ms": statistics.median(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the files a 10-player lookup reads in each table layout.")
+    parser.add_argument("--batch-rows", type=int, default=10_000, help="rows per ingestion commit")
+    parser.add_argument("--target-size", type=int, default=128 * 1024, help="file size of the z-ordered layout")
+    parser.add_argument("--scale", type=int, default=10, help="copies of the games, as if more seasons were played")
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    table_path, storage_options = get_table_location(STATS_DIR)
+    game_stats = pl.read_delta(table_path, storage_options=storage_options)
+    max_game_id = game_stats["esports_game_id"].max()
+    game_stats = pl.concat(
+        game_stats.with_columns(pl.col("esports_game_id") + copy * max_game_id) for copy in range(args.scale)
+    ).sort("esports_game_id")
+    # the layouts are written to a local temporary directory
+    os.environ.pop("AWS_S3_BUCKET", None)
+
+    rng = random.Random(args.seed)
+    players = game_stats.group_by("league_alias").agg(pl.col("player_id").unique().sort())
+    league_players = dict(zip(players["league_alias"], players["player_id"].to_list()))
+    leagues = sorted(league for league, player_ids in league_players.items() if len(player_ids) >= NUM_PLAYERS)
+    lookups = []
+    for _ in range(args.lookups):
+        league = rng.choice(leagues)
+        lookups.append((league, rng.sample(league_players[league], NUM_PLAYERS)))
+
+    with tempfile.TemporaryDirectory(prefix="clustering-") as work_dir:
+        layouts = write_layouts(game_stats, work_dir, args.batch_rows, args.target_size)
+        results = [{"layout": name, **measure(path, lookups, args.repeat)} for name, path in layouts.items()]
+    print(f"{len(game_stats)} rows, {args.lookups} lookups of {NUM_PLAYERS} players")
+    with pl.Config(tbl_cols=-1):
+        print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+
+import polars as pl
+
+from helpers.events import convert_game_file, get_event_file, stage_game_file
+from helpers.extractors import EXTRACTORS, MetricExtractor, summarize_game_events
+from helpers.parsers import GameMapping, get_game_mappings
+
+
+class FirstBloodExtractor(MetricExtractor):
+    """First kill of each round, an example of a metric that needs the order of the events."""
+
+    events = ["damageEvent"]
+    fields = ["seq_num", "round_num", "causer", "killed"]
+    columns = {"first_bloods": pl.Int64}
+
+    def extract(self, events: pl.DataFrame) -> pl.DataFrame:
+        first_kills = events.filter("killed").sort("seq_num").group_by("round_num").first()
+        return first_kills.select("round_num", pl.col("causer").alias("player"), pl.lit(1).alias("first_bloods"))
+
+
+class DamageEventsExtractor(MetricExtractor):
+    """Number of damage events dealt, an example of a metric computed from the same events as the damage."""
+
+    events = ["damageEvent"]
+    fields = ["round_num", "causer"]
+
+    def __init__(self, column: str):
+        self.columns = {column: pl.Int64}
+
+    def extract(self, events: pl.DataFrame) -> pl.DataFrame:
+        column = next(iter(self.columns))
+        return events.select("round_num", pl.col("causer").alias("player"), pl.lit(1).alias(column))
+
+
+def convert_and_summarize(game_file: str, event_file: str, mapping: GameMapping):
+    """Summarizes a game from its JSON file, converting it to a new event file first."""
+    convert_game_file(game_file, event_file)
+    summarize_game_events(event_file, mapping)
+
+
+def measure(fn, game_files: List[str], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for game_file in game_files:
+            fn(game_file)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(game_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of summarizing games as extractors are added.")
+    parser.add_argument("--league", default="vct-challengers")
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    mappings = get_game_mappings(f"data/raw/{args.league}/esports-data/mapping_data.json")
+    games_folder = f"data/raw/{args.league}/games/{args.year}"
+    games = {}
+    for mapping in mappings:
+        game_file = f"{games_folder}/{mapping.platform_game_id}.json"
+        if len(games) == args.games or not os.path.isfile(game_file):
+            continue
+        event_file = get_event_file(args.league, args.year, mapping.platform_game_id)
+        stage_game_file(game_file, event_file)
+        try:
+            summarize_game_events(event_file, mapping)
+        except (KeyError, ValueError):
+            # bad game data
+            continue
+        games[game_file] = (mapping, event_file)
+    print(f"{len(games)} games, {sum(os.path.getsize(f) for f in games) / len(games) / 1024**2:.1f} MB per game file")
+
+    extra = [FirstBloodExtractor()] + [DamageEventsExtractor(f"damage_events_{i}") for i in range(3)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_ms_per_game = measure(
+            lambda f: convert_and_summarize(f, f"{tmp_dir}/events.parquet", games[f][0]), list(games), args.repeat
+        )
+    results = [{"source": "JSON", "extractors": 1, "metrics": 3, "ms_per_game": json_ms_per_game * 1000}]
+    for count in range(len(extra) + 1):
+        extractors = EXTRACTORS + extra[:count]
+        ms_per_game = measure(
+            lambda f: summarize_game_events(games[f][1], games[f][0], extractors), list(games), args.repeat
+        )
+        metrics = sum(len(extractor.columns) for extractor in extractors)
+        results.append(
+            {"source": "events", "extractors": len(extractors), "metrics": metrics, "ms_per_game": ms_per_game * 1000}
+        )
+    print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    main()
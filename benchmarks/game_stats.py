@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import polars as pl
+
+from helpers.events import convert_game_file
+from helpers.extractors import summarize_game_events
+from helpers.parsers import GameMapping, get_game_events, get_game_mappings, get_game_stats
+
+SUMMARY_COLUMNS = ["team_id", "team_mode", "player_id"]
+METRICS = ["damage_dealt", "damage_taken", "players_killed"]
+
+
+def measure(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def stage_and_summarize(game_file: str, event_file: str, mapping: GameMapping) -> pl.DataFrame:
+    convert_game_file(game_file, event_file)
+    return summarize_game_events(event_file, mapping)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the pydantic game stats extraction with the staged event summaries."
+    )
+    parser.add_argument("--game-file", required=True)
+    parser.add_argument("--mapping-file", required=True)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    platform_game_id = args.game_file.rsplit("/", 1)[-1].removesuffix(".gz").removesuffix(".json")
+    mappings = get_game_mappings(args.mapping_file)
+    mapping = next((m for m in mappings if m.platform_game_id == platform_game_id), mappings[0])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        event_file = f"{tmp_dir}/{platform_game_id}.parquet"
+
+        # end to end: parse the file and extract the stats, the events are staged to a Parquet file first
+        current, current_time, current_peak = measure(
+            lambda: get_game_stats(get_game_events(args.game_file), mapping), args.repeat
+        )
+        staged, staged_time, staged_peak = measure(
+            lambda: stage_and_summarize(args.game_file, event_file, mapping), args.repeat
+        )
+        # the pydantic stats are per round, the summaries per player and team mode
+        current_summary = current.group_by(SUMMARY_COLUMNS).agg(pl.col(METRICS).sum()).sort(SUMMARY_COLUMNS)
+        same = current_summary.equals(staged.select(SUMMARY_COLUMNS + METRICS).sort(SUMMARY_COLUMNS))
+
+        # stats extraction only, from events that are already parsed or staged
+        game_events = get_game_events(args.game_file)
+        _, current_stats_time, _ = measure(lambda: get_game_stats(game_events, mapping), args.repeat)
+        _, staged_stats_time, _ = measure(lambda: summarize_game_events(event_file, mapping), args.repeat)
+        event_file_mb = os.path.getsize(event_file) / 1024**2
+
+    print(
+        pl.DataFrame(
+            {
+                "implementation": ["get_game_stats", "summarize_game_events"],
+                "total_seconds": [current_time, staged_time],
+                "stats_seconds": [current_stats_time, staged_stats_time],
+                "peak_mb": [current_peak / 1024**2, staged_peak / 1024**2],
+                "rows": [len(current), len(staged)],
+            }
+        )
+    )
+    print(
+        f"speedup: {current_time / staged_time:.1f}x total, {current_stats_time / staged_stats_time:.1f}x stats, "
+        f"event file: {event_file_mb:.2f} MB, identical results: {same}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from dotenv import load_dotenv
+
+from agent import AgentPool
+from app import DEFAULT_PROMPT
+from helpers.stub_llm import ScriptedLLM, make_team_script
+
+
+def run_load(pool_size: int, requests: int, clients: int, latency: float, league: str) -> dict:
+    llm = ScriptedLLM(script=make_team_script(league), latency=latency)
+    pool = AgentPool(pool_size, llm=llm, verbose=False)
+
+    def request(_) -> float:
+        start = time.perf_counter()
+        pool.make_team(DEFAULT_PROMPT)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = sorted(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "pool_size": pool_size,
+        "requests_per_s": requests / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the agent pool with a stub LLM.")
+    parser.add_argument("--pool-sizes", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent users")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per stub LLM call")
+    parser.add_argument("--league", default="game-changers")
+    args = parser.parse_args()
+
+    results = [
+        run_load(pool_size, args.requests, args.clients, args.latency, args.league) for pool_size in args.pool_sizes
+    ]
+    print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from typing import Dict
+
+import numpy as np
+import polars as pl
+from deltalake import DeltaTable
+
+from helpers.mirror import TableMirror
+from helpers.storage import get_table_location
+
+TABLE_DIR = "data/delta/mirror_bench"
+BUCKET = "mirror-bench"
+
+
+def start_s3_stand_in():
+    """Starts a moto S3 server in this process and points the storage options at a new bucket in it."""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.update(
+        {
+            "AWS_S3_BUCKET": f"s3://{BUCKET}",
+            "AWS_ENDPOINT_URL": f"http://{host}:{port}",
+            "AWS_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+    )
+    boto3.client("s3", region_name="us-east-1", endpoint_url=f"http://{host}:{port}").create_bucket(Bucket=BUCKET)
+    return server
+
+
+def append(rows: int, rng: np.random.Generator):
+    table_path, storage_options = get_table_location(TABLE_DIR)
+    pl.DataFrame(
+        {
+            "player_id": rng.integers(0, 10_000, rows),
+            "damage_dealt": rng.integers(0, 5_000, rows, dtype=np.int32),
+            "players_killed": rng.integers(0, 30, rows, dtype=np.int16),
+        }
+    ).write_delta(table_path, mode="append", storage_options=storage_options)
+
+
+def open_source() -> DeltaTable:
+    table_path, storage_options = get_table_location(TABLE_DIR)
+    return DeltaTable(table_path, storage_options=storage_options)
+
+
+def sync(step: str, mirror: TableMirror) -> Dict:
+    """Syncs the mirror, returning what the sync fetched and evicted, and if the mirror reads the same rows."""
+    before = mirror.stats()
+    start = time.perf_counter()
+    local_path = mirror.sync(TABLE_DIR)
+    elapsed = time.perf_counter() - start
+    after = mirror.stats()
+    source = open_source()
+    columns = ["player_id", "damage_dealt", "players_killed"]
+    same_rows = pl.read_delta(local_path).sort(columns).equals(pl.scan_delta(source).collect().sort(columns))
+    return {
+        "step": step,
+        "version": DeltaTable(local_path).version(),
+        "sync_ms": elapsed * 1000,
+        **{name: after[name] - before[name] for name in ["log_files", "data_files", "evicted_files"]},
+        "mirrored_mib": after["bytes_mirrored"] / 1024**2,
+        "same_rows": same_rows and DeltaTable(local_path).version() == source.version(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the syncs of the table mirror as the table changes.")
+    parser.add_argument("--s3", action="store_true", help="mirror a table in a local moto S3 server")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows per commit")
+    parser.add_argument("--commits", type=int, default=5, help="commits before the checkpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = None
+        if args.s3:
+            server = start_s3_stand_in()
+        else:
+            for name in ["AWS_S3_BUCKET", "AWS_ENDPOINT_URL"]:
+                os.environ.pop(name, None)
+            # the local tables are resolved relative to the working directory
+            os.chdir(work_dir)
+        print(f"mirroring {get_table_location(TABLE_DIR)[0]}")
+        mirror = TableMirror(f"{work_dir}/mirror")
+        results = []
+
+        append(args.rows, rng)
+        results.append(sync("create", mirror))
+        results.append(sync("no change", mirror))
+        for _ in range(args.commits - 1):
+            append(args.rows, rng)
+        results.append(sync("append", mirror))
+
+        open_source().create_checkpoint()
+        append(args.rows, rng)
+        results.append(sync("checkpoint + append", mirror))
+
+        # the files replaced by the compaction become inactive, and the oldest are evicted to fit the new limit
+        mirror.max_bytes = int(mirror.stats()["bytes_mirrored"] * 1.5)
+        source = open_source()
+        source.optimize.compact()
+        source.vacuum(retention_hours=0, enforce_retention_duration=False, dry_run=False)
+        results.append(sync("compact + vacuum", mirror))
+        results.append(sync("no change", mirror))
+
+        # a new mirror starts from the last checkpoint instead of the first commit
+        results.append(sync("fresh mirror", TableMirror(f"{work_dir}/fresh")))
+        if server is not None:
+            server.stop()
+
+    with pl.Config(tbl_rows=20, tbl_width_chars=160):
+        print(pl.DataFrame(results))
+    print("all syncs read the source rows:", all(result["same_rows"] for result in results))
+
+
+if __name__ == "__main__":
+    main()
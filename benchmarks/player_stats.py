@@ -0,0 +1,52 @@
+import argparse
+import random
+import time
+
+import polars as pl
+from dotenv import load_dotenv
+
+from tools import LEAGUES, get_player_game_stats, get_player_stats, get_players_in_league, scan_game_data
+
+NUM_PLAYERS = 10
+
+
+def measure(fn, lookups, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        for player_ids, league in lookups:
+            start = time.perf_counter()
+            fn(player_ids, league)
+            timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the tool latency on the aggregates and the raw stats table.")
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    leagues = [league for league in LEAGUES if len(get_players_in_league(league)) >= NUM_PLAYERS]
+    lookups = []
+    for _ in range(args.lookups):
+        league = rng.choice(leagues)
+        player_ids = get_players_in_league(league)["player_id"].to_list()
+        lookups.append((rng.sample(player_ids, NUM_PLAYERS), league))
+
+    raw_rows = scan_game_data().select(pl.len()).collect().item()
+    results = pl.DataFrame(
+        {
+            "tool": ["get_player_stats", "get_player_game_stats"],
+            "median_ms": [measure(fn, lookups, args.repeat) * 1000 for fn in [get_player_stats, get_player_game_stats]],
+            "rows_returned": [len(fn(*lookups[0])) for fn in [get_player_stats, get_player_game_stats]],
+        }
+    )
+    print(f"raw table rows: {raw_rows}")
+    print(results)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
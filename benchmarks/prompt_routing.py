@@ -0,0 +1,115 @@
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import polars as pl
+from dotenv import load_dotenv
+
+from agent import DEFAULT_CONTEXT_SIZE, TeamManager
+from app import DEFAULT_PROMPT
+from helpers.render import estimate_tokens
+from helpers.stub_llm import BEST_TEAM_STEP, ScriptedLLM
+from router import parse_prompt
+from tools import get_players_region, get_random_players
+
+ANSWER_STEP = "Thought: I can answer without using any more tools.\nAnswer: {team} are the best fit for the request."
+
+
+def tool_step(thought: str, tool: str, tool_input: Dict) -> str:
+    # `{player_ids}` is filled in by the stub with the first ids returned by a tool
+    action_input = json.dumps(tool_input).replace('"{player_ids}"', "{player_ids}")
+    return f"Thought: {thought}\nAction: {tool}\nAction Input: {action_input}"
+
+
+def make_prompts(league: str) -> Dict[str, Dict]:
+    """Returns the prompt of each task, with the ReAct trace of the agent without the router."""
+    player_ids = get_random_players(league, 3, seed=0)
+    region = get_players_region(player_ids[:1])["league_region"][0]
+    shortlist = tool_step("I need to shortlist players.", "get_random_players", {"league": league, "num_players": 10})
+    best_teams = tool_step(
+        "I need to rank the teams of the shortlisted players.",
+        "get_best_teams",
+        {"player_ids": "{player_ids}", "league": league},
+    )
+    stats = tool_step("I need the stats of the players.", "get_player_stats", {"player_ids": player_ids})
+    return {
+        "new team": {"prompt": DEFAULT_PROMPT, "script": [shortlist, best_teams, BEST_TEAM_STEP]},
+        "new team in region": {
+            "prompt": f"Build a team using only players from VCT Game Changers in {region}.",
+            "script": [
+                tool_step(
+                    "I need to shortlist players of the region.",
+                    "get_random_players",
+                    {"league": league, "num_players": 10, "region": region},
+                ),
+                best_teams,
+                BEST_TEAM_STEP,
+            ],
+        },
+        "replacement": {
+            "prompt": f"If player {player_ids[0]} were unavailable, who would be a suitable replacement and why?",
+            "script": [
+                tool_step("I need the region of the player.", "get_players_region", {"player_ids": player_ids[:1]}),
+                tool_step(
+                    "I need to shortlist players of the same region.",
+                    "get_random_players",
+                    {"league": None, "num_players": 10, "region": region},
+                ),
+                tool_step(
+                    "I need the stats of the player and of the shortlist.",
+                    "get_player_stats",
+                    {"player_ids": "{player_ids}"},
+                ),
+                ANSWER_STEP,
+            ],
+        },
+        "stats": {
+            "prompt": f"What recent performances or statistics justify the inclusion of players {player_ids}?",
+            "script": [stats, ANSWER_STEP],
+        },
+    }
+
+
+def measure(manager: TeamManager, task: str, prompt: str, script: List[str], routed: bool, runs: int) -> dict:
+    # with the data prefetched into the prompt, the stub answers right away like an LLM following the instructions
+    llm = ScriptedLLM(script=script if not routed else script[-1:], context_window=DEFAULT_CONTEXT_SIZE)
+    agent = TeamManager(llm=llm, tools=manager.tools, verbose=False, route_prompts=routed)
+    route_seconds, run_seconds = 0.0, 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        agent.extend_prompt(prompt)
+        route_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        agent.make_team(prompt)
+        run_seconds += time.perf_counter() - start
+    return {
+        "task": task,
+        "routed": routed,
+        "parsed_as": parse_prompt(prompt).task,
+        "llm_calls_per_run": len(llm.prompts) / runs,
+        "prompt_tokens_per_run": sum(estimate_tokens(prompt) for prompt in llm.prompts) / runs,
+        "route_ms": route_seconds / runs * 1000,
+        "run_ms": run_seconds / runs * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the LLM calls saved by routing the prompts with a stub LLM.")
+    parser.add_argument("--league", default="game-changers")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    manager = TeamManager(llm=ScriptedLLM(), verbose=False)
+    results = [
+        measure(manager, task, case["prompt"], case["script"], routed, args.runs)
+        for task, case in make_prompts(args.league).items()
+        for routed in [False, True]
+    ]
+    with pl.Config(tbl_cols=-1):
+        print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,45 @@
+import argparse
+
+import polars as pl
+import tiktoken
+from dotenv import load_dotenv
+
+from agent import DEFAULT_CONTEXT_SIZE, TeamManager
+from app import DEFAULT_PROMPT
+from helpers.stub_llm import ScriptedLLM, make_team_script
+
+
+def measure(compact: bool, league: str, runs: int, encoding: tiktoken.Encoding) -> dict:
+    llm = ScriptedLLM(script=make_team_script(league), context_window=DEFAULT_CONTEXT_SIZE)
+    manager = TeamManager(llm=llm, compact_tools=compact)
+    calls, tokens, observation_tokens = 0, 0, 0
+    for _ in range(runs):
+        llm.prompts.clear()
+        manager.make_team(DEFAULT_PROMPT)
+        calls += len(llm.prompts)
+        tokens += sum(len(encoding.encode(prompt)) for prompt in llm.prompts)
+        # the stats observation is the last message of the last prompt
+        observation_tokens += len(encoding.encode(llm.prompts[-1].rsplit("Observation:", 1)[-1]))
+    return {
+        "tool_output": "compact" if compact else "dataframe",
+        "llm_calls_per_run": calls / runs,
+        "prompt_tokens_per_run": tokens / runs,
+        "stats_observation_tokens": observation_tokens / runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the prompt tokens of an agent run with a stub LLM.")
+    parser.add_argument("--league", default="game-changers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--encoding", default="cl100k_base", help="tiktoken encoding used to count the tokens")
+    args = parser.parse_args()
+
+    encoding = tiktoken.get_encoding(args.encoding)
+    results = [measure(compact, args.league, args.runs, encoding) for compact in [False, True]]
+    print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict
+
+import polars as pl
+from dotenv import load_dotenv
+from process import PARTITION_BY, STATS_DIR
+
+from helpers.schema import STATS_COMPRESSION, STATS_V2_TYPES, read_stats, to_stats_v2
+from helpers.storage import get_table_location
+from helpers.tables import get_writer_properties
+
+NUM_PLAYERS = 10
+
+
+def to_stats_v1(game_stats: pl.DataFrame) -> pl.DataFrame:
+    """Converts game stats of either version to the v1 schema, 64-bit counters and no team role."""
+    return game_stats.with_columns(pl.col(column).cast(pl.Int64) for column in STATS_V2_TYPES).drop(
+        "team_role", strict=False
+    )
+
+
+def measure(fn: Callable, repeat: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def v1_team_role() -> pl.Expr:
+    """The team role as derived by the queries of schema v1."""
+    return (
+        pl.when(pl.col("team_mode") == "A")
+        .then(pl.lit("attacking team"))
+        .otherwise(pl.lit("defending team"))
+        .alias("team_role")
+    )
+
+
+def measure_layout(name: str, table_path: str, read: Callable, league: str, player_ids: list, repeat: int) -> Dict:
+    data_files = glob.glob(f"{table_path}/**/*.parquet", recursive=True)
+    scan = lambda: read(pl.scan_delta(table_path)).filter(pl.col("league_alias") == league)  # noqa: E731
+    lookup = scan().filter(pl.col("player_id").is_in(player_ids))
+    return {
+        "schema": name,
+        "files": len(data_files),
+        "mib": sum(os.path.getsize(path) for path in data_files) / 1024**2,
+        "league_scan_ms": measure(lambda: scan().collect(), repeat) * 1000,
+        "league_mib_in_memory": scan().collect().estimated_size() / 1024**2,
+        "lookup_ms": measure(lambda: lookup.select("player_id", "damage_dealt", "team_role").collect(), repeat) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the size and scan time of the game stats schema versions.")
+    parser.add_argument("--scale", type=int, default=10, help="copies of the games, with new game ids")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    table_path, storage_options = get_table_location(STATS_DIR)
+    game_stats = to_stats_v1(pl.read_delta(table_path, storage_options=storage_options))
+    max_game_id = game_stats["esports_game_id"].max()
+    game_stats = pl.concat(
+        game_stats.with_columns(pl.col("esports_game_id") + copy * max_game_id) for copy in range(args.scale)
+    )
+    league = game_stats["league_alias"].mode()[0]
+    player_ids = game_stats.filter(pl.col("league_alias") == league)["player_id"].unique().head(NUM_PLAYERS).to_list()
+    print(f"{len(game_stats)} rows, scanning the {league} league and looking up {NUM_PLAYERS} players")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # both tables are written in one commit, so they only differ by their schema and compression
+        game_stats.write_delta(f"{work_dir}/v1", delta_write_options={"partition_by": PARTITION_BY})
+        to_stats_v2(game_stats).write_delta(
+            f"{work_dir}/v2",
+            delta_write_options={
+                "partition_by": PARTITION_BY,
+                "writer_properties": get_writer_properties(compression=STATS_COMPRESSION),
+            },
+        )
+        layouts = [
+            ("v1", "v1", lambda scan: scan.with_columns(v1_team_role())),
+            ("v1 read as v2", "v1", read_stats),
+            ("v2", "v2", read_stats),
+        ]
+        results = [
+            measure_layout(name, f"{work_dir}/{table}", read, league, player_ids, args.repeat)
+            for name, table, read in layouts
+        ]
+    print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
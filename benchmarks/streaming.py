@@ -0,0 +1,68 @@
+import argparse
+import statistics
+import time
+
+import polars as pl
+from dotenv import load_dotenv
+
+from agent import AgentPool
+from app import DEFAULT_PROMPT
+from helpers.stub_llm import ScriptedLLM
+
+
+def measure_blocking(pool: AgentPool, runs: int) -> dict:
+    totals = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pool.make_team(DEFAULT_PROMPT)
+        totals.append(time.perf_counter() - start)
+    total = statistics.median(totals)
+    return {
+        "mode": "blocking",
+        "first_byte_s": total,
+        "first_step_s": total,
+        "first_answer_token_s": total,
+        "total_s": total,
+    }
+
+
+def measure_streaming(pool: AgentPool, runs: int) -> dict:
+    first_bytes, first_steps, first_tokens, totals = [], [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        first_byte, first_step, first_token = None, None, None
+        for kind, text in pool.stream_team(DEFAULT_PROMPT):
+            first_byte = first_byte or time.perf_counter() - start
+            # the first event is the prompt preparation, then each agent step
+            if kind == "step" and text.startswith("Step"):
+                first_step = first_step or time.perf_counter() - start
+            if kind == "answer":
+                first_token = first_token or time.perf_counter() - start
+        totals.append(time.perf_counter() - start)
+        first_bytes.append(first_byte)
+        first_steps.append(first_step)
+        first_tokens.append(first_token)
+    return {
+        "mode": "streaming",
+        "first_byte_s": statistics.median(first_bytes),
+        "first_step_s": statistics.median(first_steps),
+        "first_answer_token_s": statistics.median(first_tokens),
+        "total_s": statistics.median(totals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the time to first byte of blocking and streaming runs.")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds of the stub LLM before each response")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds of the stub LLM per token")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    llm = ScriptedLLM(latency=args.latency, token_latency=args.token_latency)
+    pool = AgentPool(1, llm=llm, verbose=False)
+    print(pl.DataFrame([measure_blocking(pool, args.runs), measure_streaming(pool, args.runs)]))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import polars as pl
+import synthetic
+from convert import convert_region_data
+from process import (
+    MERGE_ON,
+    PARTITION_BY,
+    RAW_DIR,
+    STATS_DIR,
+    YEARS,
+    get_game_file,
+    process_game_file,
+    process_league_files,
+)
+
+from agent import TeamManager
+from helpers.aggregates import refresh_player_aggregates
+from helpers.manifest import ManifestWriter
+from helpers.parsers import get_game_events, get_game_mappings, get_game_stats
+from helpers.render import estimate_tokens
+from helpers.schema import STATS_COMPRESSION
+from helpers.stub_llm import ScriptedLLM, make_team_script
+from helpers.tables import BufferedTableWriter
+from tools import (
+    get_player_game_stats,
+    get_player_stats,
+    get_players_region,
+    get_random_players,
+    tool_cache,
+)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = "Build a team using only players from VCT Game Changers."
+
+
+def quiet(fn: Callable, *args, **kwargs):
+    """Calls `fn` without its progress output, which would get mixed with the JSON results."""
+    with redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def timed(fn: Callable, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    quiet(fn, *args, **kwargs)
+    return time.perf_counter() - start
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_parsers(league: str, repeat: int) -> Dict[str, Any]:
+    """Measures the throughput of the game parsers on the game files of the league (best of `repeat`)."""
+    games_folder = f"{RAW_DIR}/{league}/games/{YEARS[0]}"
+    mappings = get_game_mappings(f"{RAW_DIR}/{league}/esports-data/mapping_data.json")
+    game_files = [get_game_file(games_folder, mapping) for mapping in mappings]
+    megabytes = sum(os.path.getsize(game_file) for game_file in game_files) / 1024**2
+    events = [get_game_events(game_file) for game_file in game_files]
+    num_events = sum(len(game_events) for game_events in events)
+
+    def parse():
+        for game_file in game_files:
+            get_game_events(game_file)
+
+    def stats():
+        for game_events, mapping in zip(events, mappings):
+            get_game_stats(game_events, mapping)
+
+    def process():
+        for mapping in mappings:
+            process_game_file(games_folder, mapping, league, YEARS[0])
+
+    parse_seconds = min(timed(parse) for _ in range(repeat))
+    stats_seconds = min(timed(stats) for _ in range(repeat))
+    process_seconds = min(timed(process) for _ in range(repeat))
+    return {
+        "games": len(game_files),
+        "megabytes": megabytes,
+        "get_game_events": {
+            "seconds": parse_seconds,
+            "mb_per_s": megabytes / parse_seconds,
+            "events_per_s": num_events / parse_seconds,
+        },
+        "get_game_stats": {"seconds": stats_seconds, "events_per_s": num_events / stats_seconds},
+        "process_game_file": {"seconds": process_seconds, "games_per_s": len(game_files) / process_seconds},
+    }
+
+
+def ingest(leagues: List[str]) -> Dict[str, Any]:
+    """Loads the generated games into the local Delta tables, like `scripts/process.py` and `scripts/convert.py`."""
+
+    def load():
+        with (
+            ManifestWriter() as manifest,
+            BufferedTableWriter(
+                STATS_DIR, PARTITION_BY, merge_on=MERGE_ON, on_flush=manifest.flush, compression=STATS_COMPRESSION
+            ) as writer,
+        ):
+            for league in leagues:
+                process_league_files(league, YEARS[0], writer, manifest)
+        refresh_player_aggregates()
+        convert_region_data(leagues)
+        return writer.rows_written
+
+    start = time.perf_counter()
+    rows = quiet(load)
+    return {"seconds": time.perf_counter() - start, "game_stats_rows": rows}
+
+
+def benchmark_tools(leagues: List[str], lookups: int, seed: int) -> Dict[str, Any]:
+    """Measures the tool latency: first call on an empty cache, cache misses on warm tables, and cache hits."""
+    shortlists = [(quiet(get_random_players, leagues[i % len(leagues)], 10, seed=seed + i), i) for i in range(lookups)]
+    calls = {
+        "get_random_players": [((leagues[i % len(leagues)], 10, None, seed + i), {}) for _, i in shortlists],
+        "get_players_region": [((player_ids,), {}) for player_ids, _ in shortlists],
+        "get_player_stats": [((player_ids, leagues[i % len(leagues)]), {}) for player_ids, i in shortlists],
+        "get_player_game_stats": [((player_ids, leagues[i % len(leagues)]), {}) for player_ids, i in shortlists],
+    }
+    tools = {
+        "get_random_players": get_random_players,
+        "get_players_region": get_players_region,
+        "get_player_stats": get_player_stats,
+        "get_player_game_stats": get_player_game_stats,
+    }
+    results = {}
+    for name, tool in tools.items():
+        tool_cache.clear()
+        args, kwargs = calls[name][0]
+        cold = timed(tool, *args, **kwargs)
+        misses = [timed(tool, *args, **kwargs) for args, kwargs in calls[name][1:]]
+        hits = [timed(tool, *args, **kwargs) for args, kwargs in calls[name][1:]]
+        results[name] = {
+            "cold_ms": cold * 1000,
+            "miss_median_ms": statistics.median(misses) * 1000,
+            "hit_median_ms": statistics.median(hits) * 1000,
+        }
+    return results
+
+
+def benchmark_end_to_end(runs: int) -> Dict[str, Any]:
+    """Measures `TeamManager.make_team` with a stub LLM replaying a scripted ReAct trace (no LLM latency)."""
+    llm = ScriptedLLM(script=make_team_script("game-changers"))
+    manager = quiet(TeamManager, llm=llm, verbose=False)
+    latencies = [timed(manager.make_team, PROMPT) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "median_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "llm_calls_per_run": len(llm.prompts) / runs,
+        "prompt_tokens_per_run": sum(estimate_tokens(prompt) for prompt in llm.prompts) / runs,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], prefix: str = "") -> List[str]:
+    """Lists the relative change of each numeric result from the baseline results."""
+    lines = []
+    for key, value in results.items():
+        name, previous = f"{prefix}{key}", baseline.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            lines.extend(compare(value, previous, f"{name}."))
+        elif isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            lines.append(f"{name}: {previous:.4g} -> {value:.4g} ({(value - previous) / previous:+.1%})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite on synthetic data with a stub LLM.")
+    parser.add_argument("--work-dir", help="directory of the generated data, a temporary directory by default")
+    parser.add_argument("--leagues", nargs="+", default=synthetic.LEAGUES)
+    parser.add_argument("--games", type=int, default=20, help="games per league")
+    parser.add_argument("--rounds", type=int, default=24)
+    parser.add_argument("--damage-events", type=int, default=40, help="damage events per round")
+    parser.add_argument("--snapshots", type=int, default=50, help="snapshot events per round")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=20, help="tool calls per tool")
+    parser.add_argument("--runs", type=int, default=10, help="make_team runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    output_file = args.output and os.path.abspath(args.output)
+    baseline_file = args.baseline and os.path.abspath(args.baseline)
+    # the tables are local, in the work directory
+    os.environ.pop("AWS_S3_BUCKET", None)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+
+    options = {"rounds": args.rounds, "damage_events": args.damage_events, "snapshots": args.snapshots}
+    start = time.perf_counter()
+    synthetic.generate("data/raw", args.leagues, args.games, seed=args.seed, **options)
+    generate_seconds = time.perf_counter() - start
+
+    results = {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "config": {"leagues": args.leagues, "games": args.games, "seed": args.seed, **options},
+        "generate_seconds": generate_seconds,
+        "parsers": benchmark_parsers(args.leagues[0], args.repeat),
+        "ingest": ingest(args.leagues),
+        "tools": benchmark_tools(args.leagues, args.lookups, args.seed),
+        "end_to_end": benchmark_end_to_end(args.runs),
+    }
+    output = json.dumps(results, indent=2)
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(output)
+    print(output)
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        measures = {key: value for key, value in results.items() if key != "config"}
+        print("\n".join(compare(measures, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import gzip
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+LEAGUES = ["vct-challengers", "game-changers", "vct-international"]
+REGIONS = ["EMEA", "AMER", "PACIFIC", "CN"]
+YEAR = 2024
+PLAYERS_PER_TEAM = 5
+# team numbers used in the game events, mapped to the team ids by the game mapping
+TEAM_NUMBERS = (1, 2)
+
+
+def make_game_events(
+    rng: random.Random, platform_game_id: str, rounds: int = 24, damage_events: int = 40, snapshots: int = 50
+) -> List[Dict[str, Any]]:
+    """Generates the events of a game, shaped like the game files `helpers.parsers` consumes.
+
+    Args:
+        rng (random.Random): The random generator.
+        platform_game_id (str): The id of the game.
+        rounds (int): The number of rounds.
+        damage_events (int): The number of damage events per round.
+        snapshots (int): The number of position snapshots per round, only there to weigh like real game files.
+    """
+    events = []
+
+    def add(name: str, payload: Dict[str, Any], round_num: int):
+        metadata = {"sequenceNumber": len(events) + 1, "currentGamePhase": {"roundNumber": round_num}}
+        events.append({"platformGameId": platform_game_id, "metadata": metadata, name: payload})
+
+    teams = [
+        {
+            "teamId": {"value": number},
+            "playersInTeam": [{"value": i * PLAYERS_PER_TEAM + p + 1} for p in range(PLAYERS_PER_TEAM)],
+        }
+        for i, number in enumerate(TEAM_NUMBERS)
+    ]
+    participants = range(1, PLAYERS_PER_TEAM * len(TEAM_NUMBERS) + 1)
+    for round_num in range(1, rounds + 1):
+        attacking_team = TEAM_NUMBERS[0] if round_num <= rounds // 2 else TEAM_NUMBERS[1]
+        # configuration events are repeated during the rounds
+        for _ in range(2):
+            add(
+                "configuration",
+                {"spikeMode": {"currentRound": round_num, "attackingTeam": {"value": attacking_team}}, "teams": teams},
+                round_num,
+            )
+        for _ in range(snapshots):
+            players = [
+                {"playerId": {"value": p}, "position": {"x": rng.uniform(-1e4, 1e4), "y": rng.uniform(-1e4, 1e4)}}
+                for p in participants
+            ]
+            add("snapshot", {"players": players}, round_num)
+        for _ in range(damage_events):
+            causer, victim = rng.sample(participants, 2)
+            add(
+                "damageEvent",
+                {
+                    "causerId": {"value": causer},
+                    "victimId": {"value": victim},
+                    "damageDealt": rng.uniform(10, 150),
+                    "killEvent": {"weapon": "Vandal"} if rng.random() < 0.1 else None,
+                },
+                round_num,
+            )
+        add("roundEnded", {"roundNumber": round_num}, round_num)
+    return events
+
+
+def write_json(path: str, data: Any, compress: bool = False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if compress:
+        with gzip.open(f"{path}.gz", "wt") as f:
+            json.dump(data, f)
+    else:
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+def generate_league(
+    raw_dir: str,
+    league: str,
+    league_index: int,
+    games: int,
+    teams_per_region: int = 4,
+    compress: bool = False,
+    seed: int = 0,
+    **game_options,
+) -> Dict[str, int]:
+    """Writes the esports data fixtures and the game files of a league under `raw_dir/league`.
+
+    The fixtures have one league and one tournament per region, `teams_per_region` teams per region
+    and five players per team. Each game opposes two teams of the same region.
+
+    Returns:
+        Dict[str, int]: The number of games, teams and players.
+    """
+    rng = random.Random(f"{seed}-{league}")
+    base_id = (league_index + 1) * 10**9
+    leagues, tournaments, teams, players, region_teams = [], [], [], [], {}
+    for r, region in enumerate(REGIONS):
+        league_id, tournament_id = base_id + r, base_id + 100 + r
+        leagues.append({"league_id": str(league_id), "name": f"{league} {region}", "region": region})
+        tournaments.append(
+            {
+                "id": str(tournament_id),
+                "league_id": str(league_id),
+                "name": f"{league} {region} {YEAR}",
+                "status": "published",
+                "time_zone": "UTC",
+            }
+        )
+        region_teams[region] = []
+        for t in range(teams_per_region):
+            team_id = base_id + 10_000 + r * 100 + t
+            teams.append({"id": str(team_id), "home_league_id": str(league_id), "name": f"Team {region} {t}"})
+            team_players = [base_id + 100_000 + (r * 100 + t) * 10 + p for p in range(PLAYERS_PER_TEAM)]
+            players.extend(
+                {
+                    "id": str(player_id),
+                    "home_team_id": str(team_id),
+                    "handle": f"player{player_id}",
+                    "first_name": "First",
+                    "last_name": f"Last{player_id}",
+                    "status": "active",
+                }
+                for player_id in team_players
+            )
+            region_teams[region].append((team_id, tournament_id, team_players))
+
+    mappings = []
+    for g in range(games):
+        platform_game_id = f"val:{league}-{g}"
+        (team_a, tournament_id, players_a), (team_b, _, players_b) = rng.sample(region_teams[rng.choice(REGIONS)], 2)
+        mappings.append(
+            {
+                "platformGameId": platform_game_id,
+                "esportsGameId": str(base_id + 1_000_000 + g),
+                "tournamentId": str(tournament_id),
+                "teamMapping": {str(TEAM_NUMBERS[0]): str(team_a), str(TEAM_NUMBERS[1]): str(team_b)},
+                "participantMapping": {str(i + 1): str(p) for i, p in enumerate(players_a + players_b)},
+            }
+        )
+        events = make_game_events(rng, platform_game_id, **game_options)
+        write_json(f"{raw_dir}/{league}/games/{YEAR}/{platform_game_id}.json", events, compress)
+
+    esports_dir = f"{raw_dir}/{league}/esports-data"
+    for name, data in [
+        ("mapping_data", mappings),
+        ("leagues", leagues),
+        ("tournaments", tournaments),
+        ("teams", teams),
+        ("players", players),
+    ]:
+        write_json(f"{esports_dir}/{name}.json", data)
+    return {"games": games, "teams": len(teams), "players": len(players)}
+
+
+def generate(raw_dir: str, leagues: List[str], games: int, seed: int = 0, **options) -> Dict[str, Dict[str, int]]:
+    return {
+        league: generate_league(raw_dir, league, i, games, seed=seed, **options) for i, league in enumerate(leagues)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic game files and esports data fixtures.")
+    parser.add_argument("--output-dir", default="data/raw")
+    parser.add_argument("--leagues", nargs="+", default=LEAGUES)
+    parser.add_argument("--games", type=int, default=20, help="games per league")
+    parser.add_argument("--rounds", type=int, default=24)
+    parser.add_argument("--damage-events", type=int, default=40, help="damage events per round")
+    parser.add_argument("--snapshots", type=int, default=50, help="snapshot events per round")
+    parser.add_argument("--teams-per-region", type=int, default=4)
+    parser.add_argument("--gzip", action="store_true", help="write .json.gz game files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(
+        args.output_dir,
+        args.leagues,
+        args.games,
+        seed=args.seed,
+        teams_per_region=args.teams_per_region,
+        compress=args.gzip,
+        rounds=args.rounds,
+        damage_events=args.damage_events,
+        snapshots=args.snapshots,
+    )
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
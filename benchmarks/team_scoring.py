@@ -0,0 +1,104 @@
+import argparse
+import math
+import time
+from typing import List
+
+import numpy as np
+import polars as pl
+from dotenv import load_dotenv
+from llama_index.core.tools import FunctionTool
+
+from agent import DEFAULT_CONTEXT_SIZE, TeamManager
+from app import DEFAULT_PROMPT
+from helpers.render import estimate_tokens
+from helpers.scoring import PLAYER_FEATURES, TEAM_SIZE, get_combinations, score_teams
+from helpers.stub_llm import ScriptedLLM, make_best_teams_script, make_team_script
+from tools import initialize_tools
+
+REGIONS = ["AMER", "EMEA", "PACIFIC", "CN"]
+
+
+def make_players(num_players: int, rng: np.random.Generator) -> pl.DataFrame:
+    """Generates a shortlist with random per-game features."""
+    return pl.DataFrame(
+        {
+            "player_id": rng.choice(10**12, size=num_players, replace=False).astype(np.uint64),
+            "league_region": rng.choice(REGIONS, size=num_players),
+            **{feature: rng.gamma(4.0, 40.0, size=num_players) for feature in PLAYER_FEATURES},
+        }
+    )
+
+
+def measure_scoring(num_players: int, repeat: int, rng: np.random.Generator) -> dict:
+    players = make_players(num_players, rng)
+    get_combinations.cache_clear()
+    start = time.perf_counter()
+    score_teams(players)
+    first = time.perf_counter() - start
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        score_teams(players)
+        timings.append(time.perf_counter() - start)
+    teams = math.comb(num_players, TEAM_SIZE)
+    return {
+        "shortlist": num_players,
+        "teams": teams,
+        "first_ms": first * 1000,
+        "ms": min(timings) * 1000,
+        "teams_per_s": teams / min(timings),
+    }
+
+
+def measure_agent(flow: str, script: List[str], runs: int, tools: List[FunctionTool]) -> dict:
+    llm = ScriptedLLM(script=script, context_window=DEFAULT_CONTEXT_SIZE)
+    manager = TeamManager(llm=llm, tools=tools, verbose=False)
+    calls, tokens = 0, 0
+    for _ in range(runs):
+        llm.prompts.clear()
+        manager.make_team(DEFAULT_PROMPT)
+        calls += len(llm.prompts)
+        tokens += sum(estimate_tokens(prompt) for prompt in llm.prompts)
+    return {"flow": flow, "llm_calls_per_run": calls / runs, "prompt_tokens_per_run": tokens / runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the team scoring throughput and the agent steps and tokens it costs or saves."
+    )
+    parser.add_argument("--shortlists", type=int, nargs="+", default=[10, 15, 20, 25, 30])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--league", default="game-changers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-agent", action="store_true", help="only measure the scoring, without the tables")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(pl.DataFrame([measure_scoring(num_players, args.repeat, rng) for num_players in args.shortlists]))
+    if args.skip_agent:
+        return
+    # the stats flow is the flow of the agent before get_best_teams, run with and without its tool description
+    tools = initialize_tools()
+    flows = [
+        (
+            "stats, without get_best_teams",
+            make_team_script(args.league),
+            [t for t in tools if t.metadata.name != "get_best_teams"],
+        ),
+        ("stats", make_team_script(args.league), tools),
+        ("best teams", make_best_teams_script(args.league), tools),
+    ]
+    results = pl.DataFrame([measure_agent(flow, script, args.runs, flow_tools) for flow, script, flow_tools in flows])
+    baseline = results.row(0, named=True)
+    with pl.Config(tbl_width_chars=160, fmt_str_lengths=40):
+        print(
+            results.with_columns(
+                (baseline["llm_calls_per_run"] - pl.col("llm_calls_per_run")).alias("llm_calls_saved"),
+                (baseline["prompt_tokens_per_run"] - pl.col("prompt_tokens_per_run")).alias("prompt_tokens_saved"),
+            )
+        )
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
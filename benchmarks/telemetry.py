@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import polars as pl
+from dotenv import load_dotenv
+
+from agent import TeamManager
+from app import DEFAULT_PROMPT
+from helpers.stub_llm import ScriptedLLM
+from helpers.telemetry import Telemetry, telemetry
+from helpers.throttling import ThrottledLLM
+
+
+def measure_span(num_spans: int, trace_file: str | None) -> dict:
+    """Measures the cost of an empty span, nested in a root span like the spans of a run."""
+    tracer = Telemetry()
+    tracer.configure(trace_file)
+    start = time.perf_counter()
+    with tracer.span("root"):
+        for _ in range(num_spans):
+            with tracer.span("child"):
+                pass
+    elapsed = time.perf_counter() - start
+    tracer.close()
+    return {"exporter": trace_file is not None, "us_per_span": elapsed / num_spans * 1e6}
+
+
+def measure_runs(manager: TeamManager, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        manager.make_team(DEFAULT_PROMPT)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of the tracing and the spans of a run.")
+    parser.add_argument("--spans", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(pl.DataFrame([measure_span(args.spans, None), measure_span(args.spans, f"{tmp_dir}/empty.jsonl")]))
+        trace_file = f"{tmp_dir}/runs.jsonl"
+
+        # the stub answers at once, so the run time is the agent, tools and tracing overhead
+        llm = ThrottledLLM(ScriptedLLM(), requests_per_minute=1e6, tokens_per_minute=1e9)
+        manager = TeamManager(llm=llm, verbose=False)
+        manager.make_team(DEFAULT_PROMPT)
+        untraced = measure_runs(manager, args.runs)
+        telemetry.configure(trace_file)
+        traced = measure_runs(manager, args.runs)
+        telemetry.close()
+
+        spans = [json.loads(line) for line in open(trace_file)]
+        print(f"trace file: {os.path.getsize(trace_file) / len(spans):.0f} bytes per span")
+    run_spans = pl.DataFrame([{**span, "attributes": json.dumps(span["attributes"])} for span in spans])
+    print(
+        run_spans.group_by("name")
+        .agg(
+            (pl.len() / args.runs).alias("per_run"),
+            (pl.col("duration_ms").sum() / args.runs).alias("ms_per_run"),
+        )
+        .sort("ms_per_run", descending=True)
+    )
+    with pl.Config(fmt_str_lengths=200, tbl_width_chars=240):
+        print(run_spans.unique("name", maintain_order=True).select("name", "duration_ms", "attributes"))
+    print(
+        f"make_team: {untraced * 1000:.1f} ms without the exporter, {traced * 1000:.1f} ms with it, "
+        f"{len(run_spans) / args.runs:.0f} spans per run"
+    )
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from dotenv import load_dotenv
+
+from agent import AgentPool
+from app import DEFAULT_PROMPT
+from helpers.stub_llm import ScriptedLLM, make_team_script
+from helpers.throttling import ThrottledLLM
+
+
+def run_scenario(name: str, llm, stubs, pool_size: int, requests: int, clients: int) -> dict:
+    pool = AgentPool(pool_size, llm=llm, verbose=False)
+
+    def request(_) -> float | None:
+        start = time.perf_counter()
+        try:
+            pool.make_team(DEFAULT_PROMPT)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency in results if latency is not None)
+    stats = pool.llm_stats()
+    return {
+        "scenario": name,
+        "succeeded": len(latencies),
+        "failed": results.count(None),
+        "elapsed_s": elapsed,
+        "p95_s": latencies[int(len(latencies) * 0.95) - 1] if latencies else None,
+        "throttled": sum(stub.throttled for stub in stubs),
+        "retries": stats.get("retries"),
+        "failovers": stats.get("failovers"),
+        "queue_wait_avg_s": stats.get("queue_wait_avg_s"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the agent pool against a stub LLM that throttles requests.")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per stub LLM call")
+    parser.add_argument("--quota", type=int, default=5, help="stub LLM requests allowed per second")
+    parser.add_argument(
+        "--overestimate", type=float, default=2.0, help="configured requests per minute relative to the stub quota"
+    )
+    parser.add_argument("--tokens-per-minute", type=float, default=10_000_000)
+    args = parser.parse_args()
+
+    def stub(**kwargs) -> ScriptedLLM:
+        return ScriptedLLM(
+            script=make_team_script(), latency=args.latency, quota_requests=args.quota, quota_window=1, **kwargs
+        )
+
+    limits = {"requests_per_minute": args.quota * 60 * args.overestimate, "tokens_per_minute": args.tokens_per_minute}
+    # the primary LLM of the failover scenario is out of quota, e.g. in a busy region
+    ungoverned, governed, primary, secondary = stub(), stub(), stub(throttle_probability=1.0), stub()
+    scenarios = [
+        ("stub", ungoverned, [ungoverned]),
+        ("governed", ThrottledLLM(governed, **limits), [governed]),
+        ("failover", ThrottledLLM(primary, [secondary], max_retries=2, **limits), [primary, secondary]),
+    ]
+    results = [
+        run_scenario(name, llm, stubs, args.pool_size, args.requests, args.clients) for name, llm, stubs in scenarios
+    ]
+    with pl.Config(tbl_cols=-1, tbl_width_chars=200):
+        print(pl.DataFrame(results))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -1,29 +1,65 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
 import polars as pl
+from deltalake import DeltaTable
 from dotenv import load_dotenv
 
-from helpers.parsers import get_fixture_data
-from helpers.storage import get_storage_options
+from helpers.parsers import scan_fixture_data, scan_player_regions
+from helpers.storage import get_table_location
+from helpers.tables import upsert_table
 
 RAW_DIR = "data/raw"
 DELTA_DIR = "data/delta"
+REGIONS_DIR = f"{DELTA_DIR}/player_region"
+FIXTURE_DIR = f"{DELTA_DIR}/fixture"
 
 LEAGUES = ["game-changers", "vct-international", "vct-challengers"]
 
 
-def convert_region_data():
-    all_players = pl.DataFrame()
-    for league in LEAGUES:
-        players_in_league = get_fixture_data(f"{RAW_DIR}/{league}").select("league_region", "player_id").unique()
-        all_players = pl.concat([all_players, players_in_league], how="vertical")
-    storage_options = get_storage_options()
-    bucket = storage_options.pop("bucket")
-    table_path = f"{bucket}/{DELTA_DIR}/player_region"
-    all_players.write_delta(table_path, storage_options=storage_options)
+def load_leagues(leagues: List[str], scan) -> pl.DataFrame:
+    """Collects the `scan(data_dir)` plan of each league in parallel, with a `league_alias` column."""
+    plans = [scan(f"{RAW_DIR}/{league}").with_columns(pl.lit(league).alias("league_alias")) for league in leagues]
+    with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+        return pl.concat(executor.map(pl.LazyFrame.collect, plans), how="vertical")
+
+
+def convert_region_data(leagues: List[str] = LEAGUES):
+    """Upserts the regions of the players, so only their new (player, region) pairs are written.
+
+    A player may be listed in more than one region, so the rows are merged on both columns.
+    """
+    regions = load_leagues(leagues, scan_player_regions).select("league_region", "player_id")
+    metrics = upsert_table(REGIONS_DIR, regions, merge_on=["player_id", "league_region"])
+    print(
+        f"player_region: {len(regions)} player regions, {metrics['num_target_rows_inserted']} inserted, "
+        f"{metrics['num_target_rows_updated']} updated"
+    )
+
+
+def convert_fixture_data(leagues: List[str] = LEAGUES):
+    """Replaces the fixture rows (league, tournament, team and player) of the leagues, partitioned by league."""
+    fixture_data = load_leagues(leagues, scan_fixture_data)
+    table_path, storage_options = get_table_location(FIXTURE_DIR)
+    delta_write_options = {"partition_by": ["league_alias"]}
+    if DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        # only the partitions of the converted leagues are replaced
+        delta_write_options["predicate"] = "league_alias IN ({})".format(", ".join(f"'{league}'" for league in leagues))
+    fixture_data.write_delta(
+        table_path, mode="overwrite", storage_options=storage_options, delta_write_options=delta_write_options
+    )
+    print(f"fixture: {len(fixture_data)} rows")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Convert the esports data of the leagues into Delta tables.")
+    parser.add_argument("--leagues", nargs="+", default=LEAGUES)
+    args = parser.parse_args()
+
     load_dotenv()
-    convert_region_data()
+    convert_region_data(args.leagues)
+    convert_fixture_data(args.leagues)
     print("Done!")
 
 
@@ -1,11 +1,14 @@
-import gzip
+import argparse
 import json
 import os
-import shutil
 import time
-from io import BytesIO
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 S3_BUCKET_URL = "https://vcthackathon-data.s3.us-west-2.amazonaws.com"
 LOCAL_DIR_PREFIX = "data/raw"
@@ -16,40 +19,106 @@ LEAGUE = "vct-challengers"
 # (2022, 2023, 2024)
 YEAR = 2024
 
-
-def download_gzip_and_write_to_file(file_name, format):
-    if os.path.isfile(f"{file_name}.{format}"):
-        return False
-
-    remote_file = f"{S3_BUCKET_URL}/{file_name}.{format}.gz"
-    response = requests.get(remote_file, stream=True)
-
-    if response.status_code == 200:
-        gzip_bytes = BytesIO(response.content)
-        with gzip.GzipFile(fileobj=gzip_bytes, mode="rb") as gzipped_file:
-            with open(f"{LOCAL_DIR_PREFIX}/{file_name}.{format}", "wb") as output_file:
-                shutil.copyfileobj(gzipped_file, output_file)
+DEFAULT_WORKERS = 8
+CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+
+
+def create_session(pool_size: int = DEFAULT_WORKERS) -> requests.Session:
+    """Creates an HTTP session with a connection pool large enough for `pool_size` concurrent downloads."""
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def stream_gzip_to_file(response: requests.Response, local_file: str) -> int:
+    """Decompresses the gzip response body to `local_file` chunk by chunk.
+
+    The data is written to a temporary `.part` file first and renamed once complete,
+    so an interrupted or truncated download never leaves a file that looks finished.
+
+    Raises:
+        EOFError: If the response body ends before the end of the gzip stream.
+
+    Returns:
+        int: The number of compressed bytes received.
+    """
+    tmp_file = f"{local_file}.part"
+    received = 0
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        with open(tmp_file, "wb") as output_file:
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                received += len(chunk)
+                while chunk:
+                    output_file.write(decompressor.decompress(chunk))
+                    # concatenated gzip members
+                    chunk = decompressor.unused_data if decompressor.eof else b""
+                    if chunk:
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            output_file.write(decompressor.flush())
+        if not decompressor.eof:
+            # the body ended before the end of the gzip stream, e.g. a connection closed mid-body
+            raise EOFError(f"Truncated gzip stream for {local_file}")
+        os.replace(tmp_file, local_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return received
+
+
+def download_gzip_and_write_to_file(
+    file_name,
+    format,
+    session: requests.Session | None = None,
+    base_url: str = S3_BUCKET_URL,
+    local_dir: str = LOCAL_DIR_PREFIX,
+) -> int | None:
+    """Downloads `<file_name>.<format>.gz` and writes it decompressed to the local directory.
+
+    Returns:
+        int | None: The number of compressed bytes downloaded, 0 if the file already exists
+            locally, or None if the file is missing remotely or the download failed.
+    """
+    local_file = f"{local_dir}/{file_name}.{format}"
+    if os.path.isfile(local_file):
+        return 0
+
+    remote_file = f"{base_url}/{file_name}.{format}.gz"
+    http = session or requests
+    with http.get(remote_file, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 200:
+            received = stream_gzip_to_file(response, local_file)
             print(f"{file_name}.{format} written")
-        return True
-    elif response.status_code == 404:
-        # Ignore
-        return False
-    else:
-        print(response)
-        print(f"Failed to download {file_name}")
-        return False
-
-
-def download_esports_files():
-    directory = f"{LEAGUE}/esports-data"
-
-    local_directory = f"{LOCAL_DIR_PREFIX}/{directory}"
+            return received
+        elif response.status_code == 404:
+            # Ignore
+            return None
+        else:
+            print(response)
+            print(f"Failed to download {file_name}")
+            return None
+
+
+def download_esports_files(
+    league: str = LEAGUE,
+    session: requests.Session | None = None,
+    base_url: str = S3_BUCKET_URL,
+    local_dir: str = LOCAL_DIR_PREFIX,
+):
+    directory = f"{league}/esports-data"
+
+    local_directory = f"{local_dir}/{directory}"
     if not os.path.exists(local_directory):
         os.makedirs(local_directory)
 
     esports_data_files = ["leagues", "tournaments", "players", "teams", "mapping_data"]
     for file_name in esports_data_files:
-        download_gzip_and_write_to_file(f"{directory}/{file_name}", "json")
+        download_gzip_and_write_to_file(f"{directory}/{file_name}", "json", session, base_url, local_dir)
 
 
 def download_fandom_data():
@@ -64,33 +133,86 @@ def download_fandom_data():
         download_gzip_and_write_to_file(f"{directory}/{file_name}", "xml")
 
 
-def download_games():
-    start_time = time.time()
-
-    local_mapping_file = f"{LOCAL_DIR_PREFIX}/{LEAGUE}/esports-data/mapping_data.json"
+def get_game_files(league: str, year: int, local_dir: str = LOCAL_DIR_PREFIX) -> List[str]:
+    local_mapping_file = f"{local_dir}/{league}/esports-data/mapping_data.json"
     with open(local_mapping_file, "r") as json_file:
         mappings_data = json.load(json_file)
 
-    local_directory = f"{LOCAL_DIR_PREFIX}/{LEAGUE}/games/{YEAR}"
+    local_directory = f"{local_dir}/{league}/games/{year}"
     if not os.path.exists(local_directory):
         os.makedirs(local_directory)
 
-    game_counter = 0
+    return [f"{league}/games/{year}/{esports_game['platformGameId']}" for esports_game in mappings_data]
 
-    for esports_game in mappings_data:
-        s3_game_file = f"{LEAGUE}/games/{YEAR}/{esports_game['platformGameId']}"
 
-        response = download_gzip_and_write_to_file(s3_game_file, "json")
+def download_games_concurrently(
+    leagues: List[str],
+    years: List[int],
+    workers: int = DEFAULT_WORKERS,
+    base_url: str = S3_BUCKET_URL,
+    local_dir: str = LOCAL_DIR_PREFIX,
+) -> Tuple[int, int, int]:
+    """Downloads the game files for all leagues and years using a bounded pool of threads.
 
-        if response:
-            game_counter += 1
-            if game_counter % 10 == 0:
-                print(
-                    f"----- Processed {game_counter} games, current run time: {round((time.time() - start_time)/60, 2)} minutes"
-                )
+    Files that already exist locally are skipped, so an interrupted run can be restarted
+    and will resume with the files that are still missing.
+
+    Returns:
+        Tuple[int, int, int]: The number of downloaded, skipped and missing/failed files.
+    """
+    start_time = time.time()
+    session = create_session(workers)
+
+    game_files = []
+    for league in leagues:
+        download_esports_files(league, session, base_url, local_dir)
+        for year in years:
+            game_files.extend(get_game_files(league, year, local_dir))
+
+    downloaded, skipped, failed, total_bytes = 0, 0, 0, 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download_gzip_and_write_to_file, game_file, "json", session, base_url, local_dir): game_file
+            for game_file in game_files
+        }
+        for future in as_completed(futures):
+            try:
+                received = future.result()
+            except Exception as e:
+                print(f"Failed to download {futures[future]}: {e}")
+                received = None
+            if received is None:
+                failed += 1
+            elif received == 0:
+                skipped += 1
+            else:
+                downloaded += 1
+                total_bytes += received
+                if downloaded % 10 == 0:
+                    run_time = round((time.time() - start_time) / 60, 2)
+                    print(f"----- Downloaded {downloaded} games, current run time: {run_time} minutes")
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    print(
+        f"Downloaded {downloaded} files ({total_bytes / 1024**2:.1f} MB compressed), "
+        f"skipped {skipped} existing, {failed} missing or failed in {elapsed:.1f}s: "
+        f"{downloaded / elapsed:.2f} files/s, {total_bytes / 1024**2 / elapsed:.2f} MB/s"
+    )
+    return downloaded, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download VCT hackathon game data.")
+    parser.add_argument("--leagues", nargs="+", default=[LEAGUE])
+    parser.add_argument("--years", nargs="+", type=int, default=[YEAR])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--base-url", default=S3_BUCKET_URL, help="e.g. a local HTTP server serving gzipped fixtures")
+    parser.add_argument("--output-dir", default=LOCAL_DIR_PREFIX)
+    args = parser.parse_args()
+
+    download_games_concurrently(args.leagues, args.years, args.workers, args.base_url, args.output_dir)
 
 
 if __name__ == "__main__":
     # download_fandom_data()
-    download_esports_files()
-    download_games()
+    main()
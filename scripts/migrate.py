@@ -0,0 +1,117 @@
+import argparse
+import time
+from typing import Tuple
+
+import polars as pl
+from deltalake import CommitProperties, DeltaTable
+from dotenv import load_dotenv
+
+from helpers.schema import STATS_COMPRESSION, STATS_VERSION, get_stats_version, read_stats, to_stats_v2
+from helpers.storage import get_table_location
+from helpers.tables import get_writer_properties
+
+DELTA_DIR = "data/delta"
+STATS_DIR = f"{DELTA_DIR}/game_stats"
+PARTITION_BY = ["league_alias", "year"]
+
+
+def get_table_size(dt: DeltaTable) -> Tuple[int, int]:
+    """Returns the number of files and bytes of the current version of the table."""
+    sizes = dt.get_add_actions(flatten=True).column("size_bytes").to_pylist()
+    return len(sizes), sum(sizes)
+
+
+def measure_scan(dt: DeltaTable, repeat: int = 3) -> float:
+    """Measures the best time to read each league of the table with the tools' types, one league at a time."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stats = read_stats(pl.scan_delta(dt))
+        for league in stats.select("league_alias").unique().collect()["league_alias"]:
+            stats.filter(pl.col("league_alias") == league).collect()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(label: str, dt: DeltaTable):
+    files, size = get_table_size(dt)
+    print(
+        f"{label}: version {dt.version()}, schema v{get_stats_version(dt.schema().to_arrow().names)}, "
+        f"{files} files, {size / 1024**2:.2f} MiB, scan latency {measure_scan(dt) * 1000:.0f} ms"
+    )
+
+
+def migrate_stats_table(table_dir: str, version: int | None = None) -> int | None:
+    """Rewrites the game stats table in place with the v2 schema, see `to_stats_v2`, and Zstandard compression.
+
+    The rewrite overwrites the table in a single commit, so the v1 data stays readable at the previous
+    version until it is vacuumed, and `DeltaTable.restore` rolls the migration back.
+
+    Args:
+        table_dir (str): The directory of the table.
+        version (int | None): The expected current version of the table, to refuse to migrate a table
+            that got new commits since it was inspected.
+
+    Raises:
+        RuntimeError: If the table is not at the expected version, or got new commits during the migration.
+
+    Returns:
+        int | None: The version of the migrated table, or None if it was already migrated.
+    """
+    table_path, storage_options = get_table_location(table_dir)
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    source_version = dt.version()
+    if version is not None and version != source_version:
+        raise RuntimeError(f"{table_path} is at version {source_version}, not {version}.")
+    report("before", dt)
+    if get_stats_version(dt.schema().to_arrow().names) == STATS_VERSION:
+        print(f"{table_path} already has schema v{STATS_VERSION}")
+        return None
+
+    rows = to_stats_v2(pl.scan_delta(dt)).collect()
+    # the overwrite replaces all the files of the source version, so commits made in the meantime would be lost
+    if DeltaTable(table_path, storage_options=storage_options).version() != source_version:
+        raise RuntimeError(f"{table_path} got new commits during the migration, run it again.")
+    rows.write_delta(
+        table_path,
+        mode="overwrite",
+        storage_options=storage_options,
+        delta_write_options={
+            "partition_by": PARTITION_BY,
+            "schema_mode": "overwrite",
+            "writer_properties": get_writer_properties(compression=STATS_COMPRESSION),
+            "commit_properties": CommitProperties(
+                custom_metadata={"migration": f"game_stats v{STATS_VERSION}", "source_version": str(source_version)}
+            ),
+        },
+    )
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    report("after", dt)
+    print(f"migrated {len(rows)} rows, roll back with: scripts/migrate.py --restore {source_version}")
+    return dt.version()
+
+
+def restore_stats_table(table_dir: str, version: int):
+    """Restores the table to the given version, e.g. the version before the migration."""
+    table_path, storage_options = get_table_location(table_dir)
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    dt.restore(version)
+    report("restored", DeltaTable(table_path, storage_options=storage_options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the game stats table to the compact v2 schema.")
+    parser.add_argument("--table", default=STATS_DIR)
+    parser.add_argument("--version", type=int, help="expected current version of the table")
+    parser.add_argument("--restore", type=int, metavar="VERSION", help="restore the table to this version instead")
+    args = parser.parse_args()
+
+    if args.restore is not None:
+        restore_stats_table(args.table, args.restore)
+    else:
+        migrate_stats_table(args.table, args.version)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
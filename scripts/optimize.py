@@ -0,0 +1,95 @@
+import argparse
+import time
+from typing import List
+
+import polars as pl
+from deltalake import DeltaTable
+from dotenv import load_dotenv
+
+from helpers.schema import STATS_COMPRESSION
+from helpers.storage import get_table_location
+from helpers.tables import get_writer_properties
+
+DELTA_DIR = "data/delta"
+STATS_DIR = f"{DELTA_DIR}/game_stats"
+
+DEFAULT_TARGET_SIZE = 128 * 1024 * 1024
+DEFAULT_RETENTION_HOURS = 168
+
+
+def measure_scan(table_path: str, storage_options: dict, repeat: int = 3) -> float:
+    """Measures the best time to scan the table the way the tools do, one league at a time."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stats = pl.scan_delta(table_path, storage_options=storage_options)
+        leagues = stats.select("league_alias").unique().collect()["league_alias"]
+        for league in leagues:
+            stats.filter(pl.col("league_alias") == league).select("player_id", "damage_dealt").collect()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(label: str, dt: DeltaTable, table_path: str, storage_options: dict):
+    print(
+        f"{label}: version {dt.version()}, {len(dt.file_uris())} files, "
+        f"scan latency {measure_scan(table_path, storage_options) * 1000:.0f} ms"
+    )
+
+
+def optimize_table(
+    table_dir: str,
+    target_size: int,
+    retention_hours: int,
+    cluster_by: List[str] | None = None,
+    compression: str | None = STATS_COMPRESSION,
+):
+    """Compacts the small files of each `league_alias`/`year` partition, checkpoints the log and vacuums the table.
+
+    With `cluster_by`, each partition is rewritten Z-ordered by those columns instead, so that each file holds
+    a narrow range of their values and scans filtering on them skip the other files. The rewritten files are
+    compressed with `compression`.
+    """
+    table_path, storage_options = get_table_location(table_dir)
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    report("before", dt, table_path, storage_options)
+
+    writer_properties = get_writer_properties(cluster_by, compression)
+    for partition in sorted(dt.partitions(), key=lambda p: sorted(p.items())):
+        partition_filters = [(column, "=", value) for column, value in partition.items()]
+        if cluster_by:
+            metrics = dt.optimize.z_order(
+                cluster_by, partition_filters, target_size=target_size, writer_properties=writer_properties
+            )
+            print(f"{partition}: {metrics['numFilesRemoved']} files clustered into {metrics['numFilesAdded']}")
+        else:
+            metrics = dt.optimize.compact(
+                partition_filters=partition_filters, target_size=target_size, writer_properties=writer_properties
+            )
+            print(f"{partition}: {metrics['numFilesRemoved']} files compacted into {metrics['numFilesAdded']}")
+
+    dt.create_checkpoint()
+    dt.cleanup_metadata()
+    removed = dt.vacuum(retention_hours=retention_hours, dry_run=False, enforce_retention_duration=False)
+    print(f"vacuumed {len(removed)} files older than {retention_hours} hours")
+
+    report("after", DeltaTable(table_path, storage_options=storage_options), table_path, storage_options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact, checkpoint and vacuum the game stats table.")
+    parser.add_argument("--table", default=STATS_DIR)
+    parser.add_argument("--target-size", type=int, default=DEFAULT_TARGET_SIZE, help="target file size in bytes")
+    parser.add_argument("--retention-hours", type=int, default=DEFAULT_RETENTION_HOURS)
+    parser.add_argument(
+        "--cluster-by", nargs="+", help="Z-order the partitions by these columns, e.g. player_id (rewrites them)"
+    )
+    parser.add_argument("--compression", default=STATS_COMPRESSION, help="compression codec of the rewritten files")
+    args = parser.parse_args()
+
+    optimize_table(args.table, args.target_size, args.retention_hours, args.cluster_by, args.compression)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -1,72 +1,250 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
 import polars as pl
 from dotenv import load_dotenv
 
-from helpers.parsers import GameMapping, get_game_events, get_game_mappings, get_game_stats
-from helpers.storage import get_storage_options
+from helpers.aggregates import refresh_player_aggregates
+from helpers.events import get_event_file, stage_game_file
+from helpers.extractors import summarize_game_events
+from helpers.manifest import (
+    INGESTED,
+    QUARANTINED,
+    ManifestWriter,
+    get_file_fingerprint,
+    get_known_games,
+    is_new_or_changed,
+)
+from helpers.parsers import GameMapping, get_game_mappings
+from helpers.schema import STATS_COMPRESSION, STATS_VERSION, get_table_stats_version, to_stats_v2
+from helpers.tables import DEFAULT_BATCH_ROWS, DEFAULT_BATCH_SECONDS, BufferedTableWriter
+from helpers.telemetry import telemetry
 
 RAW_DIR = "data/raw"
 DELTA_DIR = "data/delta"
-STATS_DIR = f"{DELTA_DIR}/stats"
+STATS_DIR = f"{DELTA_DIR}/game_stats"
+PARTITION_BY = ["league_alias", "year"]
+MERGE_ON = ["esports_game_id", "player_id", "team_mode"]
+# the tools look up a few players at a time, see `--cluster`
+CLUSTER_BY = ["player_id"]
 
 LEAGUES = ["vct-challengers", "game-changers", "vct-international"]
 YEARS = [2024]
 
 
-def write_to_table(game_summary: pl.DataFrame, league, year):
-    storage_options = get_storage_options()
-    target = "local"
-    if storage_options:
-        target = storage_options.pop("bucket")
-    print(f"Writing to {target} table...")
+def write_to_table(game_summary: pl.DataFrame, league, year, writer: BufferedTableWriter):
     output = game_summary.select(pl.all(), pl.lit(year).alias("year"), pl.lit(league).alias("league_alias"))
-    table_path = f"{target}/{STATS_DIR}" if target != "local" else STATS_DIR
-    output.write_delta(
-        table_path,
-        mode="append",
-        storage_options=storage_options,
-        delta_write_options={"partition_by": ["league_alias", "year"]},
+    writer.write(to_stats_v2(output))
+
+
+def get_game_file(games_folder: str, mapping: GameMapping) -> str:
+    game_file = f"{games_folder}/{mapping.platform_game_id}.json"
+    if not os.path.isfile(game_file) and os.path.isfile(f"{game_file}.gz"):
+        game_file = f"{game_file}.gz"
+    return game_file
+
+
+def select_games(
+    mappings: List[GameMapping],
+    games_folder: str,
+    known: Dict[int, Tuple[int, int] | None] | None,
+    league: str | None = None,
+    year: int | None = None,
+) -> List[Tuple[GameMapping, Tuple[int, int] | None]]:
+    """Selects the games whose file is new or changed since it was ingested or quarantined.
+
+    The game files of known games can be deleted once staged: these games are unchanged while their event file exists.
+
+    Args:
+        known (Dict[int, Tuple[int, int] | None] | None): See `get_known_games`, or None to select all games.
+        league (str | None): The league, to fall back to the staged event file of deleted game files.
+        year (int | None): The year, to fall back to the staged event file of deleted game files.
+
+    Returns:
+        List[Tuple[GameMapping, Tuple[int, int] | None]]: The selected games with their file fingerprint,
+            None if the file does not exist.
+    """
+    selected = []
+    for mapping in mappings:
+        game_file = get_game_file(games_folder, mapping)
+        if not os.path.isfile(game_file) and league is not None:
+            # game files can be deleted once staged, and a staged game only changes if its game file comes back
+            game_file = get_event_file(league, year, mapping.platform_game_id)
+            if known is not None and mapping.esports_game_id in known and os.path.isfile(game_file):
+                continue
+        if not os.path.isfile(game_file):
+            selected.append((mapping, None))
+            continue
+        fingerprint = get_file_fingerprint(game_file)
+        if known is None or is_new_or_changed(known, mapping.esports_game_id, fingerprint):
+            selected.append((mapping, fingerprint))
+    return selected
+
+
+def record_game(
+    mapping: GameMapping,
+    fingerprint: Tuple[int, int] | None,
+    game_summary: pl.DataFrame | None,
+    reason: str | None,
+    league: str,
+    year: int,
+    writer: BufferedTableWriter,
+    manifest: ManifestWriter,
+):
+    telemetry.count("ingest_games_total", league=league, status="ingested" if game_summary is not None else "skipped")
+    if game_summary is not None:
+        with telemetry.span("ingest_write", rows=len(game_summary)):
+            write_to_table(game_summary, league, year, writer)
+        manifest.record(mapping, league, year, fingerprint, INGESTED)
+    elif fingerprint is not None:
+        # quarantine the bad game so it is not parsed again until its file changes
+        manifest.record(mapping, league, year, fingerprint, QUARANTINED, reason)
+
+
+def summarize_game(
+    games_folder: str, mapping: GameMapping, league: str, year: int
+) -> Tuple[pl.DataFrame | None, str | None]:
+    """Processes a single game file applying the skip rules for bad games.
+
+    Returns:
+        Tuple[pl.DataFrame | None, str | None]: The game summary, or None and the reason the game was skipped.
+    """
+    try:
+        return process_game_file(games_folder, mapping, league, year), None
+    except FileNotFoundError:
+        print("File not found. Skipping...")
+        return None, "file not found"
+    except KeyError as e:
+        if "causerId" in str(e):
+            print("Bad game data. Skipping...")
+            return None, "missing causerId"
+        raise
+    except ValueError as e:
+        if "bad game data" in str(e).lower():
+            print("Bad game data. Skipping...")
+            return None, "bad game data"
+        raise
+
+
+def print_summary(league: str, year: int, processed: int, skipped: Counter, elapsed: float):
+    reasons = ", ".join(f"{reason}: {count}" for reason, count in skipped.most_common()) or "none"
+    rate = processed / max(elapsed, 1e-9)
+    print(
+        f"{league}/{year}: processed {processed} games in {elapsed:.1f}s ({rate:.2f} games/s), "
+        f"skipped {sum(skipped.values())} ({reasons})"
     )
 
 
-def process_league_files(league: str, year: int | None = 2024):
+def init_worker(trace_file: str | None):
+    telemetry.configure(trace_file)
+
+
+def print_stages():
+    """Prints the time spent in each stage of this process, the stages of the worker processes are in the traces."""
+    stages = telemetry.metrics.summary("span_duration_seconds")
+    for (label,), (count, seconds) in sorted(stages.items(), key=lambda stage: -stage[1][1]):
+        print(f"  {label[1]}: {count} in {seconds:.1f}s ({seconds / count * 1000:.1f} ms each)")
+
+
+def process_league_files(
+    league: str,
+    year: int | None,
+    writer: BufferedTableWriter,
+    manifest: ManifestWriter,
+    known: Dict[int, Tuple[int, int] | None] | None = None,
+) -> Tuple[int, Counter]:
+    start_time = time.time()
     mapping_file = f"{RAW_DIR}/{league}/esports-data/mapping_data.json"
     games_folder = f"{RAW_DIR}/{league}/games/{year}"
     mappings = get_game_mappings(mapping_file)
-    for i, mapping in enumerate(mappings):
-        print(f"{i} of {len(mappings)}: ", end="")
-        try:
-            game_summary = process_game_file(games_folder, mapping, league, year)
-            write_to_table(game_summary, league, year)
-        except FileNotFoundError:
-            print("File not found. Skipping...")
-        except KeyError as e:
-            if "causerId" in str(e):
-                print("Bad game data. Skipping...")
-            else:
-                raise
-        except ValueError as e:
-            if "bad game data" in str(e).lower():
-                print("Bad game data. Skipping...")
-            else:
-                raise
+    games = select_games(mappings, games_folder, known, league, year)
+    processed, skipped = 0, Counter({"already ingested": len(mappings) - len(games)})
+    for i, (mapping, fingerprint) in enumerate(games):
+        print(f"{i} of {len(games)}: ", end="")
+        with telemetry.span("ingest_game", league=league, year=year, game=mapping.platform_game_id) as span:
+            game_summary, reason = summarize_game(games_folder, mapping, league, year)
+            span.set(skipped=reason)
+            record_game(mapping, fingerprint, game_summary, reason, league, year, writer, manifest)
+        if game_summary is not None:
+            processed += 1
+        else:
+            skipped[reason] += 1
         print("---")
+    print_summary(league, year, processed, +skipped, time.time() - start_time)
+    return processed, +skipped
+
+
+def process_league_files_parallel(
+    league: str,
+    year: int | None,
+    writer: BufferedTableWriter,
+    manifest: ManifestWriter,
+    known: Dict[int, Tuple[int, int] | None] | None = None,
+    workers: int | None = None,
+    ordered: bool = True,
+    trace_file: str | None = None,
+) -> Tuple[int, Counter]:
+    """Parses and summarizes the games in a pool of processes and writes the summaries from this process.
+
+    Args:
+        workers (int | None): The number of worker processes, defaults to the number of CPUs.
+        ordered (bool): Write the summaries in the mapping order, otherwise as soon as each game completes.
+        trace_file (str | None): The JSONL file the workers append the spans of their stages to.
+    """
+    start_time = time.time()
+    mapping_file = f"{RAW_DIR}/{league}/esports-data/mapping_data.json"
+    games_folder = f"{RAW_DIR}/{league}/games/{year}"
+    mappings = get_game_mappings(mapping_file)
+    games = select_games(mappings, games_folder, known, league, year)
+    processed, skipped = 0, Counter({"already ingested": len(mappings) - len(games)})
+    # polars is not fork-safe once its thread pool is running, so the workers are spawned
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(trace_file,),
+    ) as executor:
+        futures = {
+            executor.submit(summarize_game, games_folder, mapping, league, year): (mapping, fingerprint)
+            for mapping, fingerprint in games
+        }
+        for i, future in enumerate(futures if ordered else as_completed(futures)):
+            mapping, fingerprint = futures[future]
+            game_summary, reason = future.result()
+            status = f"skipped ({reason})" if game_summary is None else f"{len(game_summary)} rows"
+            print(f"{i + 1} of {len(games)}: {mapping.platform_game_id} {status}")
+            # the parse and aggregate spans of the game are recorded by the worker
+            with telemetry.span("ingest_game", league=league, year=year, game=mapping.platform_game_id) as span:
+                span.set(skipped=reason)
+                record_game(mapping, fingerprint, game_summary, reason, league, year, writer, manifest)
+            if game_summary is not None:
+                processed += 1
+            else:
+                skipped[reason] += 1
+    print_summary(league, year, processed, +skipped, time.time() - start_time)
+    return processed, +skipped
 
 
 def process_game_file(games_folder: str, mapping: GameMapping, league: str, year: str) -> pl.DataFrame:
-    game_file = f"{games_folder}/{mapping.platform_game_id}.json"
-    print(f"{game_file}")
-    events = get_game_events(game_file)
-    game_stats = get_game_stats(events, mapping)
-    q = (
-        game_stats.lazy()
-        .group_by("tournament_id", "esports_game_id", "team_id", "team_mode", "player_id")
-        .agg([pl.sum("damage_dealt"), pl.sum("damage_taken"), pl.sum("players_killed")])
-        .sort(["damage_dealt"])
-    )
-    game_summary = q.collect()
-    print(
-        f"Extracted events: {len(events)}, game stats rows: {len(game_stats)}, game summary rows: {len(game_summary)}"
-    )
+    game_file = get_game_file(games_folder, mapping)
+    event_file = get_event_file(league, year, mapping.platform_game_id)
+    # the JSON game file is parsed once, into the event file the stats are read from
+    with telemetry.span("ingest_parse", game=mapping.platform_game_id) as span:
+        staged = stage_game_file(game_file, event_file)
+        span.set(staged=staged)
+    if staged:
+        print(f"{game_file} -> {event_file}")
+    else:
+        print(f"{event_file}")
+    with telemetry.span("ingest_aggregate", game=mapping.platform_game_id) as span:
+        game_summary, num_events = summarize_game_events(event_file, mapping)
+        span.set(events=num_events, rows=len(game_summary))
+    print(f"Extracted events: {num_events}, game summary rows: {len(game_summary)}")
     if len(game_summary) != 20:
         print(game_summary)
         raise ValueError(f"Bad game data. Expected summary len = 20, but got {len(game_summary)}")
@@ -75,9 +253,59 @@ def process_game_file(games_folder: str, mapping: GameMapping, league: str, year
 
 
 def main():
-    for league in LEAGUES:
-        for year in YEARS:
-            process_league_files(league, year)
+    parser = argparse.ArgumentParser(description="Parse, summarize and write the game stats.")
+    parser.add_argument("--leagues", nargs="+", default=LEAGUES)
+    parser.add_argument("--years", nargs="+", type=int, default=YEARS)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes, 0 for one per CPU")
+    parser.add_argument("--unordered", action="store_true", help="write summaries as soon as each game completes")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="commit every N rows")
+    parser.add_argument("--batch-seconds", type=float, default=DEFAULT_BATCH_SECONDS, help="or every T seconds")
+    parser.add_argument("--full", action="store_true", help="re-parse all games, not only new or changed files")
+    parser.add_argument(
+        "--cluster", action="store_true", help="sort each commit by player id, see also optimize.py --cluster-by"
+    )
+    parser.add_argument("--trace-file", help="JSONL file to append the spans of each game and stage to")
+    args = parser.parse_args()
+
+    telemetry.configure(args.trace_file)
+    version = get_table_stats_version(STATS_DIR)
+    if version not in (None, STATS_VERSION):
+        parser.error(f"the {STATS_DIR} table has schema v{version}, migrate it first with scripts/migrate.py")
+
+    known = None if args.full else get_known_games(STATS_DIR)
+    with (
+        ManifestWriter() as manifest,
+        BufferedTableWriter(
+            STATS_DIR,
+            PARTITION_BY,
+            args.batch_rows,
+            args.batch_seconds,
+            merge_on=MERGE_ON,
+            on_flush=manifest.flush,
+            cluster_by=CLUSTER_BY if args.cluster else None,
+            compression=STATS_COMPRESSION,
+        ) as writer,
+    ):
+        for league in args.leagues:
+            for year in args.years:
+                if args.workers == 1:
+                    process_league_files(league, year, writer, manifest, known)
+                else:
+                    process_league_files_parallel(
+                        league,
+                        year,
+                        writer,
+                        manifest,
+                        known,
+                        args.workers or None,
+                        not args.unordered,
+                        args.trace_file,
+                    )
+    print(f"Wrote {writer.rows_written} rows in {writer.commits} commits")
+    if manifest.ingested_game_ids:
+        with telemetry.span("refresh_aggregates", games=len(manifest.ingested_game_ids)):
+            refresh_player_aggregates(manifest.ingested_game_ids)
+    print_stages()
 
 
 if __name__ == "__main__":
@@ -1,43 +1,274 @@
-from typing import List
+import asyncio
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
 
 from llama_index.core import Settings
 from llama_index.core.agent import ReActAgent
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+from llama_index.core.llms import LLM, ChatMessage, ChatResponse, CompletionResponse
 from llama_index.core.tools import FunctionTool
 from llama_index.llms.bedrock import Bedrock
 
+from helpers.mirror import DEFAULT_MIRROR_MAX_BYTES, TableMirror
+from helpers.telemetry import telemetry
+from helpers.throttling import (
+    DEFAULT_PRIORITY,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    ThrottledLLM,
+    llm_priority,
+)
+from router import route_prompt
 from tools import initialize_tools, warm_up_tools
 
 DEFAULT_MODEL = "mistral.mistral-large-2407-v1:0"
 DEFAULT_CONTEXT_SIZE = 2000
 DEFAULT_REGION = "us-west-2"
+DEFAULT_POOL_SIZE = 4
+# initial guess of the duration of a run, used to estimate the wait time until the first runs complete
+DEFAULT_RUN_SECONDS = 30.0
+# longest text of a reasoning step or tool output shown while streaming
+STEP_PREVIEW_CHARS = 500
+
+TEAM_INSTRUCTIONS = """
+        Use provided tools to get the list of up to 10 players in the specified league,
+        and optionally check their region if requested to do so.
+        If the league is not specified, then leave it null to combine the list from all available leagues.
+        Then rank the possible teams of the selected players with get_best_teams,
+        finally choose one of the top teams of exactly 5 players and justify the choice with its stats.
+        Retrieve the selected players' stats data only if needed to assign the roles.
+        Use Valorant game terminology and definitions when assigning roles.
+        """
+
+
+class AsyncBedrock(Bedrock):
+    """Bedrock LLM whose async calls run the blocking boto3 requests in the default executor.
+
+    `Bedrock.achat` calls the sync `chat`, which would block the event loop of `amake_team`.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AsyncBedrock"
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await asyncio.to_thread(self.complete, prompt, formatted=formatted, **kwargs)
 
 
 class TeamManager:
     agent: ReActAgent
+    llm: LLM
     tools: List[FunctionTool]
 
     def __init__(
-        self, model: str = DEFAULT_MODEL, context_size: int = DEFAULT_CONTEXT_SIZE, region: str = DEFAULT_REGION
+        self,
+        model: str = DEFAULT_MODEL,
+        context_size: int = DEFAULT_CONTEXT_SIZE,
+        region: str = DEFAULT_REGION,
+        llm: LLM | None = None,
+        compact_tools: bool = True,
+        tools: List[FunctionTool] | None = None,
+        verbose: bool = True,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        fallback_model: str | None = None,
+        fallback_region: str | None = None,
+        snapshot_dir: str | None = None,
+        mirror_dir: str | None = None,
+        mirror_max_bytes: int = DEFAULT_MIRROR_MAX_BYTES,
+        route_prompts: bool = False,
     ):
-        # init global settings for LlamaIndex via Bedrock
-        Settings.llm = Bedrock(
-            model=model,
-            region_name=region,
-            context_size=context_size,
-        )
-        # init tools
-        self.tools = initialize_tools()
-        warm_up_tools()
-        self.agent = ReActAgent.from_tools(self.tools, verbose=True)
+        # init global settings for LlamaIndex via Bedrock, unless another LLM is given (e.g. a local stub).
+        # Bedrock requests are governed by ThrottledLLM, so the Bedrock client itself does not retry.
+        if llm is None:
+            fallbacks = []
+            if fallback_model or fallback_region:
+                fallbacks.append(
+                    AsyncBedrock(
+                        model=fallback_model or model,
+                        region_name=fallback_region or region,
+                        context_size=context_size,
+                        max_retries=1,
+                    )
+                )
+            llm = ThrottledLLM(
+                AsyncBedrock(model=model, region_name=region, context_size=context_size, max_retries=1),
+                fallbacks=fallbacks,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+            )
+        self.llm = llm
+        Settings.llm = self.llm
+        # init tools, unless shared with another manager
+        self.warm_up_timings: Dict[str, float] = {}
+        if tools is None:
+            tools = initialize_tools(compact=compact_tools)
+            mirror = TableMirror(mirror_dir, mirror_max_bytes) if mirror_dir else None
+            self.warm_up_timings = warm_up_tools(snapshot_dir, mirror)
+        self.tools = tools
+        self.route_prompts = route_prompts
+        self.agent = ReActAgent.from_tools(self.tools, llm=self.llm, verbose=verbose)
+
+    def extend_prompt(self, prompt: str) -> str:
+        """Extends the prompt with the instructions and prefetched data of its task, see `route_prompt`.
+
+        Prompts of unknown tasks, or all prompts if routing is disabled, are extended with the team instructions.
+        """
+        routed = route_prompt(prompt) if self.route_prompts else None
+        return routed or f"{prompt}{TEAM_INSTRUCTIONS}"
 
     def make_team(self, prompt: str) -> str:
-        self.agent.reset()
-        extended_prompt = f"""{prompt}
-        Use provided tools to get the list of up to 10 players in the specified league,
-        and optionally check their region if requested to do so.
-        If the league is not specified, then combine the list from all available leagues.
-        Then retrieve selected players' stats data,
-        finally make a selection of exactly 5 players.
-        Use Valorant game terminology and definitions when assigning roles.
+        with telemetry.span("make_team", mode="sync", prompt_chars=len(prompt)) as span:
+            self.agent.reset()
+            response = self.agent.chat(self.extend_prompt(prompt))
+            span.set(tool_calls=len(response.sources))
+            return response
+
+    def stream_team(self, prompt: str) -> Iterator[Tuple[str, str]]:
+        """Streaming `make_team`: yields the events of the run as they happen.
+
+        A `("step", text)` event describes each reasoning step and tool call with its duration, as soon as it
+        completes. The final answer then follows token by token as `("answer", token)` events.
         """
-        return self.agent.chat(extended_prompt)
+        with telemetry.span("make_team", mode="stream", prompt_chars=len(prompt)) as span:
+            start = time.perf_counter()
+            self.agent.reset()
+            task = self.agent.create_task(self.extend_prompt(prompt))
+            yield "step", f"Prepared the prompt in {time.perf_counter() - start:.2f}s"
+            reasoning = task.extra_state["current_reasoning"]
+            step = 0
+            while True:
+                start = time.perf_counter()
+                done = len(reasoning)
+                output = self.agent.stream_step(task.task_id)
+                step += 1
+                if output.is_last:
+                    break
+                contents = [_preview(reasoning_step.get_content()) for reasoning_step in reasoning[done:]]
+                yield "step", "\n".join([f"Step {step} ({time.perf_counter() - start:.2f}s):", *contents])
+            response = self.agent.finalize_response(task.task_id, output)
+            span.set(steps=step)
+            yield "step", f"Step {step} ({time.perf_counter() - start:.2f}s): answering"
+            if isinstance(response, StreamingAgentChatResponse):
+                for token in response.response_gen:
+                    yield "answer", token
+            else:
+                yield "answer", response.response
+
+    async def amake_team(self, prompt: str) -> str:
+        """Async `make_team`: the LLM calls do not block the event loop and the tools run in the default executor.
+
+        Without a league, the tools query all leagues at the same time.
+        """
+        with telemetry.span("make_team", mode="async", prompt_chars=len(prompt)) as span:
+            self.agent.reset()
+            response = await self.agent.achat(await asyncio.to_thread(self.extend_prompt, prompt))
+            span.set(tool_calls=len(response.sources))
+            return response
+
+
+def _preview(text: str) -> str:
+    return text if len(text) <= STEP_PREVIEW_CHARS else f"{text[:STEP_PREVIEW_CHARS]}..."
+
+
+class AgentPool:
+    """Bounded pool of `TeamManager` agents serving concurrent requests.
+
+    The agents share the LLM client, the tools and the tools' data caches, but each keeps its own memory,
+    so concurrent requests never see each other's conversation.
+
+    Args:
+        size (int): The number of agents, i.e. how many requests run at the same time.
+        **kwargs: The arguments of the first `TeamManager`, whose LLM and tools are shared with the others.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, **kwargs):
+        self.size = size
+        first = TeamManager(**kwargs)
+        self.llm = first.llm
+        self.warm_up_timings = first.warm_up_timings
+        self._idle: queue.Queue[TeamManager] = queue.Queue()
+        self._idle.put(first)
+        for _ in range(size - 1):
+            self._idle.put(
+                TeamManager(
+                    llm=first.llm,
+                    tools=first.tools,
+                    verbose=kwargs.get("verbose", True),
+                    route_prompts=kwargs.get("route_prompts", False),
+                )
+            )
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._busy = 0
+        self._run_seconds: float | None = None
+
+    def estimated_wait(self) -> float:
+        """Estimates how many seconds a new request waits for an agent, from the recent run durations."""
+        with self._lock:
+            if self._busy + self._waiting < self.size:
+                return 0.0
+            return (self._waiting // self.size + 1) * (self._run_seconds or DEFAULT_RUN_SECONDS)
+
+    @contextmanager
+    def acquire(self, timeout: float | None = None) -> Iterator[TeamManager]:
+        """Borrows an idle agent, waiting up to `timeout` seconds (raises `queue.Empty` on timeout)."""
+        with self._lock:
+            self._waiting += 1
+        try:
+            manager = self._idle.get(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._busy += 1
+        start = time.monotonic()
+        try:
+            yield manager
+        finally:
+            with self._lock:
+                self._busy -= 1
+                # moving average of the run durations
+                elapsed = time.monotonic() - start
+                self._run_seconds = elapsed if self._run_seconds is None else 0.8 * self._run_seconds + 0.2 * elapsed
+            self._idle.put(manager)
+
+    def llm_stats(self) -> Dict[str, float]:
+        """Returns the metrics of the shared LLM, if it is governed by `ThrottledLLM`."""
+        return self.llm.stats() if isinstance(self.llm, ThrottledLLM) else {}
+
+    def make_team(self, prompt: str, timeout: float | None = None, priority: int = DEFAULT_PRIORITY) -> str:
+        with self.acquire(timeout) as manager, llm_priority(priority):
+            return str(manager.make_team(prompt))
+
+    def stream_team(
+        self, prompt: str, timeout: float | None = None, priority: int = DEFAULT_PRIORITY
+    ) -> Iterator[Tuple[str, str]]:
+        """Streams the events of `TeamManager.stream_team` from a pooled agent.
+
+        The agent runs in its own thread and hands the events over through a queue, so the generator can be
+        consumed from any thread, e.g. by Gradio, while the session priority applies to all of its LLM calls.
+        """
+        events: queue.Queue[Tuple[str, Any] | None] = queue.Queue()
+
+        def run():
+            try:
+                with self.acquire(timeout) as manager, llm_priority(priority):
+                    for event in manager.stream_team(prompt):
+                        events.put(event)
+            except Exception as e:
+                events.put(("error", e))
+            finally:
+                events.put(None)
+
+        threading.Thread(target=run, daemon=True).start()
+        while (event := events.get()) is not None:
+            if event[0] == "error":
+                raise event[1]
+            yield event
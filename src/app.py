@@ -1,7 +1,14 @@
-import gradio as gr
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
 from dotenv import load_dotenv
 
-from agent import TeamManager
+from helpers.telemetry import telemetry
+
+# gradio, llama_index and polars are imported when needed, so that the agents warm up while the UI loads
 
 DEFAULT_PROMPT = """
 Build a team using only players from VCT Game Changers.
@@ -9,31 +16,185 @@ Assign roles to each player and explain why this composition
 would be effective in a competitive match.
 """
 
-manager: TeamManager = None
-num_calls: int = 100
+DEFAULT_POOL_SIZE = 4
+# requests waiting in the Gradio queue on top of the running ones
+DEFAULT_MAX_QUEUE = 20
+# seconds a request waits for the agents to warm up
+DEFAULT_WARM_UP_TIMEOUT = 300.0
 
+STARTED_AT = time.perf_counter()
 
-def run_task(prompt: str) -> str:
-    global num_calls
-    num_calls -= 1
-    if num_calls <= 0:
+
+class Quota:
+    """Thread-safe counter of the remaining runs."""
+
+    def __init__(self, num_calls: int):
+        self.num_calls = num_calls
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            self.num_calls -= 1
+            return self.num_calls > 0
+
+
+class StartupPhases:
+    """Records when each startup phase started and how long it took, phases may run at the same time."""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, seconds: float):
+        with self._lock:
+            self.phases.append((name, start - STARTED_AT, seconds))
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter() - start)
+
+    def report(self, title: str):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        lines = [f"  +{offset:6.2f}s {seconds:6.2f}s  {name}" for name, offset, seconds in phases]
+        print(f"{title} after {time.perf_counter() - STARTED_AT:.2f}s:", *lines, sep="\n", flush=True)
+
+
+pool = None
+pool_ready = threading.Event()
+quota = Quota(100)
+startup = StartupPhases()
+
+
+def start_agents(pool_size: int, stub_llm: bool = False, **kwargs):
+    """Creates the agent pool, warming up the tools."""
+    global pool
+    try:
+        with startup.measure("import agents"):
+            from agent import AgentPool
+        if stub_llm:
+            from helpers.stub_llm import ScriptedLLM
+
+            kwargs["llm"] = ScriptedLLM(latency=1.0, token_latency=0.05)
+        start = time.perf_counter()
+        with startup.measure("warm up agents"):
+            pool = AgentPool(pool_size, **kwargs)
+        for name, seconds in pool.warm_up_timings.items():
+            startup.add(f"warm up agents: {name}", start, seconds)
+    except Exception as e:
+        print(f"Failed to start the agents: {e}")
+    finally:
+        pool_ready.set()
+    startup.report("agents ready")
+
+
+def _prepare_run() -> str | None:
+    """Waits for the agents to be ready, returning a message to show instead of running the task, if any."""
+    import gradio as gr
+
+    if not quota.take():
         return "Number of runs exceeded. Please contact developer."
-    if manager:
-        return manager.make_team(prompt)
-    return "Cannot execute prompt. Please try again later."
+    if not pool_ready.is_set():
+        gr.Info("The agents are warming up, your request will start shortly.")
+        pool_ready.wait(DEFAULT_WARM_UP_TIMEOUT)
+    if not pool:
+        return "Cannot execute prompt. Please try again later."
+    wait = pool.estimated_wait()
+    if wait:
+        gr.Info(f"All agents are busy, your request will start in about {wait:.0f} seconds.")
+    return None
+
+
+def _on_error(error: Exception) -> str:
+    from helpers.throttling import is_throttling
+
+    if not is_throttling(error):
+        raise error
+    print(f"request throttled: {error}, LLM stats: {pool.llm_stats()}")
+    return "The model is overloaded. Please try again in a minute."
+
+
+def run_task(prompt: str) -> str:
+    message = _prepare_run()
+    if message:
+        return message
+    try:
+        return pool.make_team(prompt)
+    except Exception as e:
+        return _on_error(e)
+
+
+def stream_task(prompt: str) -> Iterator[str]:
+    """Streams the steps of the run as they complete, then the final answer token by token."""
+    message = _prepare_run()
+    if message:
+        yield message
+        return
+    steps, answer = [], ""
+    try:
+        for kind, text in pool.stream_team(prompt):
+            if kind == "step":
+                steps.append(text)
+            else:
+                answer += text
+            yield "\n\n".join(steps + ([f"Answer:\n{answer}"] if answer else []))
+    except Exception as e:
+        yield "\n\n".join(steps + [answer, _on_error(e)])
 
 
 def main():
-    global manager
-    manager = TeamManager()
+    parser = argparse.ArgumentParser(description="Run the team manager app.")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="number of concurrent agents")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="number of waiting requests")
+    parser.add_argument("--stub-llm", action="store_true", help="use a local stub instead of Bedrock")
+    parser.add_argument("--stream", action="store_true", help="stream the agent steps and the answer")
+    parser.add_argument("--route-prompts", action="store_true", help="prefetch the tool data of known tasks")
+    parser.add_argument("--requests-per-minute", type=float, help="Bedrock quota")
+    parser.add_argument("--tokens-per-minute", type=float, help="Bedrock quota")
+    parser.add_argument("--fallback-model", help="Bedrock model to fail over to when throttled")
+    parser.add_argument("--fallback-region", help="AWS region to fail over to when throttled")
+    parser.add_argument("--snapshot-dir", help="local directory to snapshot the tool data in, e.g. data/snapshot")
+    parser.add_argument("--mirror-dir", help="local directory to mirror the Delta tables in, e.g. data/mirror")
+    parser.add_argument("--mirror-max-gb", type=float, help="maximum size of the mirrored data files")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port, e.g. 9464")
+    parser.add_argument("--trace-file", help="JSONL file to append the spans of the runs to, e.g. traces.jsonl")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0, help="fraction of the runs to trace")
+    args = parser.parse_args()
+
+    telemetry.configure(args.trace_file, args.trace_sample_rate)
+    if args.metrics_port:
+        telemetry.serve_metrics(args.metrics_port)
 
-    with gr.Blocks(analytics_enabled=False) as demo:
-        llm_input = gr.Text(value=DEFAULT_PROMPT, label="Prompt")
-        run_task_button = gr.Button("Run Task")
-        llm_output = gr.Textbox(label="Task Results")
-        run_task_button.click(run_task, inputs=llm_input, outputs=llm_output)
+    options = {
+        "requests_per_minute": args.requests_per_minute,
+        "tokens_per_minute": args.tokens_per_minute,
+        "fallback_model": args.fallback_model,
+        "fallback_region": args.fallback_region,
+        "snapshot_dir": args.snapshot_dir,
+        "mirror_dir": args.mirror_dir,
+        "mirror_max_bytes": args.mirror_max_gb and int(args.mirror_max_gb * 1024**3),
+        "route_prompts": args.route_prompts,
+    }
+    options = {name: value for name, value in options.items() if value is not None}
+    threading.Thread(target=start_agents, args=(args.pool_size, args.stub_llm), kwargs=options, daemon=True).start()
 
-    demo.launch(server_name="0.0.0.0", server_port=8080)
+    with startup.measure("import gradio"):
+        import gradio as gr
+    with startup.measure("build UI"):
+        with gr.Blocks(analytics_enabled=False) as demo:
+            llm_input = gr.Text(value=DEFAULT_PROMPT, label="Prompt")
+            run_task_button = gr.Button("Run Task")
+            llm_output = gr.Textbox(label="Task Results")
+            run_task_button.click(stream_task if args.stream else run_task, inputs=llm_input, outputs=llm_output)
+        demo.queue(default_concurrency_limit=args.pool_size, max_size=args.max_queue)
+    with startup.measure("launch server"):
+        demo.launch(server_name="0.0.0.0", server_port=8080, prevent_thread_lock=True)
+    startup.report("accepting requests")
+    demo.block_thread()
 
 
 if __name__ == "__main__":
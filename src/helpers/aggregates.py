@@ -0,0 +1,61 @@
+from typing import Iterable
+
+import polars as pl
+from deltalake import DeltaTable
+
+from helpers.schema import read_stats
+from helpers.storage import get_table_location
+from helpers.tables import BufferedTableWriter
+
+DELTA_DIR = "data/delta"
+STATS_DIR = f"{DELTA_DIR}/game_stats"
+AGGREGATES_DIR = f"{DELTA_DIR}/player_stats"
+
+PARTITION_BY = ["league_alias", "year"]
+AGGREGATE_KEYS = PARTITION_BY + ["player_id"]
+METRICS = {"damage_dealt": "damage_dealt", "damage_taken": "damage_taken", "players_killed": "kills"}
+TEAM_MODES = {"A": "attack", "D": "defend"}
+
+
+def aggregate_player_stats(game_stats: pl.LazyFrame) -> pl.LazyFrame:
+    """Summarizes the per-game stats into one row per player, league and year.
+
+    The metrics are averaged per game played, overall and split by attacking/defending team.
+    """
+    games_played = pl.col("esports_game_id").n_unique()
+    per_game = [(pl.sum(column) / games_played).alias(f"{name}_per_game") for column, name in METRICS.items()]
+    per_mode = [
+        (pl.col(column).filter(pl.col("team_mode") == mode).sum() / games_played).alias(f"{prefix}_{name}_per_game")
+        for mode, prefix in TEAM_MODES.items()
+        for column, name in METRICS.items()
+    ]
+    return game_stats.group_by(AGGREGATE_KEYS).agg(
+        games_played.cast(pl.Int32).alias("games_played"), *per_game, *per_mode
+    )
+
+
+def refresh_player_aggregates(game_ids: Iterable[int] | None = None):
+    """Refreshes the player aggregates table from the game stats table.
+
+    Args:
+        game_ids (Iterable[int] | None): The games ingested since the last refresh. Only the players of these
+            games are re-aggregated and merged into the table. If None, the whole table is rebuilt.
+    """
+    stats_path, stats_options = get_table_location(STATS_DIR)
+    game_stats = read_stats(pl.scan_delta(stats_path, storage_options=stats_options))
+    aggregates_path, aggregates_options = get_table_location(AGGREGATES_DIR)
+
+    if game_ids is None or not DeltaTable.is_deltatable(aggregates_path, storage_options=aggregates_options):
+        print(f"Rebuilding {aggregates_path} table...")
+        aggregate_player_stats(game_stats).collect().write_delta(
+            aggregates_path,
+            mode="overwrite",
+            storage_options=aggregates_options,
+            delta_write_options={"partition_by": PARTITION_BY},
+        )
+        return
+
+    touched = game_stats.filter(pl.col("esports_game_id").is_in(list(game_ids))).select(AGGREGATE_KEYS).unique()
+    aggregates = aggregate_player_stats(game_stats.join(touched, on=AGGREGATE_KEYS, how="semi")).collect()
+    with BufferedTableWriter(AGGREGATES_DIR, PARTITION_BY, merge_on=AGGREGATE_KEYS) as writer:
+        writer.write(aggregates)
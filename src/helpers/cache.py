@@ -0,0 +1,188 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from helpers.tables import get_table_version
+from helpers.telemetry import telemetry
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 15 * 60.0
+DEFAULT_PROBE_SECONDS = 30.0
+
+
+def estimate_size(value: Any) -> int:
+    """Estimates the memory held by a cached value (DataFrames, NumPy arrays, lists of ids, ...)."""
+    if hasattr(value, "estimated_size"):
+        return int(value.estimated_size())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def default_key(*args, **kwargs) -> Hashable:
+    normalize = lambda value: tuple(value) if isinstance(value, (list, set)) else value  # noqa: E731
+    return tuple(normalize(arg) for arg in args) + tuple(sorted((k, normalize(v)) for k, v in kwargs.items()))
+
+
+class TableVersionProbe:
+    """Tracks the versions of Delta tables, probing them at most every `interval` seconds.
+
+    The probe runs lazily when versions are requested, or periodically in a background thread after `start`.
+    """
+
+    def __init__(
+        self, interval: float = DEFAULT_PROBE_SECONDS, version_fn: Callable[[str], int | None] = get_table_version
+    ):
+        self.interval = interval
+        self.version_fn = version_fn
+        self._versions: Dict[str, int | None] = {}
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def versions(self, tables: List[str]) -> Tuple[int | None, ...]:
+        with self._lock:
+            missing = [table for table in tables if table not in self._versions]
+            if missing or time.monotonic() - self._probed_at >= self.interval:
+                self._probe(set(self._versions) | set(missing))
+            return tuple(self._versions[table] for table in tables)
+
+    def refresh(self):
+        with self._lock:
+            self._probe(set(self._versions))
+
+    def _probe(self, tables):
+        # each probe reads the table log, so the tables are probed at the same time
+        tables = list(tables)
+        with ThreadPoolExecutor(max_workers=max(1, len(tables))) as executor:
+            self._versions.update(zip(tables, executor.map(self.version_fn, tables)))
+        self._probed_at = time.monotonic()
+
+    def start(self):
+        """Starts probing in a daemon thread, so that requests do not wait for the probe."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"table version probe failed: {e}")
+
+        self._thread = threading.Thread(target=run, name="table-version-probe", daemon=True)
+        self._thread.start()
+
+
+def _record_lookup(key: Hashable, result: str):
+    # the keys of `QueryCache.cached` start with the function name
+    telemetry.count("query_cache_lookups_total", fn=key[0] if isinstance(key, tuple) else "", result=result)
+    span = telemetry.current_span()
+    if span is not None:
+        span.add(f"cache_{result}s")
+
+
+class _Entry:
+    __slots__ = ("value", "size", "versions", "expires_at")
+
+    def __init__(self, value: Any, size: int, versions: Tuple, expires_at: float):
+        self.value, self.size, self.versions, self.expires_at = value, size, versions, expires_at
+
+
+class QueryCache:
+    """Memory-bounded LRU cache with TTL for query results, invalidated by new commits to the source tables.
+
+    Each entry records the versions of the tables it was computed from. A lookup only hits if the entry
+    has not expired and the tables are still at the same versions.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        probe: TableVersionProbe | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.probe = probe or TableVersionProbe()
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, tables: List[str], compute: Callable[[], Any], ttl: float | None = None):
+        versions = self.probe.versions(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.versions == versions and time.monotonic() < entry.expires_at:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    _record_lookup(key, "hit")
+                    return entry.value
+                self.invalidations += 1
+                self._remove(key)
+            self.misses += 1
+        _record_lookup(key, "miss")
+        value = compute()
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            ttl = self.ttl_seconds if ttl is None else ttl
+            self._entries[key] = _Entry(value, size, versions, time.monotonic() + ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def _remove(self, key: Hashable):
+        self.size -= self._entries.pop(key).size
+
+    def clear(self, prefix: Hashable | None = None):
+        """Drops all entries, or only those of the function with the `prefix` name."""
+        with self._lock:
+            for key in [key for key in self._entries if prefix is None or key[0] == prefix]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def cached(self, tables: List[str], key: Callable[..., Hashable] = default_key, ttl: float | None = None):
+        """Decorates a function whose result depends on the given tables.
+
+        Args:
+            tables (List[str]): The table directories the result is computed from.
+            key (Callable[..., Hashable]): Normalizes the call arguments into the cache key.
+            ttl (float | None): The time to live of the results, defaults to the cache TTL.
+        """
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                return self.get_or_compute(
+                    (fn.__name__, key(*args, **kwargs)), tables, lambda: fn(*args, **kwargs), ttl
+                )
+
+            wrapper.cache_clear = lambda: self.clear(fn.__name__)
+            return wrapper
+
+        return decorator
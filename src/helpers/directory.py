@@ -0,0 +1,88 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import polars as pl
+
+
+def _frozen(values) -> np.ndarray:
+    array = np.unique(np.asarray(values, dtype=np.uint64))
+    array.setflags(write=False)
+    return array
+
+
+class PlayerDirectory:
+    """Immutable in-memory index of the player ids by league and region.
+
+    Args:
+        league_players (pl.DataFrame): The `league_alias` and `player_id` of the players in each league.
+        player_regions (pl.DataFrame): The `league_region` and `player_id` of the players in each region.
+        version (Tuple): The version of the source tables, used to detect when the directory is stale.
+    """
+
+    def __init__(self, league_players: pl.DataFrame, player_regions: pl.DataFrame, version: Tuple):
+        self.version = version
+        self._leagues: Dict[str, np.ndarray] = {
+            league: _frozen(players["player_id"])
+            for (league,), players in league_players.partition_by("league_alias", as_dict=True).items()
+        }
+        self._regions: Dict[str, np.ndarray] = {
+            region: _frozen(players["player_id"])
+            for (region,), players in player_regions.drop_nulls("league_region")
+            .partition_by("league_region", as_dict=True)
+            .items()
+        }
+        self._league_regions: Dict[Tuple[str, str], np.ndarray] = {
+            (league, region): _frozen(np.intersect1d(league_ids, region_ids, assume_unique=True))
+            for league, league_ids in self._leagues.items()
+            for region, region_ids in self._regions.items()
+        }
+        # players of any league, in total (keyed by None) and per region
+        all_players = _frozen(np.concatenate([_frozen([]), *self._leagues.values()]))
+        self._any_league: Dict[str | None, np.ndarray] = {None: all_players}
+        for region, region_ids in self._regions.items():
+            self._any_league[region] = _frozen(np.intersect1d(all_players, region_ids, assume_unique=True))
+        # hash index, a player may be listed in more than one region
+        self._player_regions: Dict[int, Tuple[str, ...]] = {}
+        for region, player_id in player_regions.select("league_region", "player_id").iter_rows():
+            self._player_regions[player_id] = self._player_regions.get(player_id, ()) + (region,)
+
+    def estimated_size(self) -> int:
+        arrays = [*self._leagues.values(), *self._regions.values(), *self._league_regions.values()]
+        arrays += list(self._any_league.values())
+        # a dict entry with an int key and a tuple value takes roughly 200 bytes
+        return sum(array.nbytes for array in arrays) + 200 * len(self._player_regions)
+
+    @property
+    def leagues(self) -> List[str]:
+        return sorted(self._leagues)
+
+    @property
+    def regions(self) -> List[str]:
+        return sorted(self._regions)
+
+    def players(self, league: str | None, region: str | None = None) -> np.ndarray:
+        """Returns the sorted ids of the players in the league, or in any league if None, optionally in the region."""
+        if league is None:
+            return self._any_league.get(region, _frozen([]))
+        if region is None:
+            return self._leagues.get(league, _frozen([]))
+        return self._league_regions.get((league, region), _frozen([]))
+
+    def sample(
+        self, league: str | None, num_players: int, region: str | None = None, seed: int | None = None
+    ) -> np.ndarray:
+        """Samples `num_players` distinct players of the league, or of any league if None, and of the region.
+
+        The sample is reproducible if a seed is given.
+        """
+        players = self.players(league, region)
+        if len(players) < num_players:
+            raise ValueError(f"Not enough players: {len(players)} available, {num_players} requested.")
+        return np.random.default_rng(seed).choice(players, size=num_players, replace=False)
+
+    def get_regions(self, player_ids: List[int]) -> pl.DataFrame:
+        """Looks up the regions of the players, with a null region for unknown players."""
+        rows = [
+            (player_id, region) for player_id in player_ids for region in self._player_regions.get(player_id, (None,))
+        ]
+        return pl.DataFrame(rows, schema={"player_id": pl.UInt64, "league_region": pl.String}, orient="row")
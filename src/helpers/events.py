@@ -0,0 +1,101 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List
+
+import polars as pl
+
+from helpers.parsers import iter_raw_game_events
+
+EVENTS_DIR = "data/events"
+
+# one row per event: the fields of the damage events are flattened, the other fields are kept in `payload`
+EVENT_SCHEMA = {
+    "platform_game_id": pl.String,
+    "seq_num": pl.Int64,
+    "event": pl.String,
+    "round_num": pl.Int32,
+    "causer": pl.Int32,
+    "victim": pl.Int32,
+    "damage": pl.Float64,
+    "killed": pl.Boolean,
+    "payload": pl.Binary,
+}
+# payload fields flattened into columns, per event type
+FLATTENED_FIELDS = {"damageEvent": {"causerId", "victimId", "damageDealt"}}
+COMPRESSION_LEVEL = 6
+
+
+def get_event_file(league: str, year: int, platform_game_id: str, events_dir: str = EVENTS_DIR) -> str:
+    """Returns the Parquet file of the events of a game, partitioned like the stats tables."""
+    return f"{events_dir}/league_alias={league}/year={year}/{platform_game_id}.parquet"
+
+
+def is_staged(game_file: str, event_file: str) -> bool:
+    """Tells if the events of the game file are in the event file, which is the case if the game file was deleted."""
+    if not os.path.isfile(event_file):
+        return False
+    return not os.path.isfile(game_file) or os.path.getmtime(game_file) <= os.path.getmtime(event_file)
+
+
+def _encode_payload(name: str, payload: Dict[Any, Any]) -> bytes | None:
+    remaining = {key: value for key, value in payload.items() if key not in FLATTENED_FIELDS.get(name, ())}
+    if not remaining:
+        return None
+    return json.dumps(remaining, separators=(",", ":")).encode()
+
+
+def convert_game_file(game_file: str, event_file: str) -> int:
+    """Converts a JSON game file into a compressed Parquet event file, written atomically.
+
+    Returns:
+        int: The number of events.
+    """
+    platform_game_id = os.path.basename(event_file).removesuffix(".parquet")
+    columns: Dict[str, List[Any]] = {column: [] for column in EVENT_SCHEMA if column != "platform_game_id"}
+    for name, metadata, payload in iter_raw_game_events(game_file, None):
+        columns["seq_num"].append(metadata.get("sequenceNumber"))
+        columns["event"].append(name)
+        columns["round_num"].append(metadata.get("currentGamePhase", {}).get("roundNumber"))
+        is_damage = name == "damageEvent"
+        columns["causer"].append(payload.get("causerId", {}).get("value") if is_damage else None)
+        columns["victim"].append(payload.get("victimId", {}).get("value") if is_damage else None)
+        columns["damage"].append(payload.get("damageDealt") if is_damage else None)
+        columns["killed"].append(bool(payload.get("killEvent")) if is_damage else None)
+        columns["payload"].append(_encode_payload(name, payload))
+    events = pl.DataFrame(columns, schema={column: EVENT_SCHEMA[column] for column in columns}).select(
+        pl.lit(platform_game_id).alias("platform_game_id"), pl.all()
+    )
+    os.makedirs(os.path.dirname(event_file), exist_ok=True)
+    events.write_parquet(f"{event_file}.part", compression="zstd", compression_level=COMPRESSION_LEVEL)
+    os.replace(f"{event_file}.part", event_file)
+    return len(events)
+
+
+def stage_game_file(game_file: str, event_file: str) -> bool:
+    """Converts the game file unless it is already staged.
+
+    Returns:
+        bool: True if the game file was converted.
+    """
+    if is_staged(game_file, event_file):
+        return False
+    if not os.path.isfile(game_file):
+        raise FileNotFoundError(game_file)
+    convert_game_file(game_file, event_file)
+    return True
+
+
+def scan_game_events(events_dir: str = EVENTS_DIR) -> pl.LazyFrame:
+    """Scans the events of all games, with the `league_alias` and `year` partitions as columns.
+
+    Filters on the partitions, the game or the event type, and the selected columns, are pushed down to the scan.
+    """
+    return pl.scan_parquet(f"{events_dir}/**/*.parquet", hive_partitioning=True)
+
+
+def read_game_events(event_file: str, event_names: Iterable[str], columns: Iterable[str]) -> pl.DataFrame:
+    """Reads the events of the given types from an event file, with only the `event` column and the given columns."""
+    columns = [column for column in dict.fromkeys(columns) if column != "event"]
+    return (
+        pl.scan_parquet(event_file).filter(pl.col("event").is_in(list(event_names))).select("event", *columns).collect()
+    )
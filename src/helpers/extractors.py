@@ -0,0 +1,149 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import polars as pl
+
+from helpers.events import read_game_events
+from helpers.parsers import GameMapping, map_ids
+
+# the columns identifying a row of the game summaries, one per player and team mode
+SUMMARY_KEYS = ["tournament_id", "esports_game_id", "team_id", "team_mode", "player_id"]
+
+
+class MetricExtractor(ABC):
+    """Computes per-player metrics of a game from some event types.
+
+    Subclasses declare the event types they consume, the event columns they read (see `helpers.events.EVENT_SCHEMA`)
+    and the metric columns they produce. `extract` receives the events of its types only, and returns one row per
+    contribution with the `round_num`, the participant number `player` and the metric columns. The contributions
+    are summed per player and team mode, so an extractor can be run on a hand-made frame of events.
+    """
+
+    events: List[str] = []
+    fields: List[str] = []
+    columns: Dict[str, pl.DataType] = {}
+
+    @abstractmethod
+    def extract(self, events: pl.DataFrame) -> pl.DataFrame:
+        pass
+
+
+class DamageExtractor(MetricExtractor):
+    """Damage dealt, damage taken and kills: each damage event counts for its causer and for its victim."""
+
+    events = ["damageEvent"]
+    fields = ["round_num", "causer", "victim", "damage", "killed"]
+    columns = {"damage_dealt": pl.Int64, "damage_taken": pl.Int64, "players_killed": pl.Int64}
+
+    def extract(self, events: pl.DataFrame) -> pl.DataFrame:
+        if events["causer"].null_count():
+            raise KeyError("causerId")
+        damage = pl.col("damage").round().cast(pl.Int64)
+        zero = pl.lit(0, dtype=pl.Int64)
+        return pl.concat(
+            [
+                events.select(
+                    "round_num",
+                    pl.col("causer").alias("player"),
+                    damage.alias("damage_dealt"),
+                    zero.alias("damage_taken"),
+                    pl.col("killed").cast(pl.Int64).alias("players_killed"),
+                ),
+                events.select(
+                    "round_num",
+                    pl.col("victim").alias("player"),
+                    zero.alias("damage_dealt"),
+                    damage.alias("damage_taken"),
+                    zero.alias("players_killed"),
+                ),
+            ]
+        )
+
+
+# the extractors whose metrics make the game summaries, in the order of their columns
+EXTRACTORS: List[MetricExtractor] = [DamageExtractor()]
+
+
+def register_extractor(extractor: MetricExtractor) -> MetricExtractor:
+    """Adds the metrics of the extractor to the game summaries."""
+    produced = {column for registered in EXTRACTORS for column in registered.columns}
+    if produced & set(extractor.columns):
+        raise ValueError(f"Metric columns already produced: {', '.join(produced & set(extractor.columns))}")
+    EXTRACTORS.append(extractor)
+    return extractor
+
+
+def get_roster(configurations: pl.DataFrame, mapping: GameMapping) -> pl.DataFrame:
+    """Returns the team and team mode of each player in each round, from the payloads of the configuration events.
+
+    Only the first configuration event of each round is used.
+    """
+    rounds: Dict[str, List[int]] = {"round_num": [], "team_num": [], "attacking_team": [], "player_num": []}
+    seen_rounds = set()
+    for payload in map(json.loads, configurations["payload"]):
+        round_num = payload["spikeMode"]["currentRound"]
+        if round_num in seen_rounds:
+            continue
+        seen_rounds.add(round_num)
+        attacking_team = payload["spikeMode"]["attackingTeam"]["value"]
+        for team in payload["teams"]:
+            for player in team["playersInTeam"]:
+                rounds["round_num"].append(round_num)
+                rounds["team_num"].append(team["teamId"]["value"])
+                rounds["attacking_team"].append(attacking_team)
+                rounds["player_num"].append(player["value"])
+    return pl.DataFrame(rounds, schema=dict.fromkeys(rounds, pl.Int64)).select(
+        "round_num",
+        map_ids("team_num", mapping.team_mapping, "team_id"),
+        pl.when(pl.col("team_num") == pl.col("attacking_team"))
+        .then(pl.lit("A"))
+        .otherwise(pl.lit("D"))
+        .alias("team_mode"),
+        map_ids("player_num", mapping.participant_mapping, "player_id"),
+    )
+
+
+def summarize_game_events(
+    event_file: str, mapping: GameMapping, extractors: List[MetricExtractor] | None = None
+) -> Tuple[pl.DataFrame, int]:
+    """Summarizes the metrics of every extractor per player and team mode, in a single read of the event file.
+
+    The event file is read once, with only the event types and columns the extractors need, and each extractor
+    gets the events of its types.
+
+    Returns:
+        Tuple[pl.DataFrame, int]: The game summary and the number of events read.
+    """
+    extractors = EXTRACTORS if extractors is None else extractors
+    event_names = ["configuration"] + [name for extractor in extractors for name in extractor.events]
+    fields = ["payload"] + [field for extractor in extractors for field in extractor.fields]
+    events = read_game_events(event_file, event_names, fields)
+
+    roster = get_roster(events.filter(pl.col("event") == "configuration"), mapping)
+    metrics = {column: dtype for extractor in extractors for column, dtype in extractor.columns.items()}
+    contributions = pl.concat(
+        [
+            extractor.extract(events.filter(pl.col("event").is_in(extractor.events))).select(
+                pl.col("round_num").cast(pl.Int64),
+                map_ids("player", mapping.participant_mapping, "player_id"),
+                *(pl.col(column).cast(dtype) for column, dtype in extractor.columns.items()),
+            )
+            for extractor in extractors
+        ],
+        how="diagonal",
+    )
+    if roster["team_id"].null_count() or roster["player_id"].null_count() or contributions["player_id"].null_count():
+        raise ValueError("Bad game data. Unknown team or participant in game events.")
+    summary = (
+        roster.join(contributions, on=["round_num", "player_id"], how="inner")
+        .group_by("team_id", "team_mode", "player_id")
+        .agg(pl.col(column).sum().cast(dtype) for column, dtype in metrics.items())
+        .select(
+            pl.lit(mapping.tournament_id, dtype=pl.UInt64).alias("tournament_id"),
+            pl.lit(mapping.esports_game_id, dtype=pl.UInt64).alias("esports_game_id"),
+            pl.all(),
+        )
+        .sort("player_id", "team_mode")
+    )
+    return summary, len(events)
@@ -0,0 +1,104 @@
+import math
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Set, Tuple
+
+import polars as pl
+from deltalake import DeltaTable
+
+from helpers.parsers import GameMapping
+from helpers.storage import get_table_location
+from helpers.tables import BufferedTableWriter
+
+DELTA_DIR = "data/delta"
+MANIFEST_DIR = f"{DELTA_DIR}/ingest_manifest"
+
+INGESTED = "ingested"
+QUARANTINED = "quarantined"
+
+MANIFEST_SCHEMA = {
+    "esports_game_id": pl.UInt64,
+    "platform_game_id": pl.String,
+    "league_alias": pl.String,
+    "year": pl.Int32,
+    "file_size": pl.Int64,
+    "file_mtime_ns": pl.Int64,
+    "status": pl.String,
+    "reason": pl.String,
+    "updated_at": pl.Datetime("us", "UTC"),
+}
+
+
+def get_file_fingerprint(game_file: str) -> Tuple[int, int]:
+    """Returns the size and modification time of the file, used to detect new or changed game files."""
+    stat = os.stat(game_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_manifest(manifest_dir: str = MANIFEST_DIR) -> pl.DataFrame:
+    table_path, storage_options = get_table_location(manifest_dir)
+    if not DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        return pl.DataFrame(schema=MANIFEST_SCHEMA)
+    return pl.read_delta(table_path, storage_options=storage_options)
+
+
+def get_known_games(stats_dir: str, manifest_dir: str = MANIFEST_DIR) -> Dict[int, Tuple[int, int] | None]:
+    """Maps the ids of the games that were already ingested or quarantined to the fingerprint of their file.
+
+    Games found in the stats table without a manifest entry (ingested before the manifest existed)
+    map to None, so they are never re-parsed.
+    """
+    known: Dict[int, Tuple[int, int] | None] = {}
+    table_path, storage_options = get_table_location(stats_dir)
+    if DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        game_ids = pl.scan_delta(table_path, storage_options=storage_options).select("esports_game_id").unique()
+        known.update((game_id, None) for game_id in game_ids.collect()["esports_game_id"])
+    for game_id, file_size, file_mtime_ns in (
+        read_manifest(manifest_dir).select("esports_game_id", "file_size", "file_mtime_ns").iter_rows()
+    ):
+        known[game_id] = (file_size, file_mtime_ns)
+    return known
+
+
+def is_new_or_changed(known: Dict[int, Tuple[int, int] | None], game_id: int, fingerprint: Tuple[int, int]) -> bool:
+    if game_id not in known:
+        return True
+    return known[game_id] is not None and known[game_id] != fingerprint
+
+
+class ManifestWriter(BufferedTableWriter):
+    """Buffers manifest entries until `flush` is called explicitly.
+
+    Entries of ingested games must only be committed after their stats, so this writer is meant
+    to be flushed from the `on_flush` hook of the stats table writer.
+    """
+
+    def __init__(self, manifest_dir: str = MANIFEST_DIR):
+        super().__init__(manifest_dir, max_rows=sys.maxsize, max_seconds=math.inf, merge_on=["esports_game_id"])
+        self.ingested_game_ids: Set[int] = set()
+
+    def record(
+        self,
+        mapping: GameMapping,
+        league: str,
+        year: int,
+        fingerprint: Tuple[int, int],
+        status: str,
+        reason: str | None = None,
+    ):
+        file_size, file_mtime_ns = fingerprint
+        entry = {
+            "esports_game_id": mapping.esports_game_id,
+            "platform_game_id": mapping.platform_game_id,
+            "league_alias": league,
+            "year": year,
+            "file_size": file_size,
+            "file_mtime_ns": file_mtime_ns,
+            "status": status,
+            "reason": reason,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        self.write(pl.DataFrame([entry], schema=MANIFEST_SCHEMA))
+        if status == INGESTED:
+            self.ingested_game_ids.add(mapping.esports_game_id)
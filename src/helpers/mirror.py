@@ -0,0 +1,236 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+from urllib.parse import unquote
+
+from deltalake import DeltaTable
+
+from helpers.storage import get_table_location
+
+DEFAULT_MIRROR_MAX_BYTES = 2 * 1024**3
+LOG_DIR = "_delta_log"
+LAST_CHECKPOINT = "_last_checkpoint"
+FETCH_WORKERS = 8
+
+
+class LocalStore:
+    """Reads the files of a table in a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list(self, prefix: str, start_after: str = "") -> List[Tuple[str, int]]:
+        """Lists the files in the `prefix` directory whose names sort after `start_after`, with their sizes."""
+        directory = os.path.join(self.root, prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            (f"{prefix}/{entry.name}", entry.stat().st_size)
+            for entry in os.scandir(directory)
+            if entry.is_file() and entry.name > start_after
+        )
+
+    def fetch(self, key: str, path: str):
+        shutil.copyfile(os.path.join(self.root, key), path)
+
+
+class S3Store:
+    """Reads the files of a table in an S3 bucket, or in an S3-compatible server given by `AWS_ENDPOINT_URL`."""
+
+    def __init__(self, table_path: str, storage_options: Dict[str, str]):
+        import boto3
+
+        self.bucket, _, self.root = table_path.removeprefix("s3://").partition("/")
+        self.client = boto3.client(
+            "s3",
+            region_name=storage_options.get("AWS_REGION"),
+            aws_access_key_id=storage_options.get("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=storage_options.get("AWS_SECRET_ACCESS_KEY"),
+            endpoint_url=storage_options.get("AWS_ENDPOINT_URL"),
+        )
+
+    def list(self, prefix: str, start_after: str = "") -> List[Tuple[str, int]]:
+        """Lists the files in the `prefix` directory whose names sort after `start_after`, with their sizes."""
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.bucket, Prefix=f"{self.root}/{prefix}/", StartAfter=f"{self.root}/{prefix}/{start_after}"
+        )
+        for page in pages:
+            for item in page.get("Contents", []):
+                name = item["Key"].rpartition("/")[2]
+                keys.append((f"{prefix}/{name}", item["Size"]))
+        return keys
+
+    def fetch(self, key: str, path: str):
+        self.client.download_file(self.bucket, f"{self.root}/{key}", path)
+
+
+def open_store(table_path: str, storage_options: Dict[str, str]) -> LocalStore | S3Store:
+    if table_path.startswith("s3://"):
+        return S3Store(table_path, storage_options)
+    return LocalStore(table_path)
+
+
+class TableMirror:
+    """Read-through local disk mirror of Delta tables, in the bucket or in local paths.
+
+    Each sync fetches only the log entries committed since the last sync and the data files they add, so the
+    tools read local files, which Polars memory-maps, instead of doing S3 round-trips. The parquet files of the
+    mirror are capped at `max_bytes`: the least recently used files, e.g. the files removed by a compaction, are
+    evicted first. The files of the latest synced version of each table are never evicted, as the tools may
+    still be scanning them.
+
+    Args:
+        mirror_dir (str): The local directory of the mirror, e.g. `data/mirror`.
+        max_bytes (int): The maximum size of the mirrored parquet files.
+    """
+
+    def __init__(self, mirror_dir: str, max_bytes: int = DEFAULT_MIRROR_MAX_BYTES):
+        self.mirror_dir = mirror_dir
+        self.max_bytes = max_bytes
+        self._active: Dict[str, Set[str]] = {}
+        self._counters = {"syncs": 0, "log_files": 0, "data_files": 0, "bytes_fetched": 0, "evicted_files": 0}
+        # size and last read time of each mirrored parquet file, read from the disk once
+        self._files: Dict[str, Tuple[int, float]] = self._scan_data_files()
+        self._bytes_mirrored = sum(size for size, _ in self._files.values())
+        self._lock = threading.Lock()
+        self._table_locks: Dict[str, threading.Lock] = {}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "bytes_mirrored": self._bytes_mirrored}
+
+    def get_local_path(self, table_dir: str) -> str:
+        return os.path.join(self.mirror_dir, table_dir)
+
+    def sync(self, table_dir: str) -> str:
+        """Brings the mirror of the table up to date with its latest version.
+
+        Returns:
+            str: The local path of the mirrored table, which is not a Delta table if the table does not exist.
+        """
+        with self._lock:
+            table_lock = self._table_locks.setdefault(table_dir, threading.Lock())
+        with table_lock:
+            table_path, storage_options = get_table_location(table_dir)
+            store = open_store(table_path, storage_options)
+            local_path = self.get_local_path(table_dir)
+            log_files = self._sync_log(store, local_path)
+            if not log_files and not DeltaTable.is_deltatable(local_path):
+                return local_path
+            # the paths of the log are URI-encoded
+            active = [unquote(path) for path in DeltaTable(local_path).get_add_actions().column("path").to_pylist()]
+            missing = [key for key in active if not os.path.isfile(os.path.join(local_path, key))]
+            self._fetch(store, local_path, missing)
+            files = self._touch(local_path, active)
+            with self._lock:
+                for path, file in files.items():
+                    self._bytes_mirrored += file[0] - self._files.get(path, (0, 0.0))[0]
+                    self._files[path] = file
+                self._active[table_dir] = set(files)
+                self._counters["syncs"] += 1
+                self._counters["log_files"] += len(log_files)
+                self._counters["data_files"] += len(missing)
+                evicted = self._evict()
+            for path in evicted:
+                os.remove(path)
+            print(f"mirrored {table_path} to {local_path}: {len(log_files)} log files, {len(missing)} data files")
+            return local_path
+
+    def _sync_log(self, store: LocalStore | S3Store, local_path: str) -> List[str]:
+        """Fetches the log entries after the latest mirrored commit, or after the last checkpoint on the first sync.
+
+        Commits and checkpoints are immutable. `_last_checkpoint` is only fetched on the first sync, as the mirror
+        keeps every commit after it, and when the sync fetches a new checkpoint.
+
+        Returns:
+            List[str]: The fetched commits and checkpoints.
+        """
+        log_dir = os.path.join(local_path, LOG_DIR)
+        os.makedirs(log_dir, exist_ok=True)
+        commits = sorted(name for name in os.listdir(log_dir) if name.endswith(".json"))
+        start_after = commits[-1] if commits else ""
+        if not commits:
+            self._fetch(store, local_path, [f"{LOG_DIR}/{LAST_CHECKPOINT}"], missing_ok=True)
+            checkpoint = self._read_checkpoint_version(log_dir)
+            if checkpoint:
+                start_after = f"{checkpoint - 1:020d}.json"
+        keys = [key for key, _ in store.list(LOG_DIR, start_after) if not key.endswith(LAST_CHECKPOINT)]
+        if commits and any(".checkpoint." in key for key in keys):
+            keys.append(f"{LOG_DIR}/{LAST_CHECKPOINT}")
+        self._fetch(store, local_path, keys)
+        return [key for key in keys if not key.endswith(LAST_CHECKPOINT)]
+
+    @staticmethod
+    def _read_checkpoint_version(log_dir: str) -> int | None:
+        path = os.path.join(log_dir, LAST_CHECKPOINT)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)["version"]
+
+    def _fetch(self, store: LocalStore | S3Store, local_path: str, keys: List[str], missing_ok: bool = False):
+        """Downloads the files at the same time, each to a temporary file renamed once complete."""
+
+        def fetch(key: str) -> int:
+            path = os.path.join(local_path, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                store.fetch(key, f"{path}.part")
+            except Exception:
+                if missing_ok:
+                    return 0
+                raise
+            os.replace(f"{path}.part", path)
+            return os.path.getsize(path)
+
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            fetched = sum(executor.map(fetch, keys))
+        with self._lock:
+            self._counters["bytes_fetched"] += fetched
+
+    @staticmethod
+    def _touch(local_path: str, keys: List[str]) -> Dict[str, Tuple[int, float]]:
+        """Records that the files were read, returning their paths with their size and read time."""
+        # the modification time of the mirrored files records when they were last read, across restarts
+        read_at = time.time()
+        files = {}
+        for key in keys:
+            path = os.path.join(local_path, key)
+            os.utime(path, (read_at, read_at))
+            files[path] = (os.path.getsize(path), read_at)
+        return files
+
+    def _scan_data_files(self) -> Dict[str, Tuple[int, float]]:
+        files = {}
+        for root, _, names in os.walk(self.mirror_dir):
+            if os.path.basename(root) == LOG_DIR:
+                continue
+            for name in names:
+                if name.endswith(".parquet"):
+                    stat = os.stat(os.path.join(root, name))
+                    files[os.path.join(root, name)] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def _evict(self) -> List[str]:
+        """Forgets the least recently read inactive files until the mirror fits in `max_bytes`, returning their paths.
+
+        The caller holds the lock, and removes the returned files once it is released.
+        """
+        if self._bytes_mirrored <= self.max_bytes:
+            return []
+        active = set().union(*self._active.values())
+        evicted = []
+        for path in sorted(set(self._files) - active, key=lambda path: self._files[path][1]):
+            self._bytes_mirrored -= self._files.pop(path)[0]
+            evicted.append(path)
+            self._counters["evicted_files"] += 1
+            if self._bytes_mirrored <= self.max_bytes:
+                return evicted
+        print(f"the mirror holds {self._bytes_mirrored} bytes of active files, over its {self.max_bytes} bytes limit")
+        return evicted
@@ -1,5 +1,7 @@
+import gzip
 import json
-from typing import Any, Dict, List
+import re
+from typing import IO, Any, Dict, Iterable, Iterator, List, Tuple
 
 import polars as pl
 from polars.exceptions import ComputeError
@@ -21,6 +23,15 @@ class GameEvent(BaseModel):
     payload: Dict[Any, Any]  # event payload (e.g. victimId, damage, etc.)
 
 
+# event types used to build the game stats
+GAME_EVENTS = ["configuration", "damageEvent"]
+# event keys that are not the event name
+EVENT_KEYS = ["metadata", "platformGameId"]
+
+READ_CHUNK_SIZE = 64 * 1024
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
 def get_game_mappings(mapping_file: str) -> List[GameMapping]:
     game_mappings: List[GameMapping] = []
     with open(mapping_file, "r") as mf:
@@ -42,22 +53,65 @@ def get_game_mappings(mapping_file: str) -> List[GameMapping]:
     return game_mappings
 
 
+def open_game_file(game_file: str) -> IO[str]:
+    if game_file.endswith(".gz"):
+        return gzip.open(game_file, "rt")
+    return open(game_file, "r")
+
+
+def iter_json_array(fp: IO[str], chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """Incrementally decodes the elements of a top-level JSON array.
+
+    Only the current element and one read buffer are held in memory at any time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Bad game data. Expected a JSON array of events.")
+    pos, read_size, eof = 1, chunk_size, False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+        try:
+            element, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError("Bad game data. Truncated JSON array.") from e
+            # the element spans beyond the buffer, read more (growing the reads for huge elements)
+            chunk = fp.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos, read_size = 0, read_size * 2
+            continue
+        read_size = chunk_size
+        yield element
+
+
+def iter_raw_game_events(
+    game_file: str, event_names: Iterable[str] | None = GAME_EVENTS
+) -> Iterator[Tuple[str, Dict[Any, Any], Dict[Any, Any]]]:
+    """Streams `(name, metadata, payload)` tuples for the requested event types of a `.json` or `.json.gz` game file.
+
+    Args:
+        game_file (str): The path to the game file.
+        event_names (Iterable[str] | None): The event types to yield, or None to yield all events.
+    """
+    wanted = set(event_names) if event_names is not None else None
+    with open_game_file(game_file) as gf:
+        for e in iter_json_array(gf):
+            event_name = [x for x in e if x not in EVENT_KEYS][0]
+            if wanted is None or event_name in wanted:
+                yield event_name, e["metadata"], e[event_name]
+
+
+def iter_game_events(game_file: str, event_names: Iterable[str] | None = GAME_EVENTS) -> Iterator[GameEvent]:
+    for event_name, metadata, payload in iter_raw_game_events(game_file, event_names):
+        yield GameEvent(seq_num=metadata["sequenceNumber"], metadata=metadata, name=event_name, payload=payload)
+
+
 def get_game_events(game_file: str) -> List[GameEvent]:
-    game_events: List[GameEvent] = []
-    with open(game_file, "r") as gf:
-        game_data = json.load(gf)
-        for e in game_data:
-            event_name = [x for x in list(e.keys()) if x not in ["metadata", "platformGameId"]][0]
-            if event_name not in ["snapshot", "observerTarget"]:
-                game_events.append(
-                    GameEvent(
-                        seq_num=e["metadata"]["sequenceNumber"],
-                        metadata=e["metadata"],
-                        name=event_name,
-                        payload=e[event_name],
-                    )
-                )
-    return game_events
+    return list(iter_game_events(game_file))
 
 
 def get_game_stats(events: List[GameEvent], mapping: GameMapping) -> pl.DataFrame:
@@ -129,16 +183,27 @@ def get_game_stats(events: List[GameEvent], mapping: GameMapping) -> pl.DataFram
     return res
 
 
-def get_fixture_data(data_dir: str) -> pl.DataFrame:
+def map_ids(column: str, mapping: Dict[int, int], alias: str) -> pl.Expr:
+    """Maps the team or participant numbers of the game events to their ids, unknown numbers to null."""
+    return pl.col(column).replace_strict(mapping, default=None, return_dtype=pl.UInt64).alias(alias)
+
+
+def scan_esports_data(data_dir: str, name: str, fields: List[str]) -> pl.LazyFrame:
+    """Lazily reads an esports data file, e.g. `players`, parsing only the given fields as strings."""
+    schema = dict.fromkeys(fields, pl.String)
+    return pl.defer(lambda: pl.read_json(f"{data_dir}/esports-data/{name}.json", schema=schema), schema=schema)
+
+
+def scan_fixture_data(data_dir: str) -> pl.LazyFrame:
+    """Returns the plan of the fixture data: one row per league, tournament, team and player."""
     # leagues
-    leagues = pl.read_json(f"{data_dir}/esports-data/leagues.json")
-    leagues = leagues.select(
+    leagues = scan_esports_data(data_dir, "leagues", ["league_id", "name", "region"]).select(
         pl.col("league_id").cast(pl.UInt64),
         pl.col("name").alias("league_name"),
         pl.col("region").alias("league_region"),
     )
     # tournaments
-    tournaments = pl.read_json(f"{data_dir}/esports-data/tournaments.json")
+    tournaments = scan_esports_data(data_dir, "tournaments", ["id", "league_id", "name", "status", "time_zone"])
     tournaments = tournaments.select(
         pl.col("id").cast(pl.UInt64).alias("tournament_id"),
         pl.col("league_id").cast(pl.UInt64),
@@ -147,9 +212,9 @@ def get_fixture_data(data_dir: str) -> pl.DataFrame:
         pl.col("time_zone").alias("tournament_tz"),
     )
     # teams
-    teams = pl.read_json(f"{data_dir}/esports-data/teams.json")
     teams = (
-        teams.select(
+        scan_esports_data(data_dir, "teams", ["id", "home_league_id", "name"])
+        .select(
             pl.col("id").cast(pl.UInt64).alias("team_id"),
             pl.col("home_league_id").cast(pl.UInt64).alias("league_id"),
             pl.col("name").alias("team_name"),
@@ -158,9 +223,9 @@ def get_fixture_data(data_dir: str) -> pl.DataFrame:
         .agg(pl.col("team_name").first())
     )
     # players
-    players = pl.read_json(f"{data_dir}/esports-data/players.json")
     players = (
-        players.select(
+        scan_esports_data(data_dir, "players", ["id", "home_team_id", "handle", "first_name", "last_name", "status"])
+        .select(
             pl.col("id").cast(pl.UInt64).alias("player_id"),
             pl.col("home_team_id").cast(pl.UInt64).alias("team_id"),
             pl.col("handle").alias("player_handle"),
@@ -169,12 +234,37 @@ def get_fixture_data(data_dir: str) -> pl.DataFrame:
             # pl.col("created_at").str.to_datetime().alias("player_created"),
             # pl.col("updated_at").str.to_datetime().alias("player_updated"),
         )
-        .group_by(["player_id", "team_id", "player_handle", "player_name", "player_is_active"])
-        .agg(pl.all())
+        .unique(maintain_order=True)
     )
-    fixture_data = (
+    return (
         leagues.join(tournaments, on="league_id", how="left")
         .join(teams, on="league_id", how="inner")
         .join(players, on="team_id", how="inner")
     )
-    return fixture_data
+
+
+def get_fixture_data(data_dir: str) -> pl.DataFrame:
+    return scan_fixture_data(data_dir).collect()
+
+
+def scan_player_regions(data_dir: str) -> pl.LazyFrame:
+    """Returns the plan of the region of each player, which only parses the ids and regions of the fixture data.
+
+    Same rows as `scan_fixture_data(data_dir).select("league_region", "player_id").unique()`: the tournaments,
+    left-joined to the leagues, and the names never change which players are in which region.
+    """
+    leagues = scan_esports_data(data_dir, "leagues", ["league_id", "region"]).select(
+        pl.col("league_id").cast(pl.UInt64), pl.col("region").alias("league_region")
+    )
+    teams = scan_esports_data(data_dir, "teams", ["id", "home_league_id"]).select(
+        pl.col("id").cast(pl.UInt64).alias("team_id"), pl.col("home_league_id").cast(pl.UInt64).alias("league_id")
+    )
+    players = scan_esports_data(data_dir, "players", ["id", "home_team_id"]).select(
+        pl.col("id").cast(pl.UInt64).alias("player_id"), pl.col("home_team_id").cast(pl.UInt64).alias("team_id")
+    )
+    return (
+        leagues.join(teams.unique(), on="league_id", how="inner")
+        .join(players.unique(), on="team_id", how="inner")
+        .select("league_region", "player_id")
+        .unique()
+    )
@@ -0,0 +1,94 @@
+import inspect
+import math
+from functools import wraps
+from typing import Callable, List
+
+import polars as pl
+
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 400
+
+# shorter column names, explained by the legend
+ABBREVIATIONS = [
+    ("esports_game_id", "game_id"),
+    ("league_alias", "league"),
+    ("games_played", "games"),
+    ("players_killed", "kills"),
+    ("damage_", "dmg_"),
+    ("attack_", "atk_"),
+    ("defend_", "def_"),
+    ("_per_game", "/g"),
+]
+LEGEND = "(dmg = damage, /g = per game, atk/def = in the attacking/defending team)"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def abbreviate(column: str) -> str:
+    for long, short in ABBREVIATIONS:
+        column = column.replace(long, short)
+    return column
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+def render_table(
+    df: pl.DataFrame, token_budget: int = DEFAULT_TOKEN_BUDGET, count_tokens: Callable[[str], int] = estimate_tokens
+) -> str:
+    """Renders the frame as a compact fixed-width table that fits in the token budget.
+
+    Rows that do not fit are dropped from the end, and a final line says how many were omitted.
+    """
+    if df.is_empty():
+        return "No data found."
+    headers = [abbreviate(column) for column in df.columns]
+    rows = [[_format_value(value) for value in row] for row in df.iter_rows()]
+    widths = [max(len(header), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+
+    def line(cells: List[str]) -> str:
+        return " ".join(cell.rjust(width) for cell, width in zip(cells, widths))
+
+    header = [LEGEND, line(headers)] if headers != list(df.columns) else [line(headers)]
+    omitted_note = f"[{len(rows)} of {len(rows)} rows omitted to fit the {token_budget} token budget]"
+    used = count_tokens("\n".join(header)) + count_tokens(omitted_note)
+    body = []
+    for row in rows:
+        text = line(row)
+        used += count_tokens(text) + 1
+        if used > token_budget:
+            break
+        body.append(text)
+    if len(body) < len(rows):
+        body.append(f"[{len(rows) - len(body)} of {len(rows)} rows omitted to fit the {token_budget} token budget]")
+    return "\n".join(header + body)
+
+
+def compact_output(fn: Callable, token_budget: int = DEFAULT_TOKEN_BUDGET) -> Callable:
+    """Wraps a tool, sync or async, so that the DataFrames it returns are rendered with `render_table`."""
+
+    def render(result):
+        if isinstance(result, pl.DataFrame):
+            return render_table(result, token_budget)
+        return result
+
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            return render(await fn(*args, **kwargs))
+
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return render(fn(*args, **kwargs))
+
+    return wrapper
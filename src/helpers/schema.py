@@ -0,0 +1,58 @@
+from typing import Mapping
+
+import polars as pl
+from deltalake import DeltaTable
+
+from helpers.storage import get_table_location
+
+# version of the schema of the game stats table written by `scripts/process.py`, see `to_stats_v2`
+STATS_VERSION = 2
+# compression codec of the v2 files, a third smaller than with the default Snappy
+STATS_COMPRESSION = "ZSTD"
+TEAM_ROLES = {"A": "attacking team", "D": "defending team"}
+TEAM_MODE = pl.Enum(list(TEAM_ROLES))
+TEAM_ROLE = pl.Enum(list(TEAM_ROLES.values()))
+# v2 types of the counters, the ids stay 64-bit and the partition columns are only stored in the Delta log
+STATS_V2_TYPES = {"damage_dealt": pl.Int32, "damage_taken": pl.Int32, "players_killed": pl.Int16}
+# Delta tables have no dictionary types, so these columns are stored as strings and cast when read
+STATS_V2_ENUMS = {"team_mode": TEAM_MODE, "team_role": TEAM_ROLE}
+
+
+def get_stats_version(schema: Mapping[str, pl.DataType]) -> int:
+    """Returns the version of a game stats schema: 2 if it has the precomputed `team_role` column, else 1."""
+    return 2 if "team_role" in schema else 1
+
+
+def get_table_stats_version(table_dir: str) -> int | None:
+    """Returns the schema version of the game stats table, read from its Delta log, or None if there is no table."""
+    table_path, storage_options = get_table_location(table_dir)
+    if not DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        return None
+    fields = DeltaTable(table_path, storage_options=storage_options).schema().fields
+    return get_stats_version({field.name: field.type for field in fields})
+
+
+def _team_role(dtype: pl.DataType = pl.String) -> pl.Expr:
+    return pl.col("team_mode").replace_strict(TEAM_ROLES, return_dtype=dtype).alias("team_role")
+
+
+def to_stats_v2(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Converts game stats rows of schema v1, e.g. the game summaries, to the v2 storage schema.
+
+    The counters are narrowed, and the `team_role` of each row is precomputed from its `team_mode`.
+    """
+    return frame.with_columns(*(pl.col(column).cast(dtype) for column, dtype in STATS_V2_TYPES.items()), _team_role())
+
+
+def read_stats(game_stats: pl.LazyFrame) -> pl.LazyFrame:
+    """Reads a game stats scan of either schema version with the v2 in-memory types.
+
+    The counters are narrowed and the team mode and role are Enums, whose rows take one byte instead of a string.
+    Only the columns used by the query are cast, after its filters.
+    """
+    schema = game_stats.collect_schema()
+    if get_stats_version(schema) == 1:
+        game_stats = game_stats.with_columns(
+            *(pl.col(column).cast(dtype) for column, dtype in STATS_V2_TYPES.items()), _team_role(TEAM_ROLE)
+        )
+    return game_stats.with_columns(pl.col(column).cast(dtype) for column, dtype in STATS_V2_ENUMS.items())
@@ -0,0 +1,106 @@
+import itertools
+import math
+from functools import lru_cache
+from typing import Dict
+
+import numpy as np
+import polars as pl
+
+TEAM_SIZE = 5
+# largest number of candidate teams scored at once, e.g. C(30, 5) = 142,506
+MAX_TEAMS = 1_000_000
+# per-game player aggregates, summed over the players of each team
+PLAYER_FEATURES = [
+    "damage_dealt_per_game",
+    "kills_per_game",
+    "damage_taken_per_game",
+    "attack_damage_dealt_per_game",
+    "defend_damage_dealt_per_game",
+]
+# the team features also include the attack/defend balance and the number of regions of the players
+TEAM_FEATURES = PLAYER_FEATURES + ["balance", "regions"]
+# weights of the team features in the score, after standardizing each feature over the candidate teams
+DEFAULT_WEIGHTS = {
+    "damage_dealt_per_game": 1.0,
+    "kills_per_game": 1.0,
+    "damage_taken_per_game": -0.5,
+    "balance": 0.5,
+    "regions": 0.0,
+}
+
+
+@lru_cache(maxsize=32)
+def get_combinations(num_players: int, team_size: int = TEAM_SIZE) -> np.ndarray:
+    """Returns the indices of the players of every team of `team_size` out of `num_players`, one row per team."""
+    num_teams = math.comb(num_players, team_size)
+    if num_teams > MAX_TEAMS:
+        raise ValueError(f"Too many candidate teams: C({num_players}, {team_size}) = {num_teams} > {MAX_TEAMS}.")
+    indices = itertools.chain.from_iterable(itertools.combinations(range(num_players), team_size))
+    combinations = np.fromiter(indices, dtype=np.intp, count=num_teams * team_size).reshape(num_teams, team_size)
+    combinations.setflags(write=False)
+    return combinations
+
+
+def get_team_features(players: pl.DataFrame, combinations: np.ndarray) -> Dict[str, np.ndarray]:
+    """Computes the features of each candidate team at once, one array per feature of `TEAM_FEATURES`."""
+    features = players.select(PLAYER_FEATURES).fill_null(0.0).to_numpy().astype(np.float64)
+    team_features = dict(zip(PLAYER_FEATURES, features[combinations].sum(axis=1).T))
+    # 1 when the team deals as much damage when attacking as when defending
+    attack = team_features["attack_damage_dealt_per_game"]
+    defend = team_features["defend_damage_dealt_per_game"]
+    most = np.maximum(attack, defend)
+    team_features["balance"] = np.divide(np.minimum(attack, defend), most, out=np.zeros_like(most), where=most > 0)
+    # number of distinct regions, players without a region count as one region
+    regions = players["league_region"].fill_null("").to_numpy().astype(str)
+    team_regions = np.sort(np.unique(regions, return_inverse=True)[1][combinations], axis=1)
+    team_features["regions"] = 1 + np.count_nonzero(np.diff(team_regions, axis=1), axis=1)
+    return team_features
+
+
+def score_teams(
+    players: pl.DataFrame, top_k: int = 5, team_size: int = TEAM_SIZE, weights: Dict[str, float] | None = None
+) -> pl.DataFrame:
+    """Scores every team of `team_size` players of the shortlist and returns the `top_k` best teams.
+
+    The score is the weighted sum of the team features, each standardized over all the candidate teams
+    so that the weights do not depend on the units of the features.
+
+    Args:
+        players (pl.DataFrame): One row per player, with the `player_id`, `league_region` and `PLAYER_FEATURES`.
+        top_k (int): The number of teams to return.
+        team_size (int): The number of players of a team.
+        weights (Dict[str, float] | None): Weights of the team features, overriding `DEFAULT_WEIGHTS`.
+
+    Raises:
+        ValueError: If a weight is not a team feature or if there are too many candidate teams.
+
+    Returns:
+        pl.DataFrame: The best teams first, with their rank, score, player ids and team features.
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    unknown = set(weights) - set(TEAM_FEATURES)
+    if unknown:
+        raise ValueError(f"Invalid weights: {', '.join(sorted(unknown))}. Choices are: {', '.join(TEAM_FEATURES)}")
+    combinations = get_combinations(len(players), team_size)
+    team_features = get_team_features(players, combinations)
+    scores = np.zeros(len(combinations))
+    for name, weight in weights.items():
+        values = team_features[name]
+        std = values.std()
+        if weight and std > 0:
+            scores += weight * (values - values.mean()) / std
+
+    top_k = min(top_k, len(scores))
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    # best first, ties in the order of the combinations so the ranking is deterministic
+    top = top[np.lexsort((top, -scores[top]))]
+    player_ids = players["player_id"].to_numpy()[combinations[top]]
+    return pl.DataFrame(
+        {
+            "rank": np.arange(1, top_k + 1),
+            "score": scores[top],
+            "player_ids": player_ids.tolist(),
+            **{name: values[top] for name, values in team_features.items()},
+        },
+        schema_overrides={"player_ids": pl.List(pl.UInt64)},
+    )
@@ -0,0 +1,56 @@
+import glob
+import os
+from typing import Callable, Tuple
+
+import polars as pl
+
+
+def get_snapshot_path(snapshot_dir: str, name: str, versions: Tuple[int | None, ...]) -> str:
+    """Returns the path of the snapshot of `name` for the given Delta table versions, e.g. `player_stats@3-1.arrow`."""
+    tag = "-".join("none" if version is None else str(version) for version in versions)
+    return f"{snapshot_dir}/{name}@{tag}.arrow"
+
+
+def load_snapshot(snapshot_dir: str, name: str, versions: Tuple[int | None, ...]) -> pl.LazyFrame | None:
+    """Scans the snapshot taken at the given table versions, or returns None if there is none.
+
+    Snapshots are uncompressed Arrow IPC files, which Polars memory-maps instead of reading them.
+    """
+    path = get_snapshot_path(snapshot_dir, name, versions)
+    if not os.path.isfile(path):
+        return None
+    return pl.scan_ipc(path)
+
+
+def save_snapshot(snapshot_dir: str, name: str, versions: Tuple[int | None, ...], df: pl.DataFrame) -> str:
+    """Writes the snapshot of `name` taken at the given table versions, replacing older snapshots."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = get_snapshot_path(snapshot_dir, name, versions)
+    df.write_ipc(f"{path}.part", compression="uncompressed")
+    os.replace(f"{path}.part", path)
+    for old_path in glob.glob(f"{snapshot_dir}/{glob.escape(name)}@*.arrow"):
+        if old_path != path:
+            os.remove(old_path)
+    return path
+
+
+def snapshot_or_load(
+    snapshot_dir: str | None, name: str, versions: Tuple[int | None, ...], load: Callable[[], pl.LazyFrame]
+) -> pl.LazyFrame:
+    """Scans the snapshot of `name` if it matches the table versions, else loads the data and snapshots it.
+
+    Args:
+        snapshot_dir (str | None): The directory of the snapshots, or None to always load the data.
+        name (str): The name of the snapshot.
+        versions (Tuple[int | None, ...]): The versions of the Delta tables the data is loaded from.
+        load (Callable[[], pl.LazyFrame]): Loads the data from the Delta tables.
+    """
+    if snapshot_dir is None:
+        return load()
+    snapshot = load_snapshot(snapshot_dir, name, versions)
+    if snapshot is not None:
+        print(f"reading {name} from snapshot at table versions {versions}...")
+        return snapshot
+    path = save_snapshot(snapshot_dir, name, versions, load().collect())
+    print(f"saved {name} snapshot to {path}")
+    return pl.scan_ipc(path)
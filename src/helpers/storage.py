@@ -1,4 +1,5 @@
 import os
+from typing import Dict, Tuple
 
 
 def get_storage_options():
@@ -6,11 +7,29 @@ def get_storage_options():
     region = os.environ.get("AWS_REGION")
     key_id = os.environ.get("AWS_ACCESS_KEY_ID")
     access_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+    # S3-compatible server standing in for S3, e.g. MinIO or moto
+    endpoint = os.environ.get("AWS_ENDPOINT_URL")
     if bucket:
-        return {
+        storage_options = {
             "bucket": bucket,
             "AWS_REGION": region,
             "AWS_ACCESS_KEY_ID": key_id,
             "AWS_SECRET_ACCESS_KEY": access_key,
         }
+        if endpoint:
+            storage_options["AWS_ENDPOINT_URL"] = endpoint
+            storage_options["AWS_ALLOW_HTTP"] = str(endpoint.startswith("http://")).lower()
+        return storage_options
     return {}
+
+
+def get_table_location(table_dir: str) -> Tuple[str, Dict[str, str]]:
+    """Resolves a table directory to a path in the configured bucket, or to a local path if there is no bucket.
+
+    Returns:
+        Tuple[str, Dict[str, str]]: The table path and the storage options to access it.
+    """
+    storage_options = get_storage_options()
+    if storage_options:
+        return f"{storage_options.pop('bucket')}/{table_dir}", storage_options
+    return table_dir, storage_options
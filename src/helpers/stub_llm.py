@@ -0,0 +1,214 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, List, Sequence
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+DEFAULT_LEAGUE = "game-changers"
+PLAYER_IDS_PATTERN = re.compile(r"\[(\s*\d+\s*(?:,\s*\d+\s*)*)\]")
+TOKEN_PATTERN = re.compile(r"\S+\s*")
+
+
+ANSWER_STEP = (
+    "Thought: I can answer without using any more tools.\n"
+    "Answer: The team is made of the five players with the highest damage dealt per game: {team}. "
+    "The top fragger plays Duelist, the best defender plays Sentinel, and the remaining players "
+    "take the Controller and Initiator roles."
+)
+
+BEST_TEAM_STEP = (
+    "Thought: I can answer without using any more tools.\n"
+    "Answer: The team is the best ranked team: {team}. It deals the most damage and gets the most kills per game, "
+    "and is as strong attacking as defending. The top fragger plays Duelist, the best defender plays Sentinel, "
+    "and the remaining players take the Controller and Initiator roles."
+)
+
+
+def make_team_script(league: str | None = DEFAULT_LEAGUE, num_players: int = 10, seed: int | None = None) -> List[str]:
+    """Returns the ReAct trace of a typical `make_team` run: shortlist, stats, then the final answer.
+
+    With a null league, each tool is called once to combine all leagues.
+    """
+    shortlist_input = {"league": league, "num_players": num_players}
+    if seed is not None:
+        shortlist_input["seed"] = seed
+    return [
+        "Thought: The current language of the user is: English. I need to use a tool to shortlist players.\n"
+        "Action: get_random_players\n"
+        f"Action Input: {json.dumps(shortlist_input)}",
+        "Thought: I need the stats of the shortlisted players to assign the roles.\n"
+        "Action: get_player_stats\n"
+        f'Action Input: {{"player_ids": {{player_ids}}, "league": {json.dumps(league)}}}',
+        ANSWER_STEP,
+    ]
+
+
+def make_best_teams_script(
+    league: str | None = DEFAULT_LEAGUE, num_players: int = 10, seed: int | None = None
+) -> List[str]:
+    """Returns the ReAct trace of a `make_team` run that ranks the teams of the shortlist with `get_best_teams`."""
+    shortlist_step, _, _ = make_team_script(league, num_players, seed)
+    return [
+        shortlist_step,
+        "Thought: I need to rank the possible teams of the shortlisted players.\n"
+        "Action: get_best_teams\n"
+        f'Action Input: {{"player_ids": {{player_ids}}, "league": {json.dumps(league)}}}',
+        BEST_TEAM_STEP,
+    ]
+
+
+def make_per_league_script(leagues: List[str], num_players: int = 10) -> List[str]:
+    """Returns the ReAct trace of a `make_team` run combining the leagues with one tool call per league."""
+    shortlists = [
+        "Thought: I need to shortlist players in each league.\n"
+        "Action: get_random_players\n"
+        f'Action Input: {{"league": "{league}", "num_players": {num_players}}}'
+        for league in leagues
+    ]
+    stats = [
+        "Thought: I need the stats of the shortlisted players in each league.\n"
+        "Action: get_player_stats\n"
+        f'Action Input: {{"player_ids": {{player_ids}}, "league": "{league}"}}'
+        for league in leagues
+    ]
+    return shortlists + stats + [ANSWER_STEP]
+
+
+def _find_id_lists(texts: List[str]) -> List[List[int]]:
+    """Returns the first list of ids of each text."""
+    matches = [PLAYER_IDS_PATTERN.search(text) for text in texts]
+    return [[int(x) for x in match.group(1).split(",")] for match in matches if match]
+
+
+class ThrottlingException(Exception):
+    """Raised by the stub like Bedrock's `ThrottlingException`."""
+
+
+class ScriptedLLM(CustomLLM):
+    """LLM stub replaying a scripted ReAct trace, to run the agent locally without Bedrock.
+
+    The step of the script is the number of observations in the messages, so the stub is stateless
+    and can serve concurrent agents. `{player_ids}` is replaced with the first list of ids returned by a tool,
+    else in the prompt, e.g. prefetched by the router, and `{team}` with the first five ids of the last list,
+    e.g. the best team of `get_best_teams`.
+    All prompts are recorded in `prompts`.
+
+    To test the handling of throttling, the stub raises `ThrottlingException` beyond `quota_requests`
+    requests in a sliding window of `quota_window` seconds, or randomly with `throttle_probability`.
+    """
+
+    script: List[str] = Field(default_factory=make_team_script)
+    latency: float = Field(default=0.0, description="Seconds to wait before each response.")
+    token_latency: float = Field(default=0.0, description="Seconds to generate each token of a response.")
+    context_window: int = Field(default=3900)
+    prompts: List[str] = Field(default_factory=list)
+    quota_requests: int | None = Field(default=None, description="Requests allowed in the quota window.")
+    quota_window: float = Field(default=60.0)
+    throttle_probability: float = Field(default=0.0)
+    throttled: int = Field(default=0, description="Number of requests throttled so far.")
+    _requested_at: Deque[float] = PrivateAttr(default_factory=deque)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScriptedLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window, num_output=256, model_name="scripted", is_chat_model=True
+        )
+
+    def _check_quota(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._requested_at and now - self._requested_at[0] >= self.quota_window:
+                self._requested_at.popleft()
+            over_quota = self.quota_requests is not None and len(self._requested_at) >= self.quota_requests
+            if over_quota or random.random() < self.throttle_probability:
+                self.throttled += 1
+                raise ThrottlingException("Too many requests, please wait before trying again.")
+            self._requested_at.append(now)
+
+    def _generation_seconds(self, text: str) -> float:
+        # responses that are not streamed take as long as the streamed ones
+        return self.token_latency * len(TOKEN_PATTERN.findall(text))
+
+    def _respond(self, messages: Sequence[ChatMessage]) -> str:
+        observations = [str(m.content) for m in messages if str(m.content or "").startswith("Observation:")]
+        self.prompts.append("\n".join(f"{m.role.value}: {m.content}" for m in messages))
+        response = self.script[min(len(observations), len(self.script) - 1)]
+        prompts = [str(m.content) for m in messages if m.role == MessageRole.USER and m.content not in observations]
+        prompt_ids, tool_ids = _find_id_lists(prompts), _find_id_lists(observations)
+        if prompt_ids or tool_ids:
+            response = response.replace("{player_ids}", json.dumps((tool_ids or prompt_ids)[0]))
+            response = response.replace("{team}", ", ".join(str(x) for x in (prompt_ids + tool_ids)[-1][:5]))
+        return response
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        self._check_quota()
+        text = self._respond(messages)
+        time.sleep(self.latency + self._generation_seconds(text))
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        self._check_quota()
+        time.sleep(self.latency)
+        text = self._respond(messages)
+
+        def gen() -> ChatResponseGen:
+            content = ""
+            for token in TOKEN_PATTERN.findall(text):
+                time.sleep(self.token_latency)
+                content += token
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._check_quota()
+        text = self._respond([ChatMessage(role=MessageRole.USER, content=prompt)])
+        time.sleep(self.latency + self._generation_seconds(text))
+        return CompletionResponse(text=text)
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        self._check_quota()
+        text = self._respond(messages)
+        await asyncio.sleep(self.latency + self._generation_seconds(text))
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._check_quota()
+        text = self._respond([ChatMessage(role=MessageRole.USER, content=prompt)])
+        await asyncio.sleep(self.latency + self._generation_seconds(text))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text = self.complete(prompt).text
+
+        def gen() -> CompletionResponseGen:
+            yield CompletionResponse(text=text, delta=text)
+
+        return gen()
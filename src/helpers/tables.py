@@ -0,0 +1,177 @@
+import time
+from typing import Any, Callable, Dict, List
+
+import polars as pl
+from deltalake import ColumnProperties, DeltaTable, WriterProperties
+
+from helpers.storage import get_table_location
+from helpers.telemetry import telemetry
+
+DEFAULT_BATCH_ROWS = 10_000
+DEFAULT_BATCH_SECONDS = 60.0
+# rows per parquet row group: smaller groups let the scans of clustered files skip more of each file
+DEFAULT_ROW_GROUP_ROWS = 128 * 1024
+
+
+def get_writer_properties(cluster_by: List[str] | None = None, compression: str | None = None) -> WriterProperties:
+    """Returns the parquet writer properties of a table clustered by the `cluster_by` columns.
+
+    The Delta log keeps per-file min/max statistics of these columns, which Polars uses to skip files.
+    The parquet files also get page-level statistics on these columns, for readers that can skip pages
+    within a row group, e.g. on point lookups of player ids.
+
+    Args:
+        cluster_by (List[str] | None): The columns the table is clustered by, if any.
+        compression (str | None): The compression codec of the pages, e.g. "ZSTD", defaults to Snappy.
+    """
+    column_properties = ColumnProperties(statistics_enabled="PAGE")
+    return WriterProperties(
+        max_row_group_size=DEFAULT_ROW_GROUP_ROWS,
+        compression=compression,
+        column_properties=dict.fromkeys(cluster_by or [], column_properties),
+    )
+
+
+def _merge_columns(merge_on: List[str], partition_by: List[str] | None) -> List[str]:
+    """Returns the key of the merged rows: a row is identified by its partition and its `merge_on` columns."""
+    return list(dict.fromkeys((partition_by or []) + merge_on))
+
+
+class BufferedTableWriter:
+    """Collects frames in memory and appends them to a Delta table in batches.
+
+    A batch is committed once it holds `max_rows` rows or when a write arrives `max_seconds`
+    after the last commit, so each commit writes a few larger files instead of one tiny file per frame.
+    The remaining rows are committed by `flush`, which is also called when used as a context manager.
+
+    With `merge_on`, batches are upserted on those key columns instead of appended, so writing
+    the same rows again never duplicates them. `on_flush` is called after every commit.
+
+    With `cluster_by`, batches are sorted by those columns, so that each file holds a narrow range of their
+    values and scans filtering on them skip the other files, see `get_writer_properties`. `compression`
+    sets the compression codec of the written files.
+    """
+
+    def __init__(
+        self,
+        table_dir: str,
+        partition_by: List[str] | None = None,
+        max_rows: int = DEFAULT_BATCH_ROWS,
+        max_seconds: float = DEFAULT_BATCH_SECONDS,
+        merge_on: List[str] | None = None,
+        on_flush: Callable[[], None] | None = None,
+        cluster_by: List[str] | None = None,
+        compression: str | None = None,
+    ):
+        self.table_path, self.storage_options = get_table_location(table_dir)
+        self.partition_by = partition_by
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.merge_on = merge_on
+        self.on_flush = on_flush
+        self.cluster_by = cluster_by
+        self.writer_properties = get_writer_properties(cluster_by, compression) if cluster_by or compression else None
+        self.commits = 0
+        self.rows_written = 0
+        self._frames: List[pl.DataFrame] = []
+        self._rows = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, frame: pl.DataFrame):
+        self._frames.append(frame)
+        self._rows += len(frame)
+        if self._rows >= self.max_rows or time.monotonic() - self._last_flush >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._frames:
+            return
+        print(f"Writing {self._rows} rows to {self.table_path} table...")
+        with telemetry.span("delta_write", table=self.table_path, rows=self._rows, merge=bool(self.merge_on)):
+            batch = pl.concat(self._frames, how="vertical")
+            if self.cluster_by:
+                batch = batch.sort(self.cluster_by)
+            if self.merge_on and DeltaTable.is_deltatable(self.table_path, storage_options=self.storage_options):
+                self._merge(batch)
+            else:
+                delta_write_options = {"partition_by": self.partition_by} if self.partition_by else {}
+                if self.writer_properties:
+                    delta_write_options["writer_properties"] = self.writer_properties
+                batch.write_delta(
+                    self.table_path,
+                    mode="append",
+                    storage_options=self.storage_options,
+                    delta_write_options=delta_write_options or None,
+                )
+        self.commits += 1
+        self.rows_written += self._rows
+        self._frames, self._rows = [], 0
+        if self.on_flush:
+            self.on_flush()
+
+    def _merge(self, batch: pl.DataFrame):
+        # partition columns are part of the predicate so the merge only rewrites the touched partitions
+        columns = _merge_columns(self.merge_on, self.partition_by)
+        predicate = " AND ".join(f"t.{column} = s.{column}" for column in columns)
+        batch.unique(subset=columns, keep="last", maintain_order=True).write_delta(
+            self.table_path,
+            mode="merge",
+            storage_options=self.storage_options,
+            delta_merge_options={
+                "predicate": predicate,
+                "source_alias": "s",
+                "target_alias": "t",
+                "writer_properties": self.writer_properties,
+            },
+        ).when_matched_update_all().when_not_matched_insert_all().execute()
+
+    def __enter__(self) -> "BufferedTableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def upsert_table(
+    table_dir: str, frame: pl.DataFrame, merge_on: List[str], partition_by: List[str] | None = None
+) -> Dict[str, Any]:
+    """Upserts the rows of the frame into a Delta table on the `merge_on` key columns, creating it if needed.
+
+    A matched row is only updated if one of its other columns changed, so the files holding only unchanged rows
+    are neither rewritten nor committed, and writing the same frame again is a no-op.
+
+    Returns:
+        Dict[str, Any]: The merge metrics, e.g. `num_target_rows_inserted` and `num_target_rows_updated`.
+    """
+    table_path, storage_options = get_table_location(table_dir)
+    columns = _merge_columns(merge_on, partition_by)
+    frame = frame.unique(subset=columns, keep="last", maintain_order=True)
+    if not DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        frame.write_delta(
+            table_path,
+            storage_options=storage_options,
+            delta_write_options={"partition_by": partition_by} if partition_by else None,
+        )
+        return {"num_target_rows_inserted": len(frame), "num_target_rows_updated": 0}
+    predicate = " AND ".join(f"t.{column} = s.{column}" for column in columns)
+    merger = frame.write_delta(
+        table_path,
+        mode="merge",
+        storage_options=storage_options,
+        delta_merge_options={"predicate": predicate, "source_alias": "s", "target_alias": "t"},
+    )
+    changed = " OR ".join(
+        f"t.{column} IS DISTINCT FROM s.{column}" for column in frame.columns if column not in columns
+    )
+    if changed:
+        merger = merger.when_matched_update_all(predicate=changed)
+    return merger.when_not_matched_insert_all().execute()
+
+
+def get_table_version(table_dir: str) -> int | None:
+    """Returns the current version of the Delta table, or None if the table does not exist."""
+    table_path, storage_options = get_table_location(table_dir)
+    if not DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        return None
+    return DeltaTable(table_path, storage_options=storage_options).version()
@@ -0,0 +1,264 @@
+import atexit
+import bisect
+import json
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# the exporter writes up to this many spans at once
+EXPORT_BATCH_SIZE = 512
+DEFAULT_METRICS_PORT = 9464
+
+# the span of the code running in the current thread or task, the parent of the spans it starts
+_current: ContextVar["Span | None"] = ContextVar("telemetry_span", default=None)
+
+
+class Span:
+    """A timed operation of a trace, with attributes such as the rows returned or the tokens sent."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes", "start", "duration", "status")
+
+    def __init__(self, name: str, parent: "Span | None", sampled: bool, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = 0.0
+        self.status = "ok"
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def add(self, name: str, value: float = 1):
+        """Increments a numeric attribute, e.g. the cache hits of a tool call."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class TraceExporter:
+    """Appends the finished spans to a JSONL file, one span per line.
+
+    Spans are serialized and written by a background thread, so finishing a span only costs a queue put.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue[Span | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span):
+        self._queue.put(span)
+
+    def _run(self):
+        with open(self.path, "a") as file:
+            while True:
+                spans = [self._queue.get()]
+                while len(spans) < EXPORT_BATCH_SIZE and not self._queue.empty():
+                    spans.append(self._queue.get())
+                closed = None in spans
+                lines = [json.dumps(span.to_dict(), default=str) for span in spans if span is not None]
+                if lines:
+                    file.write("\n".join(lines) + "\n")
+                    file.flush()
+                if closed:
+                    return
+
+    def close(self):
+        """Writes the pending spans and stops the exporter."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    pairs = [f'{name}="{escape(value)}"' for name, value in labels] + ([extra] if extra else [])
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauges with labels, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[Tuple, float]] = defaultdict(dict)
+        # per label set: the count of each bucket and above the last bucket, then the sum and the count
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = defaultdict(dict)
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float = 1, **labels: Any):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0.0] * (len(DURATION_BUCKETS) + 3)
+            counts[bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def gauge(self, name: str, fn: Callable[[], float]):
+        """Registers a gauge whose value is read from `fn` when the metrics are rendered."""
+        with self._lock:
+            self._gauges[name] = fn
+
+    def get(self, name: str, **labels: Any) -> float:
+        """Returns the value of a counter, or the number of observations of a histogram."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name in self._histograms:
+                return self._histograms[name].get(key, [0.0])[-1]
+            return self._counters[name].get(key, 0) if name in self._counters else 0
+
+    def summary(self, name: str) -> Dict[Tuple, Tuple[int, float]]:
+        """Returns the number and the sum of the observations of a histogram, per label set."""
+        with self._lock:
+            return {key: (int(counts[-1]), counts[-2]) for key, counts in self._histograms.get(name, {}).items()}
+
+    def render(self) -> str:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: list(counts) for key, counts in series.items()} for name, series in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, counts in sorted(series.items()):
+                cumulative = 0.0
+                bounds = [f"{bound:g}" for bound in DURATION_BUCKETS] + ["+Inf"]
+                for bound, count in zip(bounds, counts[:-2]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative:g}")
+                lines.append(f"{name}_sum{_format_labels(key)} {counts[-2]:g}")
+                lines.append(f"{name}_count{_format_labels(key)} {counts[-1]:g}")
+        for name, fn in sorted(gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"failed to read gauge {name}: {e}")
+                continue
+            lines.extend([f"# TYPE {name} gauge", f"{name} {value:g}"])
+        return "\n".join(lines) + "\n"
+
+
+class Telemetry:
+    """Traces and metrics of the agent runs, LLM requests, tool calls and data layer.
+
+    Every span is recorded in the `span_duration_seconds` histogram, labeled by the span name, and the
+    spans with an error in `span_errors_total`. With a trace file, the spans of a sampled fraction of
+    the traces are also exported with their attributes and their parent span.
+    """
+
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.sample_rate = 1.0
+        self._exporter: TraceExporter | None = None
+
+    def configure(self, trace_file: str | None = None, sample_rate: float = 1.0):
+        """Exports the spans to the `trace_file` JSONL file, keeping a `sample_rate` fraction of the traces."""
+        self.close()
+        self.sample_rate = sample_rate
+        self._exporter = TraceExporter(trace_file) if trace_file else None
+
+    def close(self):
+        if self._exporter is not None:
+            self._exporter.close()
+            self._exporter = None
+
+    @staticmethod
+    def current_span() -> Span | None:
+        return _current.get()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Times the enclosed code as a child span of the current span, or as the root span of a new trace.
+
+        The span is the current span of the enclosed code, including the threads started with
+        `asyncio.to_thread`, which copy the context.
+        """
+        parent = _current.get()
+        sampled = parent.sampled if parent else self.sample_rate >= 1 or random.random() < self.sample_rate
+        span = Span(name, parent, sampled, attributes)
+        token = _current.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.status = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            _current.reset(token)
+            self.metrics.observe("span_duration_seconds", span.duration, span=name)
+            if span.status != "ok":
+                self.metrics.count("span_errors_total", span=name, error=span.status)
+            exporter = self._exporter
+            if exporter is not None and sampled:
+                exporter.export(span)
+
+    def count(self, name: str, value: float = 1, **labels: Any):
+        self.metrics.count(name, value, **labels)
+
+    def serve_metrics(self, port: int = DEFAULT_METRICS_PORT, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Serves the metrics at `http://<host>:<port>/metrics` from a daemon thread, for Prometheus to scrape."""
+        metrics = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"serving metrics at http://{host}:{server.server_port}/metrics")
+        return server
+
+
+# shared telemetry of the process, see `Telemetry.configure`
+telemetry = Telemetry()
@@ -0,0 +1,355 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, ContextManager, Dict, Iterator, List, Sequence, Tuple
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import LLM
+from llama_index.core.llms.custom import CustomLLM
+
+from helpers.render import estimate_tokens
+from helpers.telemetry import Span, telemetry
+
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_PRIORITY = 0
+# the buckets hold up to this many seconds of quota, so idle time allows short bursts
+BURST_SECONDS = 10.0
+# on throttling the request rates are halved, down to this fraction of the configured rates,
+# then they recover by this fraction of the configured rates after each successful request
+MIN_RATE_SCALE = 0.1
+RATE_RECOVERY_STEP = 0.05
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+# requests skip an LLM for this long after it exhausted the retries of a request, while fallbacks are available
+FAILOVER_COOLDOWN_SECONDS = 60.0
+# error codes of Bedrock (botocore ClientError) and class names of other clients' exceptions
+THROTTLING_ERRORS = {"ThrottlingException", "TooManyRequestsException", "RateLimitError"}
+
+# priority of the LLM requests of the current session, and when the session started
+_session: ContextVar[Tuple[int, float] | None] = ContextVar("llm_session", default=None)
+
+
+def is_throttling(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+    return code in THROTTLING_ERRORS or type(error).__name__ in THROTTLING_ERRORS
+
+
+@contextmanager
+def llm_priority(priority: int = DEFAULT_PRIORITY) -> Iterator[None]:
+    """Runs the enclosed agent session with the given priority (lower values are served first).
+
+    Requests of the same priority are served in the order the sessions started, so that sessions close
+    to the end of their run are not delayed by the first steps of newer sessions.
+    """
+    token = _session.set((priority, time.monotonic()))
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, scaled by `scale`, holding up to `capacity` tokens.
+
+    Requests larger than the capacity are let through when the bucket is full, leaving it in debt.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.scale = 1.0
+        self.level = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate * self.scale)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / (self.rate * self.scale))
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """Admits requests to one model within its requests and tokens per minute, in priority order.
+
+    The rates adapt to the throttling responses: they are halved on throttling and recover additively
+    after each successful request.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+    ):
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute * BURST_SECONDS / 60))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute * BURST_SECONDS / 60)
+        self.scale = 1.0
+        self.cooldown_until = 0.0
+        # running totals of the queue wait of the admitted requests
+        self.queue_wait_count = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self._waiting: List[Tuple[Tuple[int, float], int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: int, key: Tuple[int, float]) -> float:
+        """Waits until the request can be sent, and returns the seconds spent waiting.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+            key (Tuple[int, float]): The priority of the request, and the start time of its session.
+        """
+        start = time.monotonic()
+        entry = (key, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                if self._waiting[0] is not entry:
+                    self._condition.wait()
+                    continue
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    heapq.heappop(self._waiting)
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    waited = time.monotonic() - start
+                    self.queue_wait_count += 1
+                    self.queue_wait_total += waited
+                    self.queue_wait_max = max(self.queue_wait_max, waited)
+                    self._condition.notify_all()
+                    return waited
+                self._condition.wait(wait)
+
+    def _set_scale(self, scale: float):
+        self.scale = self.requests.scale = self.tokens.scale = scale
+
+    def on_throttle(self):
+        with self._condition:
+            self._set_scale(max(MIN_RATE_SCALE, self.scale / 2))
+            self.requests.drain()
+            self.tokens.drain()
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self._set_scale(min(1.0, self.scale + RATE_RECOVERY_STEP))
+
+    def on_exhausted(self):
+        self.cooldown_until = time.monotonic() + FAILOVER_COOLDOWN_SECONDS
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+def get_backoff(attempt: int) -> float:
+    """Exponential backoff with jitter, in seconds, before retrying a throttled request."""
+    return min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+class ThrottledLLM(CustomLLM):
+    """Governs the requests to an LLM shared by concurrent agent sessions, to stay within its rate limits.
+
+    Requests wait in a priority queue until they fit in the requests and tokens per minute of the model.
+    Throttled requests are retried with exponential backoff while the rates adapt, and once the retries
+    are exhausted the request fails over to the next fallback LLM, if any (e.g. another model or region),
+    and the following requests skip the exhausted LLM for `FAILOVER_COOLDOWN_SECONDS`.
+
+    Args:
+        llm (LLM): The LLM, preferably without retries of its own.
+        fallbacks (List[LLM]): The LLMs to fail over to, in order.
+        requests_per_minute (float): The request quota of each LLM.
+        tokens_per_minute (float): The token quota of each LLM.
+        max_retries (int): The number of retries of a throttled request before failing over.
+    """
+
+    max_retries: int = Field(default=DEFAULT_MAX_RETRIES)
+    _llms: List[LLM] = PrivateAttr()
+    _limiters: List[RateLimiter] = PrivateAttr()
+    _counters: Dict[str, int] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(
+        self,
+        llm: LLM,
+        fallbacks: List[LLM] | None = None,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._llms = [llm, *(fallbacks or [])]
+        self._limiters = [RateLimiter(requests_per_minute, tokens_per_minute) for _ in self._llms]
+        self._counters = {"requests": 0, "attempts": 0, "throttles": 0, "retries": 0, "failovers": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ThrottledLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llms[0].metadata
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+        telemetry.count(f"llm_{counter}_total")
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the request counters, the throttle rate, the queue wait times and the current rate scales."""
+        with self._lock:
+            counters = dict(self._counters)
+        admitted = sum(limiter.queue_wait_count for limiter in self._limiters)
+        return {
+            **counters,
+            "throttle_rate": counters["throttles"] / max(1, counters["attempts"]),
+            "queue_wait_avg_s": sum(limiter.queue_wait_total for limiter in self._limiters) / max(1, admitted),
+            "queue_wait_max_s": max((limiter.queue_wait_max for limiter in self._limiters), default=0.0),
+            "rate_scales": [limiter.scale for limiter in self._limiters],
+        }
+
+    @staticmethod
+    def _prompt_tokens(request: Sequence[ChatMessage] | str) -> int:
+        text = request if isinstance(request, str) else "".join(str(message.content) for message in request)
+        return estimate_tokens(text)
+
+    def _start_span(self, method: str, request: Sequence[ChatMessage] | str) -> Tuple[ContextManager[Span], int]:
+        """Returns the span of a request, and the estimated tokens of the request and its output."""
+        prompt_tokens = self._prompt_tokens(request)
+        telemetry.count("llm_tokens_total", prompt_tokens, direction="in")
+        span = telemetry.span("llm", method=method, tokens_in=prompt_tokens, attempts=0, retries=0, queue_wait_s=0.0)
+        return span, prompt_tokens + (self.metadata.num_output or 0)
+
+    @staticmethod
+    def _end_span(span: Span, llm: LLM, response: Any):
+        # streamed responses are generated after the call returns, so only the other outputs are counted
+        text = getattr(getattr(response, "message", None), "content", None) or getattr(response, "text", None)
+        span.set(model=llm.metadata.model_name)
+        if isinstance(text, str):
+            tokens = estimate_tokens(text)
+            span.set(tokens_out=tokens)
+            telemetry.count("llm_tokens_total", tokens, direction="out")
+
+    def _on_error(self, error: Exception, limiter: RateLimiter, attempt: int) -> float | None:
+        """Returns the backoff before the next attempt, or None to fail over. Raises other errors."""
+        if not is_throttling(error):
+            raise error
+        self._count("throttles")
+        limiter.on_throttle()
+        if attempt == self.max_retries:
+            limiter.on_exhausted()
+            return None
+        self._count("retries")
+        return get_backoff(attempt)
+
+    def _backends(self) -> List[Tuple[LLM, RateLimiter]]:
+        backends = list(zip(self._llms, self._limiters))
+        available = [backend for backend in backends[:-1] if not backend[1].cooling_down]
+        return available + backends[-1:]
+
+    def _call(self, method: str, request: Sequence[ChatMessage] | str, **kwargs: Any) -> Any:
+        self._count("requests")
+        request_span, tokens = self._start_span(method, request)
+        key = _session.get() or (DEFAULT_PRIORITY, time.monotonic())
+        error = None
+        with request_span as span:
+            for index, (llm, limiter) in enumerate(self._backends()):
+                if index:
+                    self._count("failovers")
+                    span.add("failovers")
+                for attempt in range(self.max_retries + 1):
+                    span.add("queue_wait_s", limiter.acquire(tokens, key))
+                    self._count("attempts")
+                    span.add("attempts")
+                    try:
+                        response = getattr(llm, method)(request, **kwargs)
+                    except Exception as e:
+                        error = e
+                        backoff = self._on_error(e, limiter, attempt)
+                        if backoff is None:
+                            break
+                        span.add("retries")
+                        time.sleep(backoff)
+                        continue
+                    limiter.on_success()
+                    self._end_span(span, llm, response)
+                    return response
+            self._count("failures")
+            raise error
+
+    async def _acall(self, method: str, request: Sequence[ChatMessage] | str, **kwargs: Any) -> Any:
+        self._count("requests")
+        request_span, tokens = self._start_span(method, request)
+        key = _session.get() or (DEFAULT_PRIORITY, time.monotonic())
+        error = None
+        with request_span as span:
+            for index, (llm, limiter) in enumerate(self._backends()):
+                if index:
+                    self._count("failovers")
+                    span.add("failovers")
+                for attempt in range(self.max_retries + 1):
+                    span.add("queue_wait_s", await asyncio.to_thread(limiter.acquire, tokens, key))
+                    self._count("attempts")
+                    span.add("attempts")
+                    try:
+                        response = await getattr(llm, method)(request, **kwargs)
+                    except Exception as e:
+                        error = e
+                        backoff = self._on_error(e, limiter, attempt)
+                        if backoff is None:
+                            break
+                        span.add("retries")
+                        await asyncio.sleep(backoff)
+                        continue
+                    limiter.on_success()
+                    self._end_span(span, llm, response)
+                    return response
+            self._count("failures")
+            raise error
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._call("chat", messages, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self._call("stream_chat", messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._call("complete", prompt, formatted=formatted, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self._call("stream_complete", prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._acall("achat", messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._acall("acomplete", prompt, formatted=formatted, **kwargs)
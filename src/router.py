@@ -0,0 +1,146 @@
+import re
+import time
+from typing import List, Sequence
+
+import polars as pl
+from pydantic import BaseModel
+
+from helpers.render import DEFAULT_TOKEN_BUDGET, render_table
+from helpers.telemetry import telemetry
+from tools import LEAGUES, _combine_players, get_best_teams, get_player_stats, get_players_region, get_random_players
+
+SHORTLIST_SIZE = 10
+# the prefetched tables replace tool outputs, and may be longer
+PREFETCH_TOKEN_BUDGET = 2 * DEFAULT_TOKEN_BUDGET
+
+# tasks in order of precedence, e.g. "replace a player of the team" is a replacement, not a new team
+TASK_PATTERNS = {
+    "replacement": re.compile(r"\breplace(ment)?\b|\bunavailable\b|\bswap\b|\bsubstitut", re.IGNORECASE),
+    "new_team": re.compile(r"\b(build|make|create|assemble|form|put together)\b[^.?!]*\bteam\b", re.IGNORECASE),
+    "stats": re.compile(r"\bstat(s|istics)\b|\bperformances?\b|\bmetrics\b|\bjustify\b", re.IGNORECASE),
+}
+LEAGUE_PATTERNS = {
+    "game-changers": re.compile(r"\bgame[\s-]*changers?\b", re.IGNORECASE),
+    "vct-international": re.compile(r"\binternational\b", re.IGNORECASE),
+    "vct-challengers": re.compile(r"\bchallengers?\b", re.IGNORECASE),
+}
+REGION_PATTERNS = {
+    "EMEA": re.compile(r"\bemea\b|\beurope(an)?\b|\bmiddle east\b", re.IGNORECASE),
+    "AMER": re.compile(r"\bamer\b|\bamericas?\b|\b(north|south|latin) american?\b|\blatam\b", re.IGNORECASE),
+    "PACIFIC": re.compile(r"\bpacific\b|\bapac\b|\basia(n)?\b", re.IGNORECASE),
+    "CN": re.compile(r"\bcn\b|\bchinese\b|\bchina\b", re.IGNORECASE),
+}
+PLAYER_ID_PATTERN = re.compile(r"\b\d{6,20}\b")
+
+# instructions of each task when its data is prefetched into the prompt
+TASK_INSTRUCTIONS = {
+    "new_team": """
+        The best teams of the shortlisted players are ranked below, do not call tools to get them again.
+        Choose one of the top teams of exactly 5 players and justify the choice with its stats.
+        Retrieve the selected players' stats data only if needed to assign the roles.
+        Use Valorant game terminology and definitions when assigning roles.
+        """,
+    "replacement": """
+        The stats of the unavailable players and of candidates from the same region are listed below,
+        do not call tools to get them again.
+        Choose the candidate who best fills the role of each unavailable player and explain why.
+        Use Valorant game terminology and definitions when describing roles.
+        """,
+    "stats": """
+        The stats of the players are listed below, do not call tools to get them again.
+        Answer with the relevant statistics, and retrieve the stats of each game only if the question needs them.
+        """,
+}
+# instructions of the tasks whose data cannot be prefetched, e.g. when the prompt does not give the player ids
+TOOL_INSTRUCTIONS = {
+    "replacement": """
+        Use provided tools to find the region of the unavailable player, shortlist up to 10 players of the same
+        region and retrieve their stats data, then choose the player who best fills the role and explain why.
+        Use Valorant game terminology and definitions when describing roles.
+        """,
+    "stats": """
+        Use provided tools to retrieve the stats data of the players, and answer with the relevant statistics.
+        """,
+}
+
+
+class Route(BaseModel):
+    task: str | None  # one of TASK_PATTERNS, or None if the task is unknown
+    leagues: List[str]  # the leagues mentioned in the prompt, all leagues if none
+    region: str | None  # the region mentioned in the prompt, if exactly one
+    player_ids: List[int]  # the player ids mentioned in the prompt
+
+    @property
+    def league(self) -> str | None:
+        """The league of the tool calls, null to query every league."""
+        return self.leagues[0] if len(self.leagues) == 1 else None
+
+
+def parse_prompt(prompt: str) -> Route:
+    """Finds the task, leagues, region and player ids of a prompt with rules, without calling the LLM."""
+    task = next((task for task, pattern in TASK_PATTERNS.items() if pattern.search(prompt)), None)
+    leagues = [league for league, pattern in LEAGUE_PATTERNS.items() if pattern.search(prompt)]
+    regions = [region for region, pattern in REGION_PATTERNS.items() if pattern.search(prompt)]
+    return Route(
+        task=task,
+        leagues=leagues or LEAGUES,
+        region=regions[0] if len(regions) == 1 else None,
+        player_ids=list(dict.fromkeys(int(player_id) for player_id in PLAYER_ID_PATTERN.findall(prompt))),
+    )
+
+
+def _shortlist(leagues: List[str], region: str | None, exclude: Sequence[int] = ()) -> List[int]:
+    shortlists = [get_random_players(league, SHORTLIST_SIZE, region) for league in leagues]
+    return [player_id for player_id in _combine_players(shortlists) if player_id not in exclude]
+
+
+def _render(df: pl.DataFrame) -> str:
+    return render_table(df, PREFETCH_TOKEN_BUDGET)
+
+
+def prefetch(route: Route) -> List[str] | None:
+    """Runs the tool queries of the task, returning the sections of prefetched data, or None if the task has none."""
+    if route.task == "new_team":
+        shortlist = _shortlist(route.leagues, route.region)
+        teams = get_best_teams(shortlist, route.league)
+        return [f"Best teams of {len(shortlist)} shortlisted players:\n{_render(teams)}"]
+    if route.task == "replacement" and route.player_ids:
+        unavailable = get_player_stats(route.player_ids, route.league)
+        # candidates from the leagues and region of the unavailable players, unless the prompt gives them
+        leagues = [route.league] if route.league else unavailable["league_alias"].unique(maintain_order=True).to_list()
+        regions = get_players_region(route.player_ids)["league_region"].drop_nulls()
+        region = route.region or next(iter(regions), None)
+        candidates = _shortlist(leagues or route.leagues, region, exclude=route.player_ids)
+        candidates_stats = get_player_stats(candidates, leagues[0] if len(leagues) == 1 else None)
+        return [
+            f"Stats of the unavailable players, region {region or 'unknown'}:\n{_render(unavailable)}",
+            f"Stats of the candidates:\n{_render(candidates_stats)}",
+        ]
+    if route.task == "stats" and route.player_ids:
+        return [f"Stats:\n{_render(get_player_stats(route.player_ids, route.league))}"]
+    return None
+
+
+def route_prompt(prompt: str) -> str | None:
+    """Rewrites the prompt with the instructions of its task and the prefetched data, so the LLM needs fewer steps.
+
+    Returns:
+        str | None: The routed prompt, or None if the task is unknown or the prefetch failed.
+    """
+    with telemetry.span("route_prompt") as span:
+        start = time.perf_counter()
+        route = parse_prompt(prompt)
+        span.set(task=route.task, player_ids=len(route.player_ids))
+        try:
+            sections = prefetch(route)
+        except Exception as e:
+            print(f"prefetch failed for {route}: {e}")
+            span.set(prefetch_error=type(e).__name__)
+            return None
+        span.set(prefetched=sections is not None)
+        if sections is None:
+            if route.task not in TOOL_INSTRUCTIONS:
+                return None
+            return f"{prompt}{TOOL_INSTRUCTIONS[route.task]}"
+        print(f"routed prompt to {route.task} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return "\n\n".join([prompt.strip(), TASK_INSTRUCTIONS[route.task].strip(), *sections])
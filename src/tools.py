@@ -1,46 +1,121 @@
-import random
-from functools import cache
-from typing import List
+import asyncio
+import inspect
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
 
 import polars as pl
+from deltalake import DeltaTable
 from llama_index.core.tools import FunctionTool
 
-from helpers.storage import get_storage_options
+from helpers.aggregates import aggregate_player_stats
+from helpers.cache import QueryCache
+from helpers.directory import PlayerDirectory
+from helpers.mirror import TableMirror
+from helpers.render import DEFAULT_TOKEN_BUDGET, compact_output
+from helpers.schema import read_stats
+from helpers.scoring import PLAYER_FEATURES, TEAM_SIZE, score_teams
+from helpers.snapshot import snapshot_or_load
+from helpers.storage import get_table_location
+from helpers.telemetry import telemetry
 
 RAW_DIR = "data/raw"
 DELTA_DIR = "data/delta"
 STATS_DIR = f"{DELTA_DIR}/game_stats"
 REGIONS_DIR = f"{DELTA_DIR}/player_region"
+AGGREGATES_DIR = f"{DELTA_DIR}/player_stats"
 
 LEAGUES = ["vct-challengers", "game-changers", "vct-international"]
 YEARS = [2024]
 
+# shared cache of the tool queries, invalidated when new commits land in the tables
+tool_cache = QueryCache()
+# local directory of the snapshots of the player aggregates and regions, see `warm_up_tools`
+snapshot_dir: str | None = None
+# local mirror of the tables the tools read, see `warm_up_tools`
+table_mirror: TableMirror | None = None
 
-@cache
+telemetry.metrics.gauge("query_cache_entries", lambda: tool_cache.stats()["entries"])
+telemetry.metrics.gauge("query_cache_bytes", lambda: tool_cache.stats()["bytes"])
+
+
+def locate_table(table_dir: str) -> Tuple[str, Dict[str, str]]:
+    """Resolves a table directory to its up-to-date local mirror if enabled, else to its location in the bucket."""
+    if table_mirror is not None:
+        return table_mirror.sync(table_dir), {}
+    return get_table_location(table_dir)
+
+
+def _scan_delta(table_dir: str, table_path: str, storage_options: Dict[str, str]) -> pl.LazyFrame:
+    """Scans the current version of a Delta table, recording its files and bytes in a `delta_scan` span."""
+    with telemetry.span("delta_scan", table=table_dir) as span:
+        table = DeltaTable(table_path, storage_options=storage_options)
+        sizes = table.get_add_actions(flatten=True).column("size_bytes").to_pylist()
+        span.set(version=table.version(), files=len(sizes), bytes=sum(sizes))
+        telemetry.count("delta_scan_files_total", len(sizes), table=table_dir)
+        telemetry.count("delta_scan_bytes_total", sum(sizes), table=table_dir)
+        return pl.scan_delta(table)
+
+
+def _collect(query_name: str, query: pl.LazyFrame) -> pl.DataFrame:
+    """Collects a query in a `collect` span, recording the rows and bytes of the result."""
+    with telemetry.span("collect", query=query_name) as span:
+        df = query.collect()
+        span.set(rows=len(df), bytes=df.estimated_size())
+        return df
+
+
+@tool_cache.cached([STATS_DIR], ttl=math.inf)
 def scan_game_data() -> pl.LazyFrame:
-    storage_options = get_storage_options()
-    source = "local"
-    if storage_options:
-        source = storage_options.pop("bucket")
-    table_path = f"{source}/{STATS_DIR}" if source != "local" else STATS_DIR
+    table_path, storage_options = locate_table(STATS_DIR)
     print(f"reading game data from {table_path} table...")
-    return pl.scan_delta(table_path, storage_options=storage_options)
+    # the tables of both schema versions are read with the v2 types and the precomputed team role
+    return read_stats(_scan_delta(STATS_DIR, table_path, storage_options))
 
 
-@cache
-def read_players_regions() -> pl.DataFrame:
-    storage_options = get_storage_options()
-    source = storage_options.pop("bucket")
-    table_path = f"{source}/{REGIONS_DIR}"
+def _load_player_aggregates() -> pl.LazyFrame:
+    table_path, storage_options = locate_table(AGGREGATES_DIR)
+    if not DeltaTable.is_deltatable(table_path, storage_options=storage_options):
+        print(f"{table_path} table not found, aggregating game data...")
+        return aggregate_player_stats(scan_game_data())
+    print(f"reading player aggregates from {table_path} table...")
+    return _scan_delta(AGGREGATES_DIR, table_path, storage_options)
+
+
+@tool_cache.cached([STATS_DIR, AGGREGATES_DIR], ttl=math.inf)
+def scan_player_aggregates() -> pl.LazyFrame:
+    versions = tool_cache.probe.versions([STATS_DIR, AGGREGATES_DIR])
+    return snapshot_or_load(snapshot_dir, "player_stats", versions, _load_player_aggregates)
+
+
+def _load_players_regions() -> pl.LazyFrame:
+    table_path, storage_options = locate_table(REGIONS_DIR)
     print(f"reading player region data from {table_path} table...")
     return (
-        pl.read_delta(table_path, storage_options=storage_options)
+        _scan_delta(REGIONS_DIR, table_path, storage_options)
         .select("league_region", pl.col("player_id").cast(pl.UInt64))
         .unique()
     )
 
 
-@cache
+@tool_cache.cached([REGIONS_DIR], ttl=math.inf)
+def read_players_regions() -> pl.DataFrame:
+    versions = tool_cache.probe.versions([REGIONS_DIR])
+    return _collect("players_regions", snapshot_or_load(snapshot_dir, "player_region", versions, _load_players_regions))
+
+
+@tool_cache.cached([STATS_DIR, AGGREGATES_DIR, REGIONS_DIR], ttl=math.inf)
+def get_player_directory() -> PlayerDirectory:
+    """Returns the player directory, rebuilt when the source tables get new commits."""
+    version = tool_cache.probe.versions([STATS_DIR, AGGREGATES_DIR, REGIONS_DIR])
+    print(f"building player directory for table versions {version}...")
+    league_players = _collect("league_players", scan_player_aggregates().select("league_alias", "player_id").unique())
+    return PlayerDirectory(league_players, read_players_regions(), version)
+
+
 def get_players_in_league(league: str) -> pl.DataFrame:
     f"""Retrieves players in a given league.
 
@@ -53,9 +128,7 @@ def get_players_in_league(league: str) -> pl.DataFrame:
     Returns:
         pl.DataFrame: A DataFrame containing the players in the specified league.
     """
-    players = scan_game_data()
-    query = players.filter(pl.col("league_alias") == league).select("player_id").unique()
-    return query.collect()
+    return pl.DataFrame({"player_id": get_player_directory().players(league)})
 
 
 def get_players_region(player_ids: List[int]) -> pl.DataFrame:
@@ -68,53 +141,98 @@ def get_players_region(player_ids: List[int]) -> pl.DataFrame:
         pl.DataFrame: A DataFrame containing the players' regions.
 
     """
-    players_list = pl.DataFrame(player_ids, schema={"player_id": pl.UInt64})
-    return players_list.join(read_players_regions(), on="player_id", how="left")
+    return get_player_directory().get_regions(player_ids)
+
+
+def _combine_players(shortlists: List[List[int]]) -> List[int]:
+    return list(dict.fromkeys(player_id for shortlist in shortlists for player_id in shortlist))
 
 
-def get_random_players(league: str, num_players: int) -> List[int]:
-    """Reads all the players for the league and selects the requested number of random players.
+def _combine_stats(league_stats: List[pl.DataFrame]) -> pl.DataFrame:
+    return pl.concat(
+        [stats.select(pl.lit(league).alias("league_alias"), pl.all()) for league, stats in zip(LEAGUES, league_stats)]
+    )
+
+
+def get_random_players(
+    league: str | None, num_players: int, region: str | None = None, seed: int | None = None
+) -> List[int]:
+    """Selects the requested number of random players in the league, optionally only from the given region.
 
     Args:
-        league (str): The name of the league. Must be one of "game-changers", "vct-international" or "vct-challengers".
-        num_players (int): The number of random players to select from the full list.
+        league (str | None): The name of the league. Must be one of "game-changers", "vct-international" or
+            "vct-challengers", or null to select from the players of every league.
+        num_players (int): The number of random players to select.
+        region (str | None): The region of the players, e.g. "EMEA", "AMER", "PACIFIC" or "CN". Optional.
+        seed (int | None): A seed to get the same selection again. Optional.
 
     Returns:
         List[int]: The list of players ids.
     """
-    if league not in LEAGUES:
+    if league is not None and league not in LEAGUES:
         raise ValueError(f"Invalid league: {league}. Choices are: {', '.join(LEAGUES)}")
     try:
-        all_players = get_players_in_league(league)
-        if len(all_players) < num_players:
-            raise RuntimeWarning(
-                "Not enough data. Do not retry with the same input. Modify the parameters and try again."
-            )
-
-        # select the num_players
-        all_players_ids = list(all_players["player_id"])
-        if len(all_players_ids) == num_players:
-            return list(all_players_ids)
-
-        selected_players = set()
-        while len(selected_players) < num_players:
-            idx = random.randint(0, len(all_players_ids))
-            selected_players.add(all_players_ids[idx])
-        return list(selected_players)
-
+        directory = get_player_directory()
     except Exception as e:
-        print(e.with_traceback)
+        print(e)
         raise RuntimeWarning("The dataset is broken. Do not retry and instruct the user the fix the dataset.")
+    if region is not None and region not in directory.regions:
+        raise ValueError(f"Invalid region: {region}. Choices are: {', '.join(directory.regions)}")
+    if len(directory.players(league, region)) < num_players:
+        raise RuntimeWarning("Not enough data. Do not retry with the same input. Modify the parameters and try again.")
+    return directory.sample(league, num_players, region, seed).tolist()
+
+
+def _player_stats_key(player_ids: List[int], league: str):
+    return frozenset(player_ids), league
+
+
+def _all_leagues(fn: Callable) -> Callable:
+    """Lets the per-league query `fn` take a null league, to query every league and combine the results."""
 
+    @wraps(fn)
+    def wrapper(player_ids: List[int], league: str | None = None) -> pl.DataFrame:
+        if league is None:
+            return _combine_stats([fn(player_ids, league) for league in LEAGUES])
+        return fn(player_ids, league)
 
-def get_player_stats(player_ids: List[int], league: str) -> pl.DataFrame:
-    """Retrieves player statistics for a list of players.
+    return wrapper
+
+
+@_all_leagues
+@tool_cache.cached([STATS_DIR, AGGREGATES_DIR], key=_player_stats_key)
+def get_player_stats(player_ids: List[int], league: str | None = None) -> pl.DataFrame:
+    """Retrieves player statistics for a list of players, summarized per year.
 
     Args:
         player_id (List[int]): The list of the players IDs for which the stats needs to be retrieved.
+        league (str | None): The name of the league, or null to get the stats in every league.
 
     Returns:
-        pl.DataFrame: A DataFrame containing the players' statistics.
+        pl.DataFrame: A DataFrame containing the number of games played and the players' damage dealt,
+        damage taken and kills per game, overall and when playing in the attacking or defending team.
+    """
+    player_stats = scan_player_aggregates()
+    query = player_stats.filter((pl.col("league_alias") == league) & pl.col("player_id").is_in(player_ids)).select(
+        "year",
+        "player_id",
+        "games_played",
+        pl.col("^.*_per_game$").round(1),
+    )
+    return _collect("player_stats", query)
+
+
+@_all_leagues
+@tool_cache.cached([STATS_DIR], key=_player_stats_key)
+def get_player_game_stats(player_ids: List[int], league: str | None = None) -> pl.DataFrame:
+    """Retrieves detailed player statistics for a list of players, one row per game and team role.
+
+    Args:
+        player_id (List[int]): The list of the players IDs for which the stats needs to be retrieved.
+        league (str | None): The name of the league, or null to get the stats in every league.
+
+    Returns:
+        pl.DataFrame: A DataFrame containing the players' statistics for each game.
     """
     player_stats = scan_game_data()
     query = player_stats.filter((pl.col("league_alias") == league) & pl.col("player_id").is_in(player_ids)).select(
@@ -124,28 +242,168 @@ def get_player_stats(player_ids: List[int], league: str) -> pl.DataFrame:
         "damage_dealt",
         "damage_taken",
         "players_killed",
-        pl.when(pl.col("team_mode") == "A")
-        .then(pl.lit("attacking team"))
-        .otherwise(pl.lit("defending team"))
-        .alias("team_role"),
+        "team_role",
+    )
+    return _collect("player_game_stats", query)
+
+
+def _player_features(player_ids: List[int], league: str | None) -> pl.DataFrame:
+    # per-game aggregates of each player over the years (and leagues), weighted by the games played
+    aggregates = scan_player_aggregates().filter(pl.col("player_id").is_in(player_ids))
+    if league is not None:
+        aggregates = aggregates.filter(pl.col("league_alias") == league)
+    games = pl.col("games_played")
+    return _collect(
+        "player_features",
+        aggregates.group_by(pl.col("player_id").cast(pl.UInt64)).agg(
+            ((pl.col(feature) * games).sum() / games.sum()).alias(feature) for feature in PLAYER_FEATURES
+        ),
     )
-    return query.collect()
 
 
-def initialize_tools() -> List[FunctionTool]:
-    tools = [
-        FunctionTool.from_defaults(fn=get_players_region),
-        FunctionTool.from_defaults(fn=get_player_stats),
-        FunctionTool.from_defaults(fn=get_random_players),
+def get_best_teams(player_ids: List[int], league: str | None = None, top_k: int = 5) -> pl.DataFrame:
+    """Ranks the teams of 5 players of the shortlist by their combined stats, best first.
+
+    Args:
+        player_ids (List[int]): The shortlisted players IDs.
+        league (str | None): The league of the stats, or null for every league.
+        top_k (int): The number of teams to return.
+
+    Returns:
+        pl.DataFrame: The score, players, combined per-game stats, attack/defend balance and regions of each team.
+    """
+    if league is not None and league not in LEAGUES:
+        raise ValueError(f"Invalid league: {league}. Choices are: {', '.join(LEAGUES)}")
+    player_ids = list(dict.fromkeys(player_ids))
+    regions = get_player_directory().get_regions(player_ids).unique("player_id", keep="first", maintain_order=True)
+    players = regions.join(_player_features(player_ids, league), on="player_id", how="inner", maintain_order="left")
+    if len(players) < TEAM_SIZE:
+        raise RuntimeWarning(f"Only {len(players)} of the players have stats. Shortlist more players and try again.")
+    return score_teams(players, top_k)
+
+
+async def aget_best_teams(player_ids: List[int], league: str | None = None, top_k: int = 5) -> pl.DataFrame:
+    """Async `get_best_teams`, whose query and scoring run in the default executor."""
+    return await asyncio.to_thread(get_best_teams, player_ids, league, top_k)
+
+
+async def aget_random_players(
+    league: str | None, num_players: int, region: str | None = None, seed: int | None = None
+) -> List[int]:
+    """Async `get_random_players`, run in the default executor."""
+    return await asyncio.to_thread(get_random_players, league, num_players, region, seed)
+
+
+def _async_all_leagues(fn: Callable) -> Callable:
+    """Async variant of the per-league query `fn`, whose blocking collects run in the default executor.
+
+    With a null league, the queries of the leagues run at the same time.
+    """
+
+    @wraps(fn)
+    async def wrapper(player_ids: List[int], league: str | None = None) -> pl.DataFrame:
+        if league is not None:
+            return await asyncio.to_thread(fn, player_ids, league)
+        return _combine_stats(await asyncio.gather(*(asyncio.to_thread(fn, player_ids, league) for league in LEAGUES)))
+
+    return wrapper
+
+
+aget_player_stats = _async_all_leagues(get_player_stats.__wrapped__)
+aget_player_game_stats = _async_all_leagues(get_player_game_stats.__wrapped__)
+
+
+def traced_tool(fn: Callable) -> Callable:
+    """Wraps a tool, sync or async, to record each call in a `tool` span.
+
+    The span records the size of the JSON arguments, the rows returned and the cache hits and misses of the call.
+    """
+
+    def start(args, kwargs):
+        args_bytes = len(json.dumps([args, kwargs], default=str))
+        return telemetry.span("tool", tool=fn.__name__, args_bytes=args_bytes)
+
+    def record(span, result):
+        if isinstance(result, (pl.DataFrame, list)):
+            span.set(rows=len(result))
+        return result
+
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with start(args, kwargs) as span:
+                return record(span, await fn(*args, **kwargs))
+
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with start(args, kwargs) as span:
+            return record(span, fn(*args, **kwargs))
+
+    return wrapper
+
+
+def initialize_tools(compact: bool = True, token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[FunctionTool]:
+    """Creates the agent tools.
+
+    Tools called by an async agent run in the default executor, and query the leagues at the same time
+    when no league is given. Each call is recorded in a `tool` span, see `traced_tool`.
+
+    Args:
+        compact (bool): Render the tables returned by the tools as compact text within the token budget,
+            instead of the default DataFrame string representation.
+        token_budget (int): The maximum number of tokens of each tool output in compact mode.
+    """
+    functions = [
+        (get_players_region, None),
+        (get_player_stats, aget_player_stats),
+        (get_player_game_stats, aget_player_game_stats),
+        (get_random_players, aget_random_players),
+        (get_best_teams, aget_best_teams),
     ]
+    functions = [(traced_tool(fn), afn and traced_tool(afn)) for fn, afn in functions]
+    if compact:
+        functions = [
+            (compact_output(fn, token_budget), afn and compact_output(afn, token_budget)) for fn, afn in functions
+        ]
+    tools = [FunctionTool.from_defaults(fn=fn, async_fn=afn) for fn, afn in functions]
 
     return tools
 
 
-def warm_up_tools():
+def _timed(fn: Callable) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def warm_up_tools(snapshots: str | None = None, mirror: TableMirror | None = None) -> Dict[str, float]:
+    """Loads the tables and builds the player directory, loading the tables at the same time.
+
+    Args:
+        snapshots (str | None): A local directory to snapshot the player aggregates and regions in, so that
+            restarts read them from the snapshots instead of the tables while the table versions are unchanged.
+        mirror (TableMirror | None): A local mirror to read the tables from, synced when they get new commits.
+
+    Returns:
+        Dict[str, float]: The seconds spent in each step.
+    """
+    global snapshot_dir, table_mirror
+    snapshot_dir = snapshots
+    table_mirror = mirror
     print("warming up tools:", flush=True)
-    _ = read_players_regions()
-    _ = scan_game_data()
-    for league in LEAGUES:
-        _ = get_players_in_league(league)
+    timings = {"table versions": _timed(lambda: tool_cache.probe.versions([STATS_DIR, AGGREGATES_DIR, REGIONS_DIR]))}
+    loads = {
+        "game data": scan_game_data,
+        "player aggregates": scan_player_aggregates,
+        "player regions": read_players_regions,
+    }
+    with ThreadPoolExecutor(max_workers=len(loads)) as executor:
+        futures = {name: executor.submit(_timed, load) for name, load in loads.items()}
+        timings.update((name, future.result()) for name, future in futures.items())
+    timings["player directory"] = _timed(get_player_directory)
+    tool_cache.probe.start()
     print("------done------")
+    return timings